@@ -0,0 +1,104 @@
+
+import time
+import asyncio
+import numpy as np
+from typing import AsyncIterator
+
+import solve_worker
+
+
+# Longest a sync solver runs in the executor before its actions so far are
+# handed to the event loop, in seconds
+TIME_SLICE = 0.005
+
+
+
+class AsyncInterfaceSolver():
+
+    """
+    Informal interface for solvers that stream their actions to an asyncio
+    event loop instead of being called for each action.
+
+    Any InterfaceSolver can be used through ExecutorSolver below.
+
+    """
+
+    def get_name(self) -> str:
+        """Name of the solver, same as InterfaceSolver.get_name."""
+
+    async def stream_actions(self, cube_state:np.array) -> AsyncIterator[str]:
+        """
+        Async iterator over the actions that solve cube_state (6xNxN array as
+        for InterfaceSolver.get_action), yielding each action as soon as it
+        is found. Must not change cube_state. Ends when the cube is solved or
+        the solver terminates.
+
+        Must not block the event loop, so any long computation has to run in
+        an executor or be split up with awaits.
+        """
+        yield
+
+
+class ExecutorSolver(AsyncInterfaceSolver):
+
+    """
+    Adapts a sync InterfaceSolver, running it in an executor in time slices.
+
+    Each slice runs the solver for up to time_slice seconds in the executor,
+    then yields the actions found to the event loop. Many solves can share
+    one executor (the event loop default executor if None), so there is no
+    thread per solve, and slicing keeps the executor overhead per action low
+    while actions still arrive within a few ms.
+
+    A solver instance keeps its search in its attributes, so only one solve
+    can stream from one ExecutorSolver at a time.
+
+    """
+
+    def __init__(self, solver, executor=None, time_slice=TIME_SLICE):
+        self.solver = solver
+        self.executor = executor
+        self.time_slice = time_slice
+
+    def get_name(self):
+        return self.solver.get_name()
+
+    async def stream_actions(self, cube_state):
+        loop = asyncio.get_event_loop()
+        actions = solve_worker.run_solver(self.solver, cube_state)
+        try:
+            while True:
+                chunk = await loop.run_in_executor(self.executor, self._run_slice, actions)
+                finished = len(chunk) > 0 and chunk[-1] is None
+                for action in chunk[:-1] if finished else chunk:
+                    yield action
+                if finished:
+                    return
+        finally:
+            try:
+                actions.close()
+            except ValueError:
+                # Cancelled while a slice runs, the generator is dropped once
+                # the slice is done
+                pass
+
+    def _run_slice(self, actions):
+        """
+        Next actions of the run_solver generator for one time slice, ending
+        with None if the solve is finished.
+        """
+        chunk = []
+        deadline = time.perf_counter() + self.time_slice
+        for action in actions:
+            chunk.append(action)
+            if time.perf_counter() > deadline:
+                return chunk
+        chunk.append(None)
+        return chunk
+
+
+def as_async_solver(solver, executor=None):
+    """solver itself if it streams actions, otherwise an ExecutorSolver of it."""
+    if isinstance(solver, AsyncInterfaceSolver):
+        return solver
+    return ExecutorSolver(solver, executor)
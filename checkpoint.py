@@ -0,0 +1,268 @@
+
+"""
+Checkpoints of solver searches, so a search killed by a deploy or
+preemption resumes where it was instead of starting over.
+
+A checkpoint is one uncompressed .npz file with the solver name, depth and
+moves, the start and current cube state, the actions taken so far, and the
+search state of the solver as arrays from its get_checkpoint(): the plan
+position of DFS and BFS, the nodes and open list of BestFS, the open list,
+g values and weight of ARA*, and the bits of a visited filter. Solvers
+that do not override get_checkpoint can not be checkpointed, see
+supported. A checkpoint is written to
+a temporary file and renamed, so a kill while writing leaves the previous
+one.
+
+    python checkpoint.py
+
+measures the cost of checkpointing every solver that supports it, and
+checks that searches killed and resumed from a checkpoint take the same
+actions as uninterrupted ones.
+"""
+import os
+import json
+import time
+import numpy as np
+
+import solvers
+import state_engine
+
+
+VERSION = 1
+# Seconds between checkpoints
+INTERVAL = 10.
+
+
+
+def supported(solver):
+    """If solver (a solver, its class or an entry of solvers.SOLVERS) has checkpoints."""
+    solver_class = getattr(solver, 'func', solver)
+    if not isinstance(solver_class, type):
+        solver_class = type(solver_class)
+    return getattr(solver_class, 'get_checkpoint', None) not in (None, solvers.InterfaceSolver.get_checkpoint)
+
+
+def check_supported(solver):
+    if not supported(solver):
+        raise ValueError('%s does not support checkpoints' % solver.get_name())
+
+
+def save(path, solver, start_state, cube_state, actions):
+    """Writes a checkpoint of solver to path, returns its size in bytes."""
+    arrays = {'solver_' + name: np.asarray(value) for name, value in solver.get_checkpoint().items()}
+    meta = dict(version=VERSION, solver=solver.get_name(), depth=solver.depth,
+                moves=''.join(solver.possible_moves))
+    partial = '%s.%d.tmp' % (path, os.getpid())
+    with open(partial, 'wb') as f:
+        np.savez(f, meta=np.array(json.dumps(meta)), start_state=start_state, cube_state=cube_state,
+                 actions=state_engine.encode_moves(actions), **arrays)
+    os.replace(partial, path)
+    return os.path.getsize(path)
+
+
+def load(path):
+    """
+    Meta dict (version, solver, depth, moves), start state, cube state,
+    actions and solver arrays of a checkpoint.
+    """
+    with np.load(path) as data:
+        meta = json.loads(str(data['meta']))
+        if meta['version'] != VERSION:
+            raise ValueError('%s has checkpoint version %d, can read %d' % (path, meta['version'], VERSION))
+        arrays = {name[len('solver_'):]: data[name] for name in data.files if name.startswith('solver_')}
+        return (meta, data['start_state'], data['cube_state'],
+                state_engine.decode_moves(data['actions']), arrays)
+
+
+def matches(meta, solver, start_state, saved_start):
+    """If a checkpoint is of this solver, depth, moves and start state."""
+    return (meta['solver'] == solver.get_name() and meta['depth'] == solver.depth and
+            meta['moves'] == ''.join(solver.possible_moves) and np.array_equal(saved_start, start_state))
+
+
+def resume(path, **solver_options):
+    """
+    Solver of solvers.SOLVERS loaded from a checkpoint, with its start
+    state, cube state and actions, to continue with run_solver.
+    """
+    meta, start_state, cube_state, actions, arrays = load(path)
+    solver = solvers.SOLVERS[meta['solver']](meta['depth'], list(meta['moves']), **solver_options)
+    solver.clear()
+    solver.load_checkpoint(arrays)
+    return solver, start_state, cube_state, actions
+
+
+
+class Checkpointer():
+
+    """
+    Saves checkpoints of a solve to path every interval seconds, and keeps
+    count of their cost: saves, seconds spent saving and the largest size.
+    """
+
+    def __init__(self, path, interval=INTERVAL):
+        self.path = path
+        self.interval = interval
+        self.last = time.monotonic()
+        self.saves = 0
+        self.seconds = 0.
+        self.nbytes = 0
+
+    def maybe_save(self, solver, start_state, cube_state, actions):
+        if time.monotonic() - self.last >= self.interval:
+            self.save(solver, start_state, cube_state, actions)
+
+    def save(self, solver, start_state, cube_state, actions):
+        start = time.perf_counter()
+        self.nbytes = max(self.nbytes, save(self.path, solver, start_state, cube_state, actions))
+        self.seconds += time.perf_counter() - start
+        self.saves += 1
+        self.last = time.monotonic()
+
+    def remove(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+def run_solver(solver, start_state, checkpointer, cube_state=None, actions=()):
+    """
+    solve_worker.run_solver with checkpoints, yields every new action. To
+    resume, pass the cube state and actions of the checkpoint the solver
+    loaded, the solve then continues instead of starting over.
+
+    Checkpoints are saved before get_action, and from within it through
+    solver.checkpoint_hook for solvers that search inside one call. Raises
+    ValueError before searching if the solver has no checkpoints.
+    """
+    check_supported(solver)
+    resumed = cube_state is not None
+    cube_state = (cube_state if resumed else start_state).copy()
+    actions = list(actions)
+    if not resumed:
+        solver.clear()
+
+    def maybe_save():
+        checkpointer.maybe_save(solver, start_state, cube_state, actions)
+
+    if hasattr(solver, 'checkpoint_hook'):
+        solver.checkpoint_hook = maybe_save
+    try:
+        solver_finished = False
+        while not state_engine.is_solved(cube_state) and not solver_finished:
+            maybe_save()
+            action, solver_finished = solver.get_action(cube_state)
+            if action is None:
+                continue
+            state_engine.apply_move(cube_state, action)
+            actions.append(action)
+            yield action
+    finally:
+        if hasattr(solver, 'checkpoint_hook'):
+            solver.checkpoint_hook = None
+
+
+def solve(solver, cube_state, path, interval=INTERVAL):
+    """
+    Solves cube_state with checkpoints at path, resuming from the checkpoint
+    there if it is of the same solve. Returns all actions, if the cube ended
+    up solved and if it was resumed. The checkpoint is removed when done.
+    Raises ValueError if the solver has no checkpoints.
+    """
+    check_supported(solver)
+    checkpointer = Checkpointer(path, interval)
+    current, actions = None, []
+    if os.path.exists(path):
+        meta, saved_start, saved_state, saved_actions, arrays = load(path)
+        if matches(meta, solver, cube_state, saved_start):
+            solver.clear()
+            solver.load_checkpoint(arrays)
+            current, actions = saved_state, saved_actions
+    resumed = current is not None
+    actions = actions + list(run_solver(solver, cube_state, checkpointer, current, actions))
+    checkpointer.remove()
+    final = cube_state.copy()
+    for action in actions:
+        state_engine.apply_move(final, action)
+    return actions, state_engine.is_solved(final), resumed
+
+
+if __name__ == '__main__':
+    import random
+    import argparse
+    import tempfile
+
+    import visited_filter
+    from state_engine import POSSIBLE_MOVES, random_scramble, scrambled_state
+
+    class Killed(Exception):
+        pass
+
+
+    class KillingCheckpointer(Checkpointer):
+
+        """Checkpointer that raises Killed after kill_after saves, to test resuming."""
+
+        def __init__(self, path, interval, kill_after):
+            super().__init__(path, interval)
+            self.kill_after = kill_after
+
+        def save(self, *args):
+            super().save(*args)
+            if self.saves >= self.kill_after:
+                raise Killed()
+
+    parser = argparse.ArgumentParser(description='Cost of checkpoints, and resume checks')
+    parser.add_argument('--interval', '-i', type=float, default=1.,
+                        help='most seconds between checkpoints, shorter solves save every eighth of their time')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    # Solver, depth and scramble depth, deep enough to run for a while
+    cases = [('DFS', 6, 6, {}), ('DFS', 6, 6, dict(visited_filter=visited_filter.BloomFilter(1e6))),
+             ('BFS', 5, 5, {}), ('BestFS', 7, 7, {}),
+             ('BatchBestFS', 8, 8, dict(visited_filter=visited_filter.BloomFilter(1e6))),
+             ('ARA*', 9, 9, dict(time_budget=None, weight=2.))]
+    path = os.path.join(tempfile.mkdtemp(), 'checkpoint.npz')
+    print("%-24s %8s %10s %10s %8s %10s %10s %8s" % ('solver', 'actions', 'plain s', 'ckpt s', 'saves',
+                                                  'ms/save', 'kB', 'resumed'))
+    for name, depth, scramble_depth, options in cases:
+        cube_state = scrambled_state(random_scramble(rng, scramble_depth), 3)
+        label = name + (' +filter' if 'visited_filter' in options else '')
+
+        def make_solver():
+            fresh = dict(options)
+            if 'visited_filter' in fresh:
+                fresh['visited_filter'] = visited_filter.BloomFilter(1e6)
+            return solvers.SOLVERS[name](depth, POSSIBLE_MOVES.copy(), **fresh)
+
+        # 1. Without and with checkpoints, at least a few saves per solve
+        start = time.perf_counter()
+        plain = list(run_solver(make_solver(), cube_state, Checkpointer(path, np.inf)))
+        plain_seconds = time.perf_counter() - start
+        checkpointer = Checkpointer(path, min(args.interval, plain_seconds / 8))
+        start = time.perf_counter()
+        checked = list(run_solver(make_solver(), cube_state, checkpointer))
+        checked_seconds = time.perf_counter() - start
+        assert checked == plain
+        os.remove(path)
+
+        # 2. Killed after a few checkpoints, then resumed from the last
+        killer = KillingCheckpointer(path, checked_seconds / 8, kill_after=3)
+        killed = False
+        try:
+            list(run_solver(make_solver(), cube_state, killer))
+        except Killed:
+            killed = True
+        assert killed, '%s finished before it was killed' % label
+        solver = make_solver()
+        meta, start_state, current, actions, arrays = load(path)
+        assert matches(meta, solver, cube_state, start_state)
+        solver.clear()
+        solver.load_checkpoint(arrays)
+        resumed = actions + list(run_solver(solver, start_state, Checkpointer(path, np.inf), current, actions))
+        print("%-24s %8d %10.2f %10.2f %8d %10.2f %10.1f %8s" % (
+              label, len(plain), plain_seconds, checked_seconds, checkpointer.saves,
+              1000 * checkpointer.seconds / max(checkpointer.saves, 1), checkpointer.nbytes / 1e3,
+              'same' if resumed == plain else 'DIFFERS'))
+    os.remove(path)
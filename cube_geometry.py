@@ -0,0 +1,138 @@
+
+import numpy as np
+
+from MagicCube.cube_interactive import Cube
+
+
+
+class LayeredCube(Cube):
+
+    """
+    Geometric cube model with faster face turns than cube_interactive.Cube.
+
+    Cube.rotate_face finds the facelets of the turning layer by projecting
+    all face centroids on every call, and rotates stickers, faces and
+    centroids as separate masked arrays. Here:
+
+    - stickers (9 vertices), faces (5 vertices), sticker centroid and face
+      centroid of every facelet are stacked in one vertex buffer, and the
+      usual _stickers, _faces and _sticker_centroids arrays are views of it,
+    - the layer of every facelet along each axis is kept as an index, which
+      is permuted after every completed quarter turn instead of recomputed,
+    - fractional steps of a turn rotate the vertices of the layer from where
+      they were at the start of the turn, and a turn that reaches a whole
+      number of quarter turns snaps to the exact integer rotation, so no
+      floating point drift builds up over many turns.
+
+    """
+
+    # Axis index and sign of each face normal, see Cube.facesdict
+    face_axes = dict(R=(0, 1), L=(0, -1), U=(1, 1), D=(1, -1), F=(2, 1), B=(2, -1))
+
+    def _initialize_arrays(self):
+        super()._initialize_arrays()
+        self._vertices = np.concatenate([self._stickers, self._faces,
+                                         self._sticker_centroids[:, None],
+                                         self._face_centroids[:, None, :3]], axis=1)
+        self._stickers = self._vertices[:, 0:9]
+        self._faces = self._vertices[:, 9:14]
+        self._sticker_centroids = self._vertices[:, 14]
+
+        # Layer of each facelet along x, y, z, counted from the positive side
+        cubie_width = 2. / self.N
+        layers = np.floor((1 - self._face_centroids[:, :3].T + 1e-6) / cubie_width)
+        self._layers = np.clip(layers, 0, self.N - 1).astype(np.intp)
+
+        # Turn in progress: (face, layer, rows, vertices at start, turns so far)
+        self._turn = None
+
+    def _layer_rows(self, f, layer):
+        axis, sign = self.face_axes[f]
+        index = layer if sign == 1 else self.N - 1 - layer
+        return np.nonzero(self._layers[axis] == index)[0]
+
+    def _update_move_list(self, f, n, layer):
+        """Same move list bookkeeping as Cube.rotate_face."""
+        try:
+            f_last, n_last, layer_last = self._move_list[-1]
+        except:
+            f_last, n_last, layer_last = None, None, None
+
+        if (f == f_last) and (layer == layer_last):
+            ntot = (n_last + n) % 4
+            if abs(ntot - 4) < abs(ntot):
+                ntot = ntot - 4
+            if np.allclose(ntot, 0):
+                self._move_list = self._move_list[:-1]
+            else:
+                self._move_list[-1] = (f, ntot, layer)
+        else:
+            self._move_list.append((f, n, layer))
+
+    def rotate_face(self, f, n=1, layer=0):
+        """Rotate Face"""
+        if layer < 0 or layer >= self.N:
+            raise ValueError('layer should be between 0 and N-1')
+        self._update_move_list(f, n, layer)
+
+        # 1. Continue turn in progress, or start a new one
+        if self._turn is None or tuple(self._turn[:2]) != (f, layer):
+            if self._turn is not None:
+                # Previous turn stopped part way, layers are only approximate
+                self._relayer(self._turn[2])
+            rows = self._layer_rows(f, layer)
+            self._turn = [f, layer, rows, self._vertices[rows].copy(), 0.]
+        rows, start = self._turn[2], self._turn[3]
+        self._turn[4] += n
+        total = self._turn[4]
+
+        # 2. Rotate layer from its start position by the total turn so far
+        quarter_turns = int(np.round(total))
+        snap = abs(total - quarter_turns) < 1e-9
+        M = self._rotation_matrix(f, total * np.pi / 2)
+        if snap:
+            M = np.rint(M)
+        self._vertices[rows] = np.dot(start, M.T)
+        self._face_centroids[rows, :3] = self._vertices[rows, 15]
+
+        # 3. At a whole number of quarter turns, permute layer index and end
+        # turn so the next one starts from exact coordinates
+        if snap:
+            if quarter_turns % 4 != 0:
+                self._permute_layers(rows, M)
+            self._turn = None
+
+    def _rotation_matrix(self, f, theta):
+        """
+        Rotation by theta about the normal of face f. Same matrix as
+        Quaternion.from_v_theta(self.facesdict[f], theta).as_rotation_matrix(),
+        but the normal is a coordinate axis so it can be written down directly.
+        """
+        axis, sign = self.face_axes[f]
+        c, s = np.cos(theta), sign * np.sin(theta)
+        i, j = (axis + 1) % 3, (axis + 2) % 3
+        M = np.eye(3)
+        M[i, i] = M[j, j] = c
+        M[i, j] = s
+        M[j, i] = -s
+        return M
+
+    def _permute_layers(self, rows, M):
+        """
+        After rotating rows by integer rotation matrix M, new coordinate i is
+        +-old coordinate j, so new layer along i is old layer along j,
+        counted from the other side if the sign flipped.
+        """
+        old = self._layers[:, rows]
+        for i in range(3):
+            j = int(np.argmax(np.abs(M[i])))
+            if M[i, j] > 0:
+                self._layers[i, rows] = old[j]
+            else:
+                self._layers[i, rows] = self.N - 1 - old[j]
+
+    def _relayer(self, rows):
+        """Recompute layer index of rows from their face centroids."""
+        cubie_width = 2. / self.N
+        layers = np.floor((1 - self._face_centroids[rows, :3].T + 1e-6) / cubie_width)
+        self._layers[:, rows] = np.clip(layers, 0, self.N - 1).astype(np.intp)
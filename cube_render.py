@@ -0,0 +1,93 @@
+
+import numpy as np
+from matplotlib.collections import PolyCollection
+
+from MagicCube.projection import project_points
+
+
+
+class CubeRenderer():
+
+    """
+    Draws a cube_interactive.Cube as a single PolyCollection.
+
+    Faces (plastic) and stickers are stacked into one vertex array, projected
+    with one call to project_points, sorted back to front by their projected
+    centroids and handed to the collection in that order, so the collection
+    draw order does the depth sorting.
+
+    If blit is True the collection is animated, i.e. not drawn with the rest
+    of the figure. The rest of the axes is cached on every full draw, and each
+    frame restores that background and blits the collection on top of it.
+
+    """
+
+    def __init__(self, ax, cube, blit=True):
+        self.ax = ax
+        self.cube = cube
+        self.blit = blit
+
+        n = len(self.cube._colors)
+        # Faces have 5 vertices, stickers 9, pad faces by repeating closing vertex
+        self.face_pad = np.array([0, 1, 2, 3, 4, 4, 4, 4, 4])
+        self.n_vertices = len(self.face_pad)
+        self.plastic_color = np.tile(plt_color(self.cube.plastic_color), (n, 1))
+        self.sticker_colors = np.array([plt_color(c) for c in self.cube.face_colors])
+
+        self.collection = PolyCollection(np.zeros((2*n, self.n_vertices, 2)),
+                                         edgecolors='none', animated=self.blit)
+        self.ax.add_collection(self.collection)
+
+        self.background = None
+        if self.blit:
+            self._draw_cid = self.ax.figure.canvas.mpl_connect('draw_event', self._on_draw)
+
+    def project(self, rot, view):
+        """
+        Returns 2D polygons and colors of all faces and stickers, back to
+        front.
+        """
+        cube = self.cube
+        n = len(cube._colors)
+        verts = np.concatenate([cube._faces[:, self.face_pad], cube._stickers])
+        centroids = np.concatenate([cube._face_centroids[:, :3], cube._sticker_centroids[:, :3]])
+        # One projection for every vertex and centroid
+        points = np.concatenate([verts.reshape(-1, 3), centroids])
+        proj = project_points(points, rot, view, [0, 1, 0])
+        polys = proj[:2*n*self.n_vertices, :2].reshape(2*n, self.n_vertices, 2)
+        zorder = -proj[2*n*self.n_vertices:, 2]
+        colors = np.concatenate([self.plastic_color, self.sticker_colors[cube._colors]])
+        order = np.argsort(zorder, kind='stable')
+        return polys[order], colors[order]
+
+    def draw(self, rot, view):
+        """Update collection for the current cube geometry and show it."""
+        polys, colors = self.project(rot, view)
+        self.collection.set_verts(polys)
+        self.collection.set_facecolors(colors)
+        canvas = self.ax.figure.canvas
+        if not self.blit:
+            canvas.draw()
+        elif self.background is None:
+            # First frame, background cached and collection drawn in _on_draw
+            canvas.draw()
+        else:
+            canvas.restore_region(self.background)
+            self.ax.draw_artist(self.collection)
+            canvas.blit(self.ax.bbox)
+
+    def close(self):
+        if self.blit:
+            self.ax.figure.canvas.mpl_disconnect(self._draw_cid)
+
+    def _on_draw(self, event):
+        canvas = self.ax.figure.canvas
+        self.background = canvas.copy_from_bbox(self.ax.bbox)
+        self.ax.draw_artist(self.collection)
+        canvas.blit(self.ax.bbox)
+
+
+def plt_color(color):
+    """RGBA tuple of any matplotlib color."""
+    from matplotlib.colors import to_rgba
+    return to_rgba(color)
@@ -0,0 +1,59 @@
+
+"""
+Counts cube states at every distance from solved (God's algorithm), by
+breadth first search with external_bfs.
+
+Distances are in the quarter turn metric (qtm, every quarter turn is one
+move) or the half turn metric (htm, half turns are one move too). With
+symmetry (the default), states that are rotations of each other are stored
+once, so about 24 times fewer states are kept, and the exact counts are
+rebuilt from the number of distinct rotations of every stored state.
+
+Prints one line per depth as soon as it is done, with the number of states,
+number of stored states, time and children generated per second.
+"""
+import time
+import argparse
+
+import state_engine
+import external_bfs
+
+
+QUARTER_TURNS = list('FLURDBflurdb')
+HALF_TURNS = [move*2 for move in 'FLURDB']
+METRICS = {'qtm': QUARTER_TURNS, 'htm': QUARTER_TURNS + HALF_TURNS}
+
+
+def distance_counts(metric='qtm', max_depth=6, N=3, symmetry=True, **bfs_options):
+    """
+    Generator of (depth, number of states, number of stored states,
+    children generated so far) for depths 0 to max_depth.
+    """
+    with external_bfs.ExternalBFS(METRICS[metric], N, symmetry=symmetry, **bfs_options) as bfs:
+        for level in bfs.levels(state_engine.solved_cube_state(N), max_depth):
+            yield level.depth, level.n_states, len(level), bfs.generated
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Count cube states at every distance from solved')
+    parser.add_argument('--metric', '-m', choices=sorted(METRICS), default='qtm')
+    parser.add_argument('--depth', '-d', type=int, default=6)
+    parser.add_argument('--size', '-N', type=int, default=3)
+    parser.add_argument('--no_symmetry', action='store_true', help='store every state, not one per rotation')
+    parser.add_argument('--ram_mb', type=int, default=external_bfs.RAM_BUDGET >> 20, help='RAM for states before spilling to disk')
+    parser.add_argument('--spill_dir', default=None)
+    args = parser.parse_args()
+
+    print("%5s %14s %12s %9s %12s" % ('depth', 'states', 'stored', 'seconds', 'generated/s'))
+    total = 0
+    start = last = time.perf_counter()
+    generated_before = 0
+    for depth, n_states, n_stored, generated in distance_counts(
+            args.metric, args.depth, args.size, not args.no_symmetry,
+            ram_budget=args.ram_mb << 20, spill_dir=args.spill_dir):
+        now = time.perf_counter()
+        rate = (generated - generated_before) / max(now - last, 1e-9)
+        print("%5d %14d %12d %9.2f %12.0f" % (depth, n_states, n_stored, now - last, rate), flush=True)
+        total += n_states
+        last, generated_before = now, generated
+    print("%5s %14d %12s %9.2f" % ('total', total, '', last - start))
@@ -0,0 +1,469 @@
+
+"""
+Depth bounded search of one cube state spread over worker processes on
+several hosts, coordinated over TCP.
+
+The coordinator searches for solutions shorter than split_depth moves
+itself, then splits the search tree into work units, the subtrees under
+every move prefix of split_depth moves, and hands them out as workers ask
+for work. A worker searches its units depth first, keeping the prefixes it
+has not searched yet on a stack, and searches subtrees with at most
+LEAF_DEPTH moves left in one kernels.ida_star call. When the coordinator
+runs out of units and a worker asks for work, it steals half the open
+prefixes of the worker with the most, the ones nearest the root and so the
+largest subtrees, and hands them to the idle workers. Workers report their
+node count every PROGRESS_INTERVAL seconds and a solution as soon as they
+find one, the first valid solution cancels the search on every worker. A
+worker whose connection breaks is dropped, and the units it was handed are
+handed out again.
+
+Messages are JSON objects, one per line:
+
+    coordinator to worker   job, work, steal, cancel, quit
+    worker to coordinator   hello, need_work, units, progress, solution, cancelled
+
+Messages about a search carry its job number, so late messages of a
+cancelled search are ignored. Start a worker on every host with
+
+    python distributed.py worker --host COORDINATOR_HOST --port PORT
+
+and search with Coordinator(host, port).solve(cube_state, depth). The
+solution is within depth moves, but not necessarily the shortest.
+
+    python distributed.py bench --workers 1 2 4
+
+starts local workers and prints how the search time scales with them.
+"""
+import os
+import json
+import time
+import socket
+import select
+import collections
+import numpy as np
+
+import kernels
+import state_engine
+
+
+# Moves of the prefixes the coordinator hands out as work units
+SPLIT_DEPTH = 2
+# Subtrees with at most this many moves left are searched in one kernel call
+LEAF_DEPTH = 4
+# Seconds between progress messages of a worker
+PROGRESS_INTERVAL = 0.05
+# Seconds to wait for workers to confirm a cancel
+CANCEL_TIMEOUT = 5.
+RECEIVE_SIZE = 1 << 16
+
+
+
+class Connection():
+
+    """Newline delimited JSON messages over a socket."""
+
+    def __init__(self, sock):
+        self.sock = sock
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.buffer = b''
+
+    def fileno(self):
+        return self.sock.fileno()
+
+    def send(self, **message):
+        self.sock.sendall(json.dumps(message).encode() + b'\n')
+
+    def receive(self, timeout=None):
+        """
+        Complete messages that arrived within timeout seconds (None waits
+        for data), possibly none. Raises ConnectionError if closed.
+        """
+        ready, _, _ = select.select([self.sock], [], [], timeout)
+        if ready:
+            data = self.sock.recv(RECEIVE_SIZE)
+            if not data:
+                raise ConnectionError('connection closed')
+            self.buffer += data
+        *lines, self.buffer = self.buffer.split(b'\n')
+        return [json.loads(line) for line in lines]
+
+    def close(self):
+        self.sock.close()
+
+
+def move_prefixes(inverse, length):
+    """Move index sequences of length moves, none undoing the move before."""
+    prefixes = [[]]
+    for _ in range(length):
+        prefixes = [prefix + [m] for prefix in prefixes for m in range(len(inverse))
+                    if len(prefix) == 0 or m != inverse[prefix[-1]]]
+    return prefixes
+
+
+
+class SearchJob():
+
+    """Search of one cube state, as a worker sees it."""
+
+    def __init__(self, number, state, N, depth, moves):
+        self.number = number
+        self.N = N
+        self.depth = depth
+        self.state = np.array(state, dtype=np.uint8)
+        self.tables = np.ascontiguousarray(
+            state_engine.move_code_tables(N)[state_engine.encode_moves(moves)], dtype=np.intp)
+        self.inverse = kernels.inverse_moves(self.tables)
+
+    def search(self, prefix):
+        """
+        Searches the subtree under prefix (move indices). Returns a solution
+        (move indices) or None, the nodes generated and the child prefixes
+        left to search.
+        """
+        state = self.state
+        for m in prefix:
+            state = state[self.tables[m]]
+        remaining = self.depth - len(prefix)
+        if remaining <= LEAF_DEPTH:
+            path, nodes = kernels.ida_star(state.reshape(6, self.N, self.N), self.tables,
+                                           remaining, self.inverse)
+            if path is None:
+                return None, nodes, []
+            return prefix + [int(m) for m in path], nodes, []
+        if kernels.is_solved(state, self.N):
+            return prefix, 0, []
+        children = [prefix + [m] for m in range(len(self.tables))
+                    if len(prefix) == 0 or m != self.inverse[prefix[-1]]]
+        return None, len(children), children
+
+
+def run_worker(host, port):
+    """
+    Connects to the coordinator at host, port and searches the units it
+    hands out until it says quit or goes away.
+    """
+    connection = Connection(socket.create_connection((host, port)))
+    connection.send(type='hello', pid=os.getpid())
+    job = None
+    stack = []
+    nodes = 0
+    last_report = time.monotonic()
+    while True:
+        # 1. Messages, waiting for them only when there is nothing to search
+        try:
+            messages = connection.receive(0 if stack else None)
+        except ConnectionError:
+            return
+        for message in messages:
+            kind = message['type']
+            if kind == 'quit':
+                connection.close()
+                return
+            if kind == 'job':
+                job = SearchJob(message['job'], message['state'], message['N'],
+                                message['depth'], message['moves'])
+                stack, nodes = [], 0
+            elif job is None or message['job'] != job.number:
+                continue
+            elif kind == 'work':
+                stack.extend(reversed(message['prefixes']))
+            elif kind == 'steal':
+                # Bottom of the stack is nearest the root, the largest subtrees
+                n_stolen = len(stack) // 2
+                stolen, stack = stack[:n_stolen], stack[n_stolen:]
+                connection.send(type='units', job=job.number, prefixes=stolen, open=len(stack))
+            elif kind == 'cancel':
+                connection.send(type='cancelled', job=job.number, nodes=nodes)
+                job, stack = None, []
+        if not stack:
+            continue
+
+        # 2. One prefix, its children go on the stack
+        solution, searched, children = job.search(stack.pop())
+        nodes += searched
+        stack.extend(reversed(children))
+        if solution is not None:
+            connection.send(type='solution', job=job.number, moves=solution, nodes=nodes)
+            stack = []
+        if not stack:
+            connection.send(type='need_work', job=job.number, nodes=nodes)
+        elif time.monotonic() - last_report > PROGRESS_INTERVAL:
+            connection.send(type='progress', job=job.number, nodes=nodes, open=len(stack))
+            last_report = time.monotonic()
+
+
+
+class Coordinator():
+
+    """
+    Hands out the work of searches to workers connected over TCP. Workers
+    connect to host, port (port 0 picks a free one, see address) and must
+    have joined, see wait_for_workers, before a search starts.
+    """
+
+    def __init__(self, host='127.0.0.1', port=0):
+        self.server = socket.create_server((host, port))
+        self.workers = []
+        self.job = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    @property
+    def address(self):
+        return self.server.getsockname()[:2]
+
+    def wait_for_workers(self, count, timeout=30.):
+        """
+        Accepts workers until count have joined, returns the number joined.
+        Connections that do not say hello before the timeout are closed.
+        """
+        deadline = time.monotonic() + timeout
+        self.server.settimeout(max(deadline - time.monotonic(), 0.01))
+        while len(self.workers) < count and time.monotonic() < deadline:
+            try:
+                sock, _ = self.server.accept()
+            except socket.timeout:
+                break
+            sock.setblocking(True)
+            worker = Connection(sock)
+            joined = False
+            try:
+                while not joined and time.monotonic() < deadline:
+                    joined = any(m['type'] == 'hello' for m in worker.receive(max(deadline - time.monotonic(), 0)))
+            except (ConnectionError, ValueError):
+                pass
+            if joined:
+                self.workers.append(worker)
+            else:
+                worker.close()
+        return len(self.workers)
+
+    def close(self):
+        for worker in self.workers:
+            try:
+                worker.send(type='quit')
+            except OSError:
+                pass
+            worker.close()
+        self.workers = []
+        self.server.close()
+
+    def remove_worker(self, worker):
+        """Drops a worker whose connection broke."""
+        self.workers.remove(worker)
+        worker.close()
+
+    def solve(self, cube_state, depth, moves=state_engine.MOVES, split_depth=SPLIT_DEPTH, timeout=None):
+        """
+        Searches for moves (letters of state_engine.MOVES) solving cube_state
+        within depth moves. Returns a dict of solution (move string, None if
+        there is none or time ran out), timed_out, seconds, nodes, units
+        (initial work units), steals (units stolen and handed out again),
+        worker_nodes and lost (workers that went away during the search).
+
+        The units a lost worker was handed go back to the queue, so parts of
+        them may be searched twice. Raises RuntimeError if every worker is
+        lost.
+        """
+        if len(self.workers) == 0:
+            raise RuntimeError('no workers joined the coordinator')
+        start = time.perf_counter()
+        if state_engine.is_solved(cube_state):
+            return dict(solution='', timed_out=False, seconds=time.perf_counter() - start,
+                        nodes=0, units=0, steals=0, worker_nodes=[0] * len(self.workers), lost=0)
+        deadline = None if timeout is None else time.monotonic() + timeout
+        self.job += 1
+        N = cube_state.shape[1]
+        moves = list(moves)
+        tables = state_engine.move_code_tables(N)[state_engine.encode_moves(moves)]
+        inverse = kernels.inverse_moves(tables)
+        split_depth = min(split_depth, depth)
+
+        # Units only hold solutions of at least split_depth moves, shorter
+        # ones are searched here
+        short, short_nodes = kernels.ida_star(cube_state, tables, split_depth - 1, inverse)
+        if short is not None:
+            return dict(solution=''.join(moves[m] for m in short), timed_out=False,
+                        seconds=time.perf_counter() - start, nodes=short_nodes, units=0, steals=0,
+                        worker_nodes=[0] * len(self.workers), lost=0)
+
+        units = collections.deque(move_prefixes(inverse, split_depth))
+        n_units = len(units)
+        # Units handed to each worker since it last needed work
+        info = {worker: dict(nodes=0, open=0, idle=True, units=[]) for worker in self.workers}
+        lost = set()
+        for worker in self.workers:
+            try:
+                worker.send(type='job', job=self.job, state=cube_state.reshape(-1).tolist(), N=N,
+                            depth=depth, moves=moves)
+            except OSError:
+                lost.add(worker)
+        victim = None
+        steals = 0
+        n_lost = 0
+        lost_nodes = 0
+        solution = None
+        timed_out = False
+
+        while solution is None:
+            # 1. Workers that went away, their units go back to the queue
+            for worker in lost:
+                self.remove_worker(worker)
+                units.extendleft(reversed(info[worker]['units']))
+                lost_nodes += info[worker]['nodes']
+                n_lost += 1
+                if victim is worker:
+                    victim = None
+            lost = set()
+            if len(self.workers) == 0:
+                raise RuntimeError('all workers went away during the search')
+
+            # 2. Units to idle workers, or steal for them from the busiest
+            for worker in self.workers:
+                if info[worker]['idle'] and units:
+                    prefix = units.popleft()
+                    info[worker].update(idle=False, units=info[worker]['units'] + [prefix])
+                    try:
+                        worker.send(type='work', job=self.job, prefixes=[prefix])
+                    except OSError:
+                        lost.add(worker)
+            busy = [worker for worker in self.workers if not info[worker]['idle'] and worker not in lost]
+            if not units and victim is None and len(busy) < len(self.workers) and busy:
+                candidate = max(busy, key=lambda worker: info[worker]['open'])
+                if info[candidate]['open'] >= 2:
+                    try:
+                        candidate.send(type='steal', job=self.job)
+                        victim = candidate
+                    except OSError:
+                        lost.add(candidate)
+            if lost:
+                continue
+            if not units and not busy and victim is None:
+                break
+            if deadline is not None and time.monotonic() > deadline:
+                timed_out = True
+                break
+
+            # 3. Messages of the current job
+            wait = 0.1 if deadline is None else min(0.1, max(deadline - time.monotonic(), 0))
+            ready, _, _ = select.select(self.workers, [], [], wait)
+            for worker in ready:
+                try:
+                    messages = worker.receive(0)
+                except ConnectionError:
+                    lost.add(worker)
+                    continue
+                for message in messages:
+                    if message.get('job') != self.job:
+                        continue
+                    kind = message['type']
+                    if 'nodes' in message:
+                        info[worker]['nodes'] = message['nodes']
+                    if kind == 'progress':
+                        info[worker]['open'] = message['open']
+                    elif kind == 'need_work':
+                        info[worker].update(idle=True, open=0, units=[])
+                    elif kind == 'units':
+                        info[worker]['open'] = message['open']
+                        units.extend(message['prefixes'])
+                        steals += len(message['prefixes'])
+                        victim = None
+                    elif kind == 'solution' and solution is None:
+                        found = ''.join(moves[m] for m in message['moves'])
+                        state = cube_state.copy()
+                        for move in found:
+                            state_engine.apply_move(state, move)
+                        if state_engine.is_solved(state):
+                            solution = found
+
+        # 4. Cancel the search everywhere, with the final node counts
+        waiting = set()
+        for worker in self.workers:
+            try:
+                worker.send(type='cancel', job=self.job)
+                waiting.add(worker)
+            except OSError:
+                lost.add(worker)
+        cancel_deadline = time.monotonic() + CANCEL_TIMEOUT
+        while waiting and time.monotonic() < cancel_deadline:
+            ready, _, _ = select.select(list(waiting), [], [], 0.1)
+            for worker in ready:
+                try:
+                    messages = worker.receive(0)
+                except ConnectionError:
+                    lost.add(worker)
+                    waiting.discard(worker)
+                    continue
+                for message in messages:
+                    if message.get('job') == self.job and message['type'] == 'cancelled':
+                        info[worker]['nodes'] = message['nodes']
+                        waiting.discard(worker)
+        for worker in lost:
+            self.remove_worker(worker)
+            lost_nodes += info[worker]['nodes']
+            n_lost += 1
+        worker_nodes = [info[worker]['nodes'] for worker in self.workers]
+        return dict(solution=solution, timed_out=timed_out, seconds=time.perf_counter() - start,
+                    nodes=short_nodes + lost_nodes + sum(worker_nodes), units=n_units, steals=steals,
+                    worker_nodes=worker_nodes, lost=n_lost)
+
+
+def start_local_workers(coordinator, count):
+    """Starts count worker processes on this host, connected to coordinator."""
+    import multiprocessing
+
+    context = multiprocessing.get_context('spawn')
+    host, port = coordinator.address
+    processes = [context.Process(target=run_worker, args=(host, port), daemon=True) for _ in range(count)]
+    for process in processes:
+        process.start()
+    coordinator.wait_for_workers(len(coordinator.workers) + count)
+    return processes
+
+
+if __name__ == '__main__':
+    import argparse
+
+    import scrambles
+
+    parser = argparse.ArgumentParser(description='Distributed search, run a worker or the scaling benchmark')
+    commands = parser.add_subparsers(dest='command')
+    p = commands.add_parser('worker', help='search for a coordinator')
+    p.add_argument('--host', default='127.0.0.1', help='host of the coordinator')
+    p.add_argument('--port', type=int, required=True, help='port of the coordinator')
+    p = commands.add_parser('bench', help='time searches with local workers')
+    p.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4])
+    p.add_argument('--depth', '-d', type=int, default=6, help='search depth')
+    p.add_argument('--scramble_depth', type=int, default=12,
+                   help='scramble length, more than --depth times the full search')
+    p.add_argument('--count', '-c', type=int, default=3, help='number of scrambles')
+    p.add_argument('--split_depth', type=int, default=SPLIT_DEPTH)
+    p.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    if args.command == 'worker':
+        run_worker(args.host, args.port)
+    elif args.command == 'bench':
+        states = [state.copy() for state in next(scrambles.generate(args.seed, args.count, args.scramble_depth))[0]]
+        print("%d CPUs, IDA* kernels %s" % (os.cpu_count(), 'compiled with Numba' if kernels.JIT else 'in NumPy'))
+        print("%8s %10s %12s %12s %8s %8s %8s" % ('workers', 'seconds', 'nodes', 'nodes/s', 'speedup', 'steals', 'solved'))
+        base = None
+        for count in args.workers:
+            with Coordinator() as coordinator:
+                processes = start_local_workers(coordinator, count)
+                # One search first, so every worker has compiled its kernels
+                coordinator.solve(states[0], min(args.depth, LEAF_DEPTH + 1), split_depth=args.split_depth)
+                results = [coordinator.solve(state, args.depth, split_depth=args.split_depth) for state in states]
+            for process in processes:
+                process.join()
+            seconds = sum(result['seconds'] for result in results)
+            nodes = sum(result['nodes'] for result in results)
+            base = base or seconds
+            print("%8d %10.2f %12d %12.0f %8.2f %8d %5d/%-3d" % (
+                  count, seconds, nodes, nodes / seconds, base / seconds,
+                  sum(result['steals'] for result in results),
+                  sum(result['solution'] is not None for result in results), len(results)))
@@ -0,0 +1,418 @@
+
+import os
+import time
+import shutil
+import tempfile
+import numpy as np
+
+import state_engine
+
+
+# Bytes of state arrays kept in RAM, any more are spilled to memory mapped
+# files
+RAM_BUDGET = 1 << 30
+# States expanded per batch engine call
+CHUNK_SIZE = 1 << 14
+# Levels are split into 2**BUCKET_BITS buckets by the top bits of the state
+# hash keys, and deduplicated one bucket at a time
+BUCKET_BITS = 4
+# Move index of states not reached by a move of the search
+NO_MOVE = 255
+# States canonicalized at once with symmetry, each needs 24 rotated copies
+SYMMETRY_CHUNK = 4096
+
+
+
+def sort_unique(keys, states, moves):
+    """
+    Sorts states by hash key and drops duplicate states, keeping the move of
+    one of them.
+    """
+    order = np.argsort(keys)
+    keys, states, moves = keys[order], states[order], moves[order]
+    same_key = keys[1:] == keys[:-1]
+    same_state = np.all(states[1:] == states[:-1], axis=1)
+    # Different states with the same key, so duplicates may not be next to
+    # each other. Very rare with 64 bit keys, sort by state words too.
+    if np.any(same_key & ~same_state):
+        order = np.lexsort(tuple(states[:, w] for w in reversed(range(states.shape[1]))) + (keys,))
+        keys, states, moves = keys[order], states[order], moves[order]
+        same_key = keys[1:] == keys[:-1]
+        same_state = np.all(states[1:] == states[:-1], axis=1)
+    keep = np.ones(len(keys), dtype=bool)
+    keep[1:] = ~(same_key & same_state)
+    return keys[keep], states[keep], moves[keep]
+
+
+def find_sorted(sorted_keys, sorted_states, keys, states):
+    """
+    Index of every state in sorted_states (sorted by sorted_keys), -1 if
+    not there.
+    """
+    found = np.full(len(keys), -1, dtype=np.intp)
+    pos = np.searchsorted(sorted_keys, keys)
+    active = np.nonzero(pos < len(sorted_keys))[0]
+    # States with equal keys are next to each other, step through them,
+    # usually only one
+    while len(active) > 0:
+        p = pos[active]
+        same_key = sorted_keys[p] == keys[active]
+        active, p = active[same_key], p[same_key]
+        match = np.all(sorted_states[p] == states[active], axis=1)
+        found[active[match]] = p[match]
+        active = active[~match]
+        pos[active] += 1
+        active = active[pos[active] < len(sorted_keys)]
+    return found
+
+
+
+class Level():
+
+    """
+    Deduplicated states of one BFS level.
+
+    States are split into buckets by the top bits of their hash key, within
+    a bucket sorted by key. Each bucket is a tuple of arrays (keys, packed
+    states, index of the moves that reached them), in RAM or memory mapped.
+
+    """
+
+    def __init__(self, depth, n_buckets):
+        self.depth = depth
+        self.buckets = [None] * n_buckets
+        # Number of cube states, more than stored states with symmetry
+        self.n_states = 0
+        self.ram_bytes = 0
+        self.files = []
+
+    def __len__(self):
+        return sum(len(bucket[0]) for bucket in self.buckets)
+
+    def chunks(self, chunk_size):
+        """(packed states, moves) of all states, chunk_size at a time."""
+        for keys, states, moves in self.buckets:
+            for i in range(0, len(keys), chunk_size):
+                yield np.asarray(states[i:i+chunk_size]), np.asarray(moves[i:i+chunk_size])
+
+    def contains(self, b, keys, states):
+        """Mask of which states with keys in bucket b are in this level."""
+        bucket_keys, bucket_states, _ = self.buckets[b]
+        return find_sorted(bucket_keys, bucket_states, keys, states) >= 0
+
+    def move_of(self, state, bucket_bits):
+        """Index of move that reached a packed state, None if not in level."""
+        state = state[None]
+        key = state_engine.hash_packed(state)
+        bucket_keys, bucket_states, moves = self.buckets[int(key[0] >> np.uint64(64 - bucket_bits))]
+        i = find_sorted(bucket_keys, bucket_states, key, state)[0]
+        return None if i < 0 else int(moves[i])
+
+
+class ExternalBFS():
+
+    """
+    Breadth first search over packed cube states, for searches too large
+    for the solvers that keep every node as a string.
+
+    Every level is a Level of packed states (16 stickers per uint64, see
+    state_engine.pack_states). A level is expanded chunk by chunk with the
+    batch move engine, children are sorted and deduplicated by hash key and
+    collected per bucket, then every bucket is deduplicated again and
+    against the same bucket of the previous two levels. With moves that
+    come with their inverse that removes every state seen before, otherwise
+    a state can come back in a later level.
+
+    Every move is a string of one or more state_engine.MOVES applied as one
+    step, e.g. 'RR' for a half turn.
+
+    With symmetry, states that are the same up to a rotation of the whole
+    cube (and relabeling of colors) are stored once, as the smallest of
+    their rotations. That only keeps the distance from the start if the
+    start is solved and the move set is mapped onto itself by rotations,
+    and paths can not be rebuilt, so it is only for counting with levels.
+    Level.n_states is then the number of cube states the stored states
+    stand for, from their number of distinct rotations.
+
+    Level buckets and children collected for the next level are kept in RAM
+    up to ram_budget bytes, beyond that written to .npy files in a
+    temporary directory (in spill_dir if given) and memory mapped. Use as a
+    context manager, or call close, to remove them.
+
+    """
+
+    def __init__(self, moves, N=3, ram_budget=RAM_BUDGET, spill_dir=None,
+                 chunk_size=CHUNK_SIZE, bucket_bits=BUCKET_BITS, symmetry=False):
+        self.moves = list(moves)
+        self.N = N
+        self.ram_budget = ram_budget
+        self.spill_dir = spill_dir
+        self.chunk_size = chunk_size
+        self.bucket_bits = bucket_bits
+        self.n_buckets = 1 << bucket_bits
+        self.symmetry = symmetry
+
+        # One sticker permutation per move, and its inverse
+        code_tables = state_engine.move_code_tables(N)
+        self.perms = np.empty((len(self.moves), 6*N*N), dtype=np.intp)
+        for i, move in enumerate(self.moves):
+            perm = np.arange(6*N*N)
+            for code in state_engine.encode_moves(move):
+                perm = perm[code_tables[code]]
+            self.perms[i] = perm
+        self.inverse_perms = np.argsort(self.perms, axis=1)
+        # Index of the inverse of every move, NO_MOVE if not in moves,
+        # children undoing the parent move are not generated
+        self.inverse = np.full(NO_MOVE + 1, NO_MOVE, dtype=np.uint8)
+        for i in range(len(self.moves)):
+            match = np.nonzero(np.all(self.perms == self.inverse_perms[i], axis=1))[0]
+            if len(match) > 0:
+                self.inverse[i] = match[0]
+
+        if symmetry:
+            slots, self.rotation_faces = state_engine.rotation_tables(N)
+            # Rotated state g takes sticker j from slot rotation_sources[g, j],
+            # as index into the stickers of all relabelings (S, 24) flattened
+            rotation_sources = np.argsort(slots, axis=1)
+            self.rotation_index = rotation_sources * len(slots) + np.arange(len(slots))[:, None]
+
+        self.ram_used = 0
+        self.spilled_bytes = 0
+        # Children generated, for throughput
+        self.generated = 0
+        self._tmp_dir = None
+        self._n_files = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        if self._tmp_dir is not None:
+            shutil.rmtree(self._tmp_dir, ignore_errors=True)
+            self._tmp_dir = None
+
+    def levels(self, cube_state, max_depth):
+        """
+        Yields the levels of a search from cube_state up to max_depth, only
+        the last two are kept.
+        """
+        history = [self._start_level(cube_state)]
+        try:
+            yield history[0]
+            for depth in range(1, max_depth + 1):
+                level, _ = self._expand(history[-1], history[-2] if len(history) > 1 else None)
+                if len(history) > 1:
+                    self._release(history.pop(0))
+                history.append(level)
+                yield level
+        finally:
+            for level in history:
+                self._release(level)
+
+    def solve(self, cube_state, max_depth, deadline=None):
+        """
+        Shortest list of moves that solves cube_state, None if there is none
+        within max_depth moves, or if deadline (time.perf_counter()) passed
+        before a level was expanded.
+        """
+        if self.symmetry:
+            raise ValueError('paths can not be rebuilt with symmetry')
+        if state_engine.is_solved(cube_state):
+            return []
+        history = [self._start_level(cube_state)]
+        try:
+            for depth in range(1, max_depth + 1):
+                if deadline is not None and time.perf_counter() > deadline:
+                    return None
+                level, hit = self._expand(history[-1], history[-2] if len(history) > 1 else None,
+                                          stop_at_solved=True)
+                if hit is not None:
+                    return self._path(history, *hit)
+                history.append(level)
+                if len(level) == 0:
+                    break
+            return None
+        finally:
+            for level in history:
+                self._release(level)
+
+    def _start_level(self, cube_state):
+        if self.symmetry:
+            state, stabilizer = self.canonical(cube_state.reshape(1, -1))
+        else:
+            state, stabilizer = state_engine.pack_states(cube_state[None]), np.array([1])
+        level = Level(0, self.n_buckets)
+        empty = self._empty_bucket()
+        level.buckets = [empty] * self.n_buckets
+        key = state_engine.hash_packed(state)
+        level.buckets[int(key[0] >> np.uint64(64 - self.bucket_bits))] = (key, state, np.array([NO_MOVE], dtype=np.uint8))
+        level.n_states = int(self._orbit_sizes(stabilizer).sum())
+        return level
+
+    def canonical(self, cube_states):
+        """
+        Smallest rotation (by packed words) of every state of a (B, 6*N*N)
+        array, as packed states, and the number of rotations giving it.
+        """
+        n_rotations = len(self.rotation_faces)
+        canonical, stabilizer = [], []
+        for i in range(0, len(cube_states), SYMMETRY_CHUNK):
+            states = cube_states[i:i+SYMMETRY_CHUNK]
+            relabeled = self.rotation_faces.T[states].reshape(len(states), -1)
+            rotated = np.take(relabeled, self.rotation_index, axis=1)
+            packed = state_engine.pack_states(rotated.reshape(-1, rotated.shape[2])).reshape(len(states), n_rotations, -1)
+            # Lexicographic minimum over rotations, one word at a time
+            smallest = np.ones(packed.shape[:2], dtype=bool)
+            for w in range(packed.shape[2]):
+                words = np.where(smallest, packed[:,:,w], np.uint64(0xFFFFFFFFFFFFFFFF))
+                smallest &= words == words.min(axis=1)[:,None]
+            canonical.append(packed[np.arange(len(states)), np.argmax(smallest, axis=1)])
+            stabilizer.append(smallest.sum(axis=1))
+        if len(canonical) == 0:
+            return np.empty((0, state_engine.packed_words(self.N)), dtype=np.uint64), np.empty(0, dtype=np.int64)
+        return np.concatenate(canonical), np.concatenate(stabilizer)
+
+    def _orbit_sizes(self, stabilizer):
+        """Number of cube states each stored state stands for."""
+        if not self.symmetry:
+            return np.ones(len(stabilizer), dtype=np.int64)
+        return len(self.rotation_faces) // stabilizer
+
+    def _empty_bucket(self):
+        W = state_engine.packed_words(self.N)
+        return (np.zeros(0, dtype=np.uint64), np.zeros((0, W), dtype=np.uint64), np.zeros(0, dtype=np.uint8))
+
+    def _expand(self, frontier, previous, stop_at_solved=False):
+        """
+        Next level after frontier. If stop_at_solved, stops at the first
+        solved child and returns its packed parent and move as well.
+        """
+        shift = np.uint64(64 - self.bucket_bits)
+        # Children per bucket, sorted arrays in RAM or paths of spilled parts
+        parts = [[] for _ in range(self.n_buckets)]
+        pending_bytes = 0
+
+        # 1. Expand frontier chunk by chunk, sort and dedupe every chunk
+        for states, moves in frontier.chunks(self.chunk_size):
+            unpacked = state_engine.unpack_states(states, self.N)
+            children = unpacked[:, self.perms]
+            child_moves = np.broadcast_to(np.arange(len(self.moves), dtype=np.uint8), children.shape[:2])
+            keep = child_moves != self.inverse[moves][:, None]
+            children, child_moves = children[keep], child_moves[keep]
+            self.generated += len(children)
+            if stop_at_solved:
+                solved = np.nonzero(state_engine.is_solved_batch(children.reshape(-1, 6, self.N, self.N)))[0]
+                if len(solved) > 0:
+                    parent = np.nonzero(keep)[0][solved[0]]
+                    self._drop_parts(parts)
+                    return None, (states[parent], int(child_moves[solved[0]]))
+
+            if self.symmetry:
+                # Moves of rotated states are not moves of the stored state
+                packed, _ = self.canonical(children)
+                child_moves = np.full(len(children), NO_MOVE, dtype=np.uint8)
+            else:
+                packed = state_engine.pack_states(children)
+            keys, packed, child_moves = sort_unique(state_engine.hash_packed(packed), packed, child_moves)
+            bounds = np.searchsorted(keys >> shift, np.arange(self.n_buckets + 1, dtype=np.uint64))
+            for b in range(self.n_buckets):
+                part = slice(bounds[b], bounds[b+1])
+                parts[b].append((keys[part], packed[part], child_moves[part]))
+            pending_bytes += keys.nbytes + packed.nbytes + child_moves.nbytes
+            if self.ram_used + pending_bytes > self.ram_budget:
+                self._spill_parts(parts)
+                pending_bytes = 0
+
+        # 2. Merge parts of every bucket, drop states of previous two levels
+        level = Level(frontier.depth + 1, self.n_buckets)
+        for b in range(self.n_buckets):
+            loaded = [self._load_part(part) for part in parts[b]]
+            if len(loaded) == 0:
+                level.buckets[b] = self._empty_bucket()
+                continue
+            keys, states, moves = sort_unique(*[np.concatenate(arrays) for arrays in zip(*loaded)])
+            new = np.ones(len(keys), dtype=bool)
+            for seen in (frontier, previous):
+                if seen is not None:
+                    new &= ~seen.contains(b, keys, states)
+            level.buckets[b] = self._store(level, (keys[new], states[new], moves[new]))
+            if self.symmetry:
+                _, stabilizer = self.canonical(state_engine.unpack_states(states[new], self.N))
+            else:
+                stabilizer = np.ones(np.count_nonzero(new), dtype=np.int64)
+            level.n_states += int(self._orbit_sizes(stabilizer).sum())
+            del loaded
+            self._drop_parts([parts[b]])
+        return level, None
+
+    def _path(self, history, parent, move):
+        """Moves from start to solved, from solved child parent and move."""
+        path = [move]
+        state = parent
+        for level in reversed(history[1:]):
+            move = level.move_of(state, self.bucket_bits)
+            path.append(move)
+            undone = state_engine.unpack_states(state[None], self.N)[:, self.inverse_perms[move]]
+            state = state_engine.pack_states(undone)[0]
+        return [self.moves[i] for i in path[::-1]]
+
+    def _new_file(self):
+        if self._tmp_dir is None:
+            self._tmp_dir = tempfile.mkdtemp(prefix='external_bfs_', dir=self.spill_dir)
+        self._n_files += 1
+        return os.path.join(self._tmp_dir, '%d.npy' % self._n_files)
+
+    def _store(self, level, arrays):
+        """Bucket arrays of level, in RAM if within budget, else memory mapped."""
+        nbytes = sum(a.nbytes for a in arrays)
+        if self.ram_used + nbytes <= self.ram_budget:
+            self.ram_used += nbytes
+            level.ram_bytes += nbytes
+            return arrays
+        stored = []
+        for a in arrays:
+            path = self._new_file()
+            mapped = np.lib.format.open_memmap(path, mode='w+', dtype=a.dtype, shape=a.shape)
+            mapped[...] = a
+            mapped.flush()
+            level.files.append(path)
+            stored.append(np.load(path, mmap_mode='r'))
+        self.spilled_bytes += nbytes
+        return tuple(stored)
+
+    def _release(self, level):
+        """Forget a level, freeing its RAM budget and files."""
+        self.ram_used -= level.ram_bytes
+        level.ram_bytes = 0
+        level.buckets = []
+        for path in level.files:
+            if os.path.exists(path):
+                os.remove(path)
+        level.files = []
+
+    def _spill_parts(self, parts):
+        for bucket_parts in parts:
+            for i, part in enumerate(bucket_parts):
+                if isinstance(part, tuple):
+                    paths = []
+                    for a in part:
+                        paths.append(self._new_file())
+                        np.save(paths[-1], a)
+                    self.spilled_bytes += sum(a.nbytes for a in part)
+                    bucket_parts[i] = paths
+
+    def _load_part(self, part):
+        if isinstance(part, tuple):
+            return part
+        return tuple(np.load(path, mmap_mode='r') for path in part)
+
+    def _drop_parts(self, parts):
+        for bucket_parts in parts:
+            for part in bucket_parts:
+                if not isinstance(part, tuple):
+                    for path in part:
+                        os.remove(path)
+            del bucket_parts[:]
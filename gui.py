@@ -0,0 +1,433 @@
+
+import os
+import time
+import queue
+import random
+import functools
+import numpy as np
+from pylab import pause
+from matplotlib import widgets
+import matplotlib.pyplot as plt
+
+import state_engine
+import tree_view
+import cube_render
+import solve_worker
+import solve_trace
+import cube_geometry
+from MagicCube import cube_interactive
+
+
+# Frame rate of the GUI while a solver runs, and frames per animated turn
+FRAME_RATE = 30
+TURN_FRAMES = 5
+# With more queued moves than this, stop animating turns and skip frames
+MAX_BACKLOG = 2
+# Fraction of a frame that can be spent applying moves when skipping frames
+FRAME_BUDGET = 0.5
+
+
+
+class ModifiedCube(cube_geometry.LayeredCube):
+    """
+    In order to use added functionailty in ModifiedInteractiveCube, need to
+    override class call in Cube, to instead call ModifiedInteractiveCube.
+
+    Keyword arguments are passed on to ModifiedInteractiveCube.
+
+    """
+    def __init__(self, N=3, **interactive_options):
+        super().__init__(N)
+        self.interactive_options = interactive_options
+
+    def draw_interactive(self):
+        fig = plt.figure(figsize=(5, 5))
+        self.ModifiedInteractiveCube = ModifiedInteractiveCube(self, **self.interactive_options)
+        fig.add_axes(self.ModifiedInteractiveCube)
+        return fig
+
+
+class ModifiedInteractiveCube(cube_interactive.InteractiveCube):
+    """
+    In order to introduce additional solving functionailty and visualization,
+    need to override some class methods
+
+    """
+
+    def __init__(self, cube, visualize_cube=True, visualize_tree=True, depth=2, fast_render=True, record_dir=None, seed=None):
+        # Needed before super init, which draws the cube
+        self.fast_render = fast_render
+        self.cube_renderer = None
+        super().__init__(cube)
+
+        # Initialize matrices that will track cube position
+        self._setup_cube_state()
+
+        # Track if should visualize cube while solving, and state tree
+        self.visualize_cube = visualize_cube
+        self.visualize_tree = visualize_tree
+        self.tree_view = None
+
+        # Set depth to search and to shuffle, shuffles are repeatable with a seed
+        self.depth = depth
+        self.rng = random.Random(seed)
+
+        # Initialize variable tracking moves made by solvers
+        self.solver_moves = []
+
+        # Initialize variable of all possible moves of cube
+        self.possible_moves = state_engine.POSSIBLE_MOVES.copy()
+
+        # Track if cube has been shuffled or not
+        self.shuffled = False
+
+        # Track number of solvers added, maximum 3
+        self.number_of_solvers = 0
+        self.solvers = []
+
+        # Track buttons/solvers
+        self._ax_solve = []
+        self._btn_solve = []
+
+        # Background solver and GUI side of it, see _consume_moves
+        self.worker = None
+        self.worker_done = False
+        # Set while a stopped worker is still inside get_action, its solver
+        # is not reused until the worker thread has ended
+        self.worker_stopping = False
+        self.frame_timer = None
+        self.turn_animation = None
+
+        # If given, every solve is saved as a trace in record_dir, replaying
+        # all moves made on cube gives the start position of the solve
+        self.record_dir = record_dir
+        self.move_history = []
+        self.trace = None
+        self.number_of_traces = 0
+
+        # Remove text
+        self.figure.texts[0].set_visible(False)
+
+
+    def _key_press(self,event):
+        """Disallow manual turning."""
+        pass
+
+    def add_solver(self,new_solver_class):
+        """
+        If over max solvers (3) print error, otherwise will instantiate solver,
+        append to solver list and add button.
+        """
+        if self.number_of_solvers > 2:
+            print("Max number of solvers")
+            return
+        # Instantiate
+        new_solver = new_solver_class(self.depth, self.possible_moves.copy())
+        name = new_solver.get_name()
+        # Append
+        self.solvers.append(new_solver)
+        # Make button
+        left = 0.55 - self.number_of_solvers*.2
+        self._ax_solve.append(self.figure.add_axes([left, 0.05, 0.2, 0.075]))
+        self._btn_solve.append(widgets.Button(self._ax_solve[-1], name))
+        self._btn_solve[-1].on_clicked(functools.partial(self._button_clicked, s_id=self.number_of_solvers))
+        # Increment
+        self.number_of_solvers += 1
+
+    def _button_clicked(self, mouse_click, s_id=0, *args):
+        self._solve_cube(s_id)
+
+
+    def _shuffle_cube(self,*args):
+        """
+        Method that shuffles cube for given number of turns (backwards turns
+        only). Also clears solver_moves to track new solver.
+
+        If cube is already shuffled prints error and returns without shuffling
+        again.
+        """
+        if self.worker is not None:
+            print("Solver running")
+            return
+        if self.shuffled:
+            print("Cube already shuffled")
+            return
+        shuffle_moves = self.rng.choices(self.possible_moves,k=self.depth)
+        for move in shuffle_moves:
+            # Only make backwards moves
+            self.rotate_face(move.lower())
+        self.shuffled = True
+
+        # Clear tracking variables
+        self.solver_moves = []
+
+
+    def _initialize_widgets(self):
+        """
+        Override buttons
+        """
+
+        self._ax_reset = self.figure.add_axes([0.75, 0.05, 0.2, 0.075])
+        self._btn_reset = widgets.Button(self._ax_reset, 'Shuffle Cube')
+        self._btn_reset.on_clicked(self._shuffle_cube)
+
+        self._ax_pause = self.figure.add_axes([0.05, 0.9, 0.2, 0.075])
+        self._btn_pause = widgets.Button(self._ax_pause, 'Pause')
+        self._btn_pause.on_clicked(self._pause_solver)
+
+        self._ax_stop = self.figure.add_axes([0.25, 0.9, 0.2, 0.075])
+        self._btn_stop = widgets.Button(self._ax_stop, 'Stop')
+        self._btn_stop.on_clicked(self._stop_solver)
+
+
+    def _setup_cube_state(self):
+        """
+        Cube's position internally will be stored as 6 NxN matrics. Where each
+        color is assigned an integer 0-5.
+        """
+        self.cube_state = state_engine.solved_cube_state(self.cube.N)
+
+
+    def _draw_cube(self):
+        """
+        Draw with a single blitted PolyCollection, unless fast rendering is
+        off, then use original patch per face and sticker drawing.
+        """
+        if not self.fast_render:
+            super()._draw_cube()
+            return
+        if self.cube_renderer is None:
+            self.cube_renderer = cube_render.CubeRenderer(self, self.cube)
+        self.cube_renderer.draw(self._current_rot, self._view)
+
+    def rotate_face(self, turn, layer=0, steps=10):
+        turns = 1 if turn.isupper() else -1
+        # If selected visualize cube turning
+        if self.visualize_cube:
+            for i in range(steps):
+                self.cube.rotate_face(turn.upper(), turns / steps, layer=layer)
+                self._draw_cube()
+                # Blitted frames are already on screen, only need to handle events
+                if self.fast_render:
+                    self.figure.canvas.flush_events()
+                else:
+                    pause(0.01)
+        # Update internal cube state
+        self.update_cube_state(turn.upper(), np.sign(turns), layer)
+        self.move_history.append(turn)
+
+    def update_cube_state(self,face,dir,layer=0):
+        state_engine.update_cube_state(self.cube_state, face, dir, layer)
+
+    def _is_solved(self):
+        """
+        Returns boolean if cube is solved or not.
+
+        """
+        return state_engine.is_solved(self.cube_state)
+
+    def _solve_cube(self,solver_num):
+        """
+        Start chosen solver in a background worker. Its moves are taken from
+        the worker queue by _consume_moves at a fixed frame rate, until cube is
+        solved or solver terminates.
+
+        """
+        if self.worker is not None:
+            print("Solver still stopping" if self.worker_stopping else "Solver already running")
+            return
+
+        # Setup second plotting window for tree if visualizing, only the node
+        # colors are redrawn after this
+        if self.visualize_tree:
+            if self.tree_view is not None:
+                self.tree_view.close()
+            self.tree_fig = plt.figure(2)
+            self.tree_fig.clf()
+            self.tree_ax = self.tree_fig.add_subplot(111)
+            self.tree_view = tree_view.make_tree_view(self.tree_ax, self.depth, self.possible_moves)
+            self._update_tree()
+
+        # Select solver and start it on its own copy of the cube state
+        solver = self.solvers[solver_num]
+        if self.record_dir is not None:
+            self.trace = solve_trace.Trace(self.depth, self.possible_moves, self.move_history, solver.get_name(), self.cube.N)
+        self.worker = solve_worker.SolverWorker(solver, self.cube_state)
+        self.worker_done = False
+        self.worker.start()
+
+        # Consume moves on a timer so GUI stays responsive
+        self.frame_timer = self.figure.canvas.new_timer(interval=int(1000/FRAME_RATE))
+        self.frame_timer.add_callback(self._consume_moves)
+        self.frame_timer.start()
+
+    def _consume_moves(self):
+        """
+        Called every frame while a solver runs.
+
+        If keeping up with the solver, animates one frame of the current turn.
+        If falling behind, applies as many queued moves as fit in part of a
+        frame without animating them, cancels moves that undo each other, and
+        draws the cube and tree once.
+        """
+        if self.worker is None:
+            return
+        if self.worker_stopping:
+            if not self.worker.is_alive():
+                self._finish_solve('stopped')
+            return
+        if self.worker.paused:
+            return
+        backlog = self.worker.moves.qsize()
+        # 1. Keep animating current turn, or finish it at once if behind
+        if self.turn_animation is not None:
+            if backlog <= MAX_BACKLOG:
+                self._animate_turn()
+                return
+            self._finish_turn()
+        # 2. Keeping up, start animating next move
+        if self.visualize_cube and backlog <= MAX_BACKLOG:
+            action = self._next_move()
+            if action is not None:
+                self._take_action(action)
+                self._update_tree()
+                self.turn_animation = [action, TURN_FRAMES]
+                self._animate_turn()
+        # 3. Falling behind, skip frames
+        else:
+            net_moves = []
+            deadline = time.perf_counter() + FRAME_BUDGET/FRAME_RATE
+            while time.perf_counter() < deadline:
+                action = self._next_move()
+                if action is None:
+                    break
+                self._take_action(action)
+                self._update_tree(redraw=False)
+                if len(net_moves) > 0 and action.swapcase() == net_moves[-1]:
+                    net_moves.pop()
+                else:
+                    net_moves.append(action)
+            if self.visualize_cube:
+                for move in net_moves:
+                    self.cube.rotate_face(move.upper(), 1 if move.isupper() else -1)
+                self._draw_cube()
+            if self.visualize_tree:
+                self.tree_view.redraw()
+        # 4. Done once solver is finished and everything is shown
+        if self.worker_done and self.turn_animation is None:
+            self._finish_solve()
+
+    def _next_move(self):
+        """Next queued move, or None if there is none (yet)."""
+        try:
+            action = self.worker.moves.get_nowait()
+        except queue.Empty:
+            return None
+        if action is solve_worker.SolverWorker.DONE:
+            self.worker_done = True
+        return action
+
+    def _take_action(self, action):
+        """Update cube state and moves for action, cube is drawn separately."""
+        self.update_cube_state(action.upper(), 1 if action.isupper() else -1)
+        self._update_moves(action)
+        self.move_history.append(action)
+        if self.trace is not None:
+            self.trace.add_move(action)
+
+    def _animate_turn(self):
+        action, frames_left = self.turn_animation
+        turns = 1 if action.isupper() else -1
+        self.cube.rotate_face(action.upper(), turns / TURN_FRAMES)
+        self._draw_cube()
+        if frames_left == 1:
+            self.turn_animation = None
+        else:
+            self.turn_animation[1] -= 1
+
+    def _finish_turn(self):
+        """Rotate rest of current turn at once, without drawing."""
+        action, frames_left = self.turn_animation
+        turns = 1 if action.isupper() else -1
+        self.cube.rotate_face(action.upper(), turns * frames_left / TURN_FRAMES)
+        self.turn_animation = None
+
+    def _finish_solve(self, event=None):
+        self.frame_timer.stop()
+        self.worker = None
+        self.worker_stopping = False
+        # If solved update shuffled
+        if self._is_solved():
+            self.shuffled = False
+            print("Solved")
+            event = 'solved'
+        if self.trace is not None:
+            self._save_trace(event or 'terminated')
+
+    def _save_trace(self, event):
+        self.trace.add_event(event)
+        self.number_of_traces += 1
+        os.makedirs(self.record_dir, exist_ok=True)
+        path = os.path.join(self.record_dir, "trace_%d_%s.npz" % (self.number_of_traces, self.trace.solver_name))
+        self.trace.save(path)
+        self.trace = None
+        print("Saved trace to", path)
+
+    def _pause_solver(self, *args):
+        if self.worker is None:
+            return
+        if self.worker.paused:
+            self.worker.resume()
+            self._btn_pause.label.set_text('Pause')
+        else:
+            self.worker.pause()
+            self._btn_pause.label.set_text('Resume')
+        self.figure.canvas.draw_idle()
+
+    def _stop_solver(self, *args):
+        """
+        Stop solver and drop its queued moves, cube is left at the last move
+        shown. If the solver does not stop within a second, new solves wait
+        until it does.
+        """
+        if self.worker is None or self.worker_stopping:
+            return
+        self.worker.stop()
+        self.worker.join(timeout=1.)
+        if self.turn_animation is not None:
+            self._finish_turn()
+            self._draw_cube()
+        self._btn_pause.label.set_text('Pause')
+        if self.worker.is_alive():
+            # Still in a long get_action, the frame timer finishes the stop
+            # once it returns
+            print("Waiting for solver to stop")
+            self.worker_stopping = True
+            return
+        self._finish_solve('stopped')
+
+
+    def _update_tree(self, redraw=True):
+        """
+        If specified, visualize state tree, with colors indicating the following:
+        Grey -> visited
+        Yellow -> Current state
+        Green -> Solved State
+        """
+        if not self.visualize_tree:
+            return
+        self.tree_view.update(''.join(self.solver_moves), solved=self._is_solved(), redraw=redraw)
+
+
+    def _update_moves(self,action):
+        """
+        Adds move to list tracking moves made by solver.
+
+        If action and last move are same character, and opposite case then just
+        pop, because they cancel.
+
+        """
+        if len(self.solver_moves)>0 and (action.upper() == self.solver_moves[-1].upper() and not action == self.solver_moves[-1]):
+            self.solver_moves.pop()
+        else:
+            self.solver_moves.append(action)
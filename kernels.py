@@ -0,0 +1,320 @@
+
+"""
+Kernels for searches that touch one state at a time, where the overhead of
+every NumPy call adds up: applying a move to a state, the percentage solved
+heuristic of BestFirstSearch, and the inner loop of an IDA* search. Also
+applying a whole padded move sequence to each of a batch of states, for
+verifying solutions in bulk.
+
+Compiled with Numba if it is installed, otherwise the same functions run
+with NumPy, giving identical results. JIT tells which one is used, setting
+the environment variable CUBE_NO_JIT turns compiling off. States are flat
+uint8 arrays of 6*N*N stickers in cube_state order, moves are sticker
+permutations as in state_engine.move_tables.
+
+python kernels.py compares the two implementations.
+"""
+import os
+import time
+import numpy as np
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+JIT = numba is not None and 'CUBE_NO_JIT' not in os.environ
+
+
+
+def _apply_move_loops(state, table, out):
+    for i in range(table.shape[0]):
+        out[i] = state[table[i]]
+
+
+def _apply_move_numpy(state, table, out):
+    np.take(state, table, out=out)
+
+
+def _percent_solved_loops(state, N):
+    total_equal = 0
+    center = N // 2
+    for f in range(6):
+        center_val = state[f*N*N + center*N + center]
+        for i in range(f*N*N, (f + 1)*N*N):
+            if state[i] == center_val:
+                total_equal += 1
+    return float(total_equal) / state.shape[0]
+
+
+def _percent_solved_numpy(state, N):
+    faces = state.reshape(6, N*N)
+    center = N // 2
+    return float(np.count_nonzero(faces == faces[:, center*N + center, None])) / state.shape[0]
+
+
+def percent_solved_batch(states, N):
+    """percent_solved of every state of a (B, 6*N*N) array, with NumPy in one call."""
+    faces = states.reshape(len(states), 6, N*N)
+    center = N // 2
+    equal = np.count_nonzero(faces == faces[:, :, center*N + center, None], axis=(1, 2))
+    return equal.astype(float) / states.shape[1]
+
+
+def _is_solved_loops(state, N):
+    for f in range(6):
+        for i in range(f*N*N + 1, (f + 1)*N*N):
+            if state[i] != state[f*N*N]:
+                return False
+    return True
+
+
+def _is_solved_numpy(state, N):
+    faces = state.reshape(6, N*N)
+    return bool(np.all(faces == faces[:, :1]))
+
+
+def _wrong_stickers_loops(state, centers, N):
+    wrong = 0
+    for f in range(6):
+        for i in range(f*N*N, (f + 1)*N*N):
+            if state[i] != state[centers[f]]:
+                wrong += 1
+    return wrong
+
+
+def _wrong_stickers_numpy(state, centers, N):
+    return int(np.count_nonzero(state.reshape(6, N*N) != state[centers][:, None]))
+
+
+def _apply_moves_rows_loops(states, codes, tables, out):
+    pad = tables.shape[0] - 1
+    n = states.shape[1]
+    # Two state buffers, each move gathers from one into the other
+    buffers = np.empty((2, n), dtype=np.uint8)
+    for row in range(states.shape[0]):
+        current = 0
+        for i in range(n):
+            buffers[0, i] = states[row, i]
+        for k in range(codes.shape[1]):
+            code = codes[row, k]
+            if code >= pad:
+                continue
+            for i in range(n):
+                buffers[1 - current, i] = buffers[current, tables[code, i]]
+            current = 1 - current
+        for i in range(n):
+            out[row, i] = buffers[current, i]
+
+
+# Moves the NumPy version applies per gather, through tables of every
+# sequence of MOVES_PER_GATHER moves (13**3 for a 3x3 cube)
+MOVES_PER_GATHER = 3
+
+
+def _apply_moves_rows_numpy(states, codes, tables, out):
+    M, n = tables.shape
+    tables = tables.astype(np.intp)
+    grouped = tables
+    for _ in range(MOVES_PER_GATHER - 1):
+        grouped = grouped[:, tables].reshape(-1, n)
+    # Codes past the pad row act as padding too
+    L = -(-codes.shape[1] // MOVES_PER_GATHER) * MOVES_PER_GATHER
+    padded = np.full((len(codes), L), M - 1, dtype=np.intp)
+    np.minimum(codes, M - 1, out=padded[:, :codes.shape[1]])
+    flat = states
+    offsets = (np.arange(len(states)) * n)[:, None]
+    for k in range(0, L, MOVES_PER_GATHER):
+        group = padded[:, k]
+        for j in range(1, MOVES_PER_GATHER):
+            group = group * M + padded[:, k + j]
+        index = grouped[group]
+        index += offsets
+        flat = flat.reshape(-1)[index]
+    out[...] = flat
+
+
+# Public kernels, compiled loops or NumPy:
+#   apply_move(state, table, out)           out = state with move table applied
+#   percent_solved(state, N)                as BestFirstSearch.get_value
+#   is_solved(state, N)                     every face has one color
+#   wrong_stickers(state, centers, N)       stickers not matching their center
+#   apply_moves_rows(states, codes, tables, out)
+#                                           out[b] = states[b] (B, 6*N*N) with the
+#                                           move codes codes[b] applied, tables as
+#                                           state_engine.move_code_tables, the last
+#                                           row (and any code past it) is padding
+if JIT:
+    apply_move = numba.njit(cache=True)(_apply_move_loops)
+    percent_solved = numba.njit(cache=True)(_percent_solved_loops)
+    is_solved = numba.njit(cache=True)(_is_solved_loops)
+    wrong_stickers = numba.njit(cache=True)(_wrong_stickers_loops)
+    apply_moves_rows = numba.njit(cache=True)(_apply_moves_rows_loops)
+else:
+    apply_move = _apply_move_numpy
+    percent_solved = _percent_solved_numpy
+    is_solved = _is_solved_numpy
+    wrong_stickers = _wrong_stickers_numpy
+    apply_moves_rows = _apply_moves_rows_numpy
+
+
+def _ida_star_loop(start, tables, inverse, centers, per_move, N, first_bound, max_depth, path):
+    """
+    Iterative deepening A* from start, with explicit stack. Writes the move
+    indices of a shortest solution up to max_depth into path, returns its
+    length (-1 if none) and the number of nodes generated.
+
+    The bound is raised one move at a time from first_bound, children are pruned if depth
+    plus heuristic is above it. The heuristic is the number of stickers not
+    matching their face center over the most stickers one move changes,
+    rounded up, which never overestimates (0 if there are no fixed centers,
+    centers[0] < 0).
+
+    States stay flat uint8 rather than packed like the other searches: IDA*
+    keeps no visited set, only the depth + 1 states of the current path, so
+    packing saves no memory and would add a pack and unpack per node, while
+    a flat state makes each move a single gather through its table.
+    """
+    n_moves = tables.shape[0]
+    states = np.empty((max_depth + 1, start.shape[0]), dtype=np.uint8)
+    states[0] = start
+    next_move = np.zeros(max_depth + 1, dtype=np.int64)
+    nodes = 0
+    if is_solved(start, N):
+        return 0, nodes
+    bound = max(1, first_bound)
+    if centers[0] >= 0:
+        bound = max(bound, -(-wrong_stickers(start, centers, N) // per_move))
+    while bound <= max_depth:
+        depth = 0
+        next_move[0] = 0
+        while depth >= 0:
+            if next_move[depth] == n_moves:
+                depth -= 1
+                continue
+            move = next_move[depth]
+            next_move[depth] += 1
+            if depth > 0 and move == inverse[path[depth - 1]]:
+                continue
+            apply_move(states[depth], tables[move], states[depth + 1])
+            nodes += 1
+            path[depth] = move
+            if is_solved(states[depth + 1], N):
+                return depth + 1, nodes
+            estimate = 0
+            if centers[0] >= 0:
+                estimate = -(-wrong_stickers(states[depth + 1], centers, N) // per_move)
+            if depth + 1 < bound and depth + 1 + estimate <= bound:
+                depth += 1
+                next_move[depth] = 0
+        bound += 1
+    return -1, nodes
+
+
+if JIT:
+    _ida_star_loop = numba.njit(cache=True)(_ida_star_loop)
+
+
+def inverse_moves(tables):
+    """Index of the move undoing every move of tables, -1 if not in tables."""
+    inverse = np.full(len(tables), -1, dtype=np.intp)
+    inverse_tables = np.argsort(tables, axis=1)
+    for m in range(len(tables)):
+        match = np.nonzero(np.all(tables == inverse_tables[m], axis=1))[0]
+        if len(match) > 0:
+            inverse[m] = match[0]
+    return inverse
+
+
+def ida_star(cube_state, tables, max_depth, inverse=None, deadline=None):
+    """
+    Shortest sequence of moves (indices into tables, an (M, 6*N*N) array of
+    move permutations) solving cube_state within max_depth moves, None if
+    there is none, and the number of nodes generated. inverse[m] is the
+    index of the move undoing move m (-1 if not in tables), children undoing
+    their parent move are skipped.
+
+    With a deadline (time.perf_counter()) every bound is searched by its own
+    kernel call, and None is returned once the deadline has passed between
+    two of them.
+    """
+    N = cube_state.shape[1]
+    tables = np.ascontiguousarray(tables, dtype=np.intp)
+    if inverse is None:
+        inverse = inverse_moves(tables)
+    # Face centers do not move with outer layer turns of odd cubes
+    centers = np.full(6, -1, dtype=np.intp)
+    if N % 2 == 1:
+        centers[:] = np.arange(6)*N*N + (N//2)*N + N//2
+    per_move = max(1, int(np.max(np.count_nonzero(tables != np.arange(tables.shape[1]), axis=1))))
+    path = np.zeros(max(max_depth, 1), dtype=np.intp)
+    start = cube_state.reshape(-1).astype(np.uint8)
+    inverse = np.asarray(inverse, dtype=np.intp)
+    if deadline is None:
+        length, nodes = _ida_star_loop(start, tables, inverse, centers, per_move, N, 1, max_depth, path)
+    else:
+        length, nodes = -1, 0
+        for bound in range(1, max_depth + 1):
+            if time.perf_counter() > deadline:
+                break
+            length, bound_nodes = _ida_star_loop(start, tables, inverse, centers, per_move, N, bound, bound, path)
+            nodes += bound_nodes
+            if length >= 0:
+                break
+    if length < 0:
+        return None, nodes
+    return list(path[:length]), nodes
+
+
+if __name__ == '__main__':
+    import time
+    import random
+    import argparse
+
+    import state_engine
+    from state_engine import POSSIBLE_MOVES, random_scramble, scrambled_state
+
+    parser = argparse.ArgumentParser(description='Time the kernels, compiled and with NumPy')
+    parser.add_argument('--size', '-n', type=int, default=3)
+    parser.add_argument('--depth', '-d', type=int, default=5, help='scramble depth of the IDA* solves')
+    parser.add_argument('--count', '-c', type=int, default=5, help='number of IDA* solves')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    N = args.size
+    moves = state_engine.encode_moves(''.join(state_engine.MOVES))
+    tables = state_engine.move_code_tables(N)[moves]
+    rng = random.Random(args.seed)
+    scrambles = [random_scramble(rng, args.depth, POSSIBLE_MOVES) for _ in range(args.count)]
+    states = [scrambled_state(scramble, N) for scramble in scrambles]
+    flat = states[0].reshape(-1).copy()
+    out = np.empty_like(flat)
+
+    def per_call(function, *args, repeat=20000):
+        function(*args)
+        start = time.perf_counter()
+        for _ in range(repeat):
+            function(*args)
+        return 1e6 * (time.perf_counter() - start) / repeat
+
+    print("Kernels compiled with Numba" if JIT else
+          "Numba not installed (or CUBE_NO_JIT set), kernels run with NumPy")
+    variants = [('numpy', _apply_move_numpy, _percent_solved_numpy)]
+    if JIT:
+        variants.append(('numba', apply_move, percent_solved))
+    for name, apply_kernel, percent_kernel in variants:
+        print("%-24s %10.2f us" % ('apply_move ' + name, per_call(apply_kernel, flat, tables[0], out)))
+        print("%-24s %10.2f us" % ('percent_solved ' + name, per_call(percent_kernel, flat, N)))
+        assert percent_kernel(flat, N) == _percent_solved_loops(flat, N)
+
+    ida_star(states[0], tables, 1)
+    start = time.perf_counter()
+    total_nodes = 0
+    lengths = []
+    for cube_state in states:
+        solution, nodes = ida_star(cube_state, tables, args.depth)
+        total_nodes += nodes
+        lengths.append(len(solution))
+    elapsed = time.perf_counter() - start
+    print("%-24s %10.1f ms, %d nodes, %.0f nodes/s, solution lengths %s" % (
+          'IDA* ' + ('numba' if JIT else 'numpy'), 1000*elapsed, total_nodes, total_nodes/elapsed, lengths))
@@ -0,0 +1,92 @@
+
+"""
+Load test of the solve service, start it first with python main.py serve.
+
+Opens --concurrency keep alive connections, and sends --requests solve
+requests over them as fast as answers come back. Scrambles are drawn from a
+pool of --unique seeded scrambles, so the pool size sets how often the
+solution cache is hit. Prints latency percentiles and throughput.
+"""
+import json
+import time
+import random
+import asyncio
+import argparse
+import numpy as np
+
+from state_engine import random_scramble
+
+
+async def post(reader, writer, body):
+    """Sends one POST /solve, returns status and decoded response."""
+    writer.write(b'POST /solve HTTP/1.1\r\nHost: localhost\r\nContent-Type: application/json\r\n'
+                 b'Content-Length: %d\r\n\r\n' % len(body) + body)
+    await writer.drain()
+    status = int((await reader.readline()).split()[1])
+    length = 0
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        if name.lower() == 'content-length':
+            length = int(value)
+    return status, json.loads(await reader.readexactly(length))
+
+
+async def client(args, requests, results):
+    """One connection, takes requests from the shared list until it is empty."""
+    if args.unix is not None:
+        reader, writer = await asyncio.open_unix_connection(args.unix)
+    else:
+        reader, writer = await asyncio.open_connection(args.host, args.port)
+    while len(requests) > 0:
+        body = requests.pop()
+        start = time.perf_counter()
+        status, response = await post(reader, writer, body)
+        results.append((time.perf_counter() - start, status, response))
+    writer.close()
+
+
+async def load_test(args):
+    rng = random.Random(args.seed)
+    scrambles = [random_scramble(rng, args.depth) for _ in range(args.unique)]
+    requests = []
+    for _ in range(args.requests):
+        request = dict(scramble=rng.choice(scrambles), solver=args.solver)
+        if args.budget is not None:
+            request['budget'] = args.budget
+        requests.append(json.dumps(request).encode())
+
+    results = []
+    start = time.perf_counter()
+    await asyncio.gather(*[client(args, requests, results) for _ in range(args.concurrency)])
+    elapsed = time.perf_counter() - start
+
+    latency = 1000*np.array([r[0] for r in results])
+    status = np.array([r[1] for r in results])
+    responses = [r[2] for r in results]
+    print("%d requests over %d connections in %.2f s" % (len(results), args.concurrency, elapsed))
+    print("throughput  %10.1f requests/s" % (len(results)/elapsed))
+    print("latency ms  p50 %.2f  p99 %.2f  max %.2f" % (np.percentile(latency, 50),
+          np.percentile(latency, 99), latency.max()))
+    print("solved %d  timed out %d  errors %d  cached %d  mean batch %.1f" % (
+          sum(r.get('solved', False) for r in responses), np.sum(status == 504),
+          np.sum((status != 200) & (status != 504)), sum(r.get('cached', False) for r in responses),
+          np.mean([r.get('batch', 0) for r in responses])))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Load test the solve service')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', '-p', type=int, default=8765)
+    parser.add_argument('--unix', '-u', default=None, help='connect to this Unix socket instead of TCP')
+    parser.add_argument('--concurrency', '-c', type=int, default=32, help='number of connections')
+    parser.add_argument('--requests', '-n', type=int, default=2000)
+    parser.add_argument('--unique', type=int, default=500, help='number of different scrambles')
+    parser.add_argument('--depth', '-d', type=int, default=3, help='scramble depth')
+    parser.add_argument('--solver', '-s', default='BFS')
+    parser.add_argument('--budget', '-b', type=float, default=None, help='time budget per request in seconds')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    asyncio.run(load_test(args))
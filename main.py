@@ -1,389 +1,375 @@
 
+"""
+Command line entry point, with a subcommand for each way of using the cube:
+
+    python main.py [gui] [options]          interactive cube and solvers (default)
+    python main.py solve [SCRAMBLE ...]     solve scrambles headless, one per line
+    python main.py scramble [options]       print random scrambles, one per line
+    python main.py bench [options]          time solvers on random scrambles
+    python main.py race SCRAMBLE [options]  run solvers at once, first solution wins
+    python main.py serve [options]          local JSON solve service, see solve_service.py
+
+Only the standard library is imported here, each command imports what it
+needs when it runs. So --help is instant and solve and scramble never load
+matplotlib or the GUI, and can be used in shell pipelines, e.g.
+
+    python main.py scramble -d 3 -c 100 | python main.py solve -s BFS
+"""
+import sys
+import time
 import random
 import argparse
-import functools
-import numpy as np
-from PIL import Image
-from pylab import pause
-from graphviz import Digraph
-from matplotlib import widgets
-import matplotlib.pyplot as plt
 
-import solvers
-from MagicCube import cube_interactive
 
+COMMANDS = ['gui', 'solve', 'scramble', 'bench', 'race', 'serve']
+def unknown_solvers(names):
+    import solvers
+    unknown = [name for name in names if name not in solvers.SOLVERS]
+    if len(unknown) > 0:
+        print("Unknown solver %s, choose from %s" % (', '.join(unknown), ', '.join(solvers.SOLVERS)), file=sys.stderr)
+    return len(unknown) > 0
 
 
-class ModifiedCube(cube_interactive.Cube):
-    """
-    In order to use added functionailty in ModifiedInteractiveCube, need to
-    override class call in Cube, to instead call ModifiedInteractiveCube.
-
-    """
-    def draw_interactive(self):
-        fig = plt.figure(figsize=(5, 5))
-        self.ModifiedInteractiveCube = ModifiedInteractiveCube(self,args.cube_visuals_off,args.tree_visuals_off,args.depth)
-        fig.add_axes(self.ModifiedInteractiveCube)
-        return fig
+def bad_value_network(args):
+    """Prints why the --value_network can not score these cubes, if it can not."""
+    if args.value_network is None:
+        return False
+    import state_engine
+    import value_network
+    try:
+        value_network.ValueNetwork.load(args.value_network).check(args.size, state_engine.POSSIBLE_MOVES)
+    except ValueError as e:
+        print("%s: %s" % (args.value_network, e), file=sys.stderr)
+        return True
+    return False
 
 
-class ModifiedInteractiveCube(cube_interactive.InteractiveCube):
+def make_solver(name, depth, args):
     """
-    In order to introduce additional solving functionailty and visualization,
-    need to override some class methods
-
+    Solver by name, with a visited filter if asked for with --visited_filter
+    and a value network with --value_network, if the solver takes them.
     """
-
-    def __init__(self, cube, visualize_cube=True, visualize_tree=True, depth=2):
-        super().__init__(cube)
-
-        # Initialize matrices that will track cube position
-        self._setup_cube_state()
-
-        # Track if should visualize cube while solving, and state tree
-        self.visualize_cube = visualize_cube
-        self.visualize_tree = visualize_tree
-
-        # Set depth to search and to shuffle
-        self.depth = depth
-
-        # Initialize variable tracking moves made by solvers
-        self.solver_moves = []
-
-        # Initialize variable of all possible moves of cube
-        self.possible_moves = ['R','D','U','L','B','F']
-
-        # Track if cube has been shuffled or not
-        self.shuffled = False
-
-        # Track number of solvers added, maximum 3
-        self.number_of_solvers = 0
-        self.solvers = []
-
-        # Track buttons/solvers
-        self._ax_solve = []
-        self._btn_solve = []
-
-        # Remove text
-        self.figure.texts[0].set_visible(False)
-
-
-    def _key_press(self,event):
-        """Disallow manual turning."""
-        pass
-
-    def add_solver(self,new_solver_class):
-        """
-        If over max solvers (3) print error, otherwise will instantiate solver,
-        append to solver list and add button.
-        """
-        if self.number_of_solvers > 2:
-            print("Max number of solvers")
-            return
-        # Instantiate
-        new_solver = new_solver_class(self.depth, self.possible_moves.copy())
-        name = new_solver.get_name()
-        # Append
-        self.solvers.append(new_solver)
-        # Make button
-        left = 0.55 - self.number_of_solvers*.2
-        self._ax_solve.append(self.figure.add_axes([left, 0.05, 0.2, 0.075]))
-        self._btn_solve.append(widgets.Button(self._ax_solve[-1], name))
-        self._btn_solve[-1].on_clicked(functools.partial(self._button_clicked, s_id=self.number_of_solvers))
-        # Increment
-        self.number_of_solvers += 1
-
-    def _button_clicked(self, mouse_click, s_id=0, *args):
-        self._solve_cube(s_id)
-
-
-    def _shuffle_cube(self,*args):
-        """
-        Method that shuffles cube for given number of turns (backwards turns
-        only). Also clears solver_moves to track new solver.
-
-        If cube is already shuffled prints error and returns without shuffling
-        again.
-        """
-        if self.shuffled:
-            print("Cube already shuffled")
-            return
-        shuffle_moves = random.choices(self.possible_moves,k=self.depth)
-        for move in shuffle_moves:
-            # Only make backwards moves
-            self.rotate_face(move.lower())
-        self.shuffled = True
-
-        # Clear tracking variables
-        self.solver_moves = []
-        self.color_tree_dict = {}
-
-
-    def _initialize_widgets(self):
-        """
-        Override buttons
-        """
-
-        self._ax_reset = self.figure.add_axes([0.75, 0.05, 0.2, 0.075])
-        self._btn_reset = widgets.Button(self._ax_reset, 'Shuffle Cube')
-        self._btn_reset.on_clicked(self._shuffle_cube)
-
-
-    def _setup_cube_state(self):
-        """
-        Cube's position internally will be stored as 6 3x3 matrics. Where each
-        color is assigned an integer 0-5.
-        """
-        self.cube_state = np.ones((6,3,3))
-        for i in range(6):
-            self.cube_state[i,:,:] *= i
-
-
-    def rotate_face(self, turn, layer=0, steps=10):
-        turns = 1 if turn.isupper() else -1
-        # If selected visualize cube turning
-        if self.visualize_cube:
-            for i in range(steps):
-                self.cube.rotate_face(turn.upper(), turns / steps, layer=layer)
-                self._draw_cube()
-                pause(0.01)
-        # Update internal cube state
-        self.update_cube_state(turn.upper(), np.sign(turns))
-
-    def update_cube_state(self,face,dir):
-        if face == "F":
-            if dir == 1:
-                temp = self.cube_state[4,0,:].copy()
-                self.cube_state[4,0,:] = self.cube_state[3,0,:]
-                self.cube_state[3,0,:] = self.cube_state[2,0,:]
-                self.cube_state[2,0,:] = self.cube_state[1,0,:]
-                self.cube_state[1,0,:] = temp
-                self.cube_state[0] = np.rot90(self.cube_state[0],k=3)
-            else:
-                temp = self.cube_state[4,0,:].copy()
-                self.cube_state[4,0,:] = self.cube_state[1,0,:]
-                self.cube_state[1,0,:] = self.cube_state[2,0,:]
-                self.cube_state[2,0,:] = self.cube_state[3,0,:]
-                self.cube_state[3,0,:] = temp
-                self.cube_state[0] = np.rot90(self.cube_state[0],k=1)
-
-        if face == "L":
-            if dir == 1:
-                temp = self.cube_state[0,:,0].copy()
-                self.cube_state[0,:,0] = np.flip(self.cube_state[2,:,2])
-                self.cube_state[2,:,2] = self.cube_state[5,:,2]
-                self.cube_state[5,:,2] = np.flip(self.cube_state[4,:,0])
-                self.cube_state[4,:,0] = temp
-                self.cube_state[1] = np.rot90(self.cube_state[1],k=3)
-            else:
-                temp = self.cube_state[0,:,0].copy()
-                self.cube_state[0,:,0] = self.cube_state[4,:,0]
-                self.cube_state[4,:,0] = np.flip(self.cube_state[5,:,2])
-                self.cube_state[5,:,2] = self.cube_state[2,:,2]
-                self.cube_state[2,:,2] = np.flip(temp)
-                self.cube_state[1] = np.rot90(self.cube_state[1],k=1)
-        if face == "U":
-            if dir == 1:
-                temp = self.cube_state[0,0,:].copy()
-                self.cube_state[0,0,:] = self.cube_state[3,:,2]
-                self.cube_state[3,:,2] = self.cube_state[5,0,:]
-                self.cube_state[5,0,:] = np.flip(self.cube_state[1,:,0])
-                self.cube_state[1,:,0] = np.flip(temp)
-                self.cube_state[2] = np.rot90(self.cube_state[2],k=3)
-            else:
-                temp = self.cube_state[0,0,:].copy()
-                self.cube_state[0,0,:] = np.flip(self.cube_state[1,:,0])
-                self.cube_state[1,:,0] = np.flip(self.cube_state[5,0,:])
-                self.cube_state[5,0,:] = self.cube_state[3,:,2]
-                self.cube_state[3,:,2] = temp
-                self.cube_state[2] = np.rot90(self.cube_state[2],k=1)
-
-        if face == "R":
-            if dir == 1:
-                temp = self.cube_state[0,:,2].copy()
-                self.cube_state[0,:,2] = self.cube_state[4,:,2]
-                self.cube_state[4,:,2] = np.flip(self.cube_state[5,:,0])
-                self.cube_state[5,:,0] = self.cube_state[2,:,0]
-                self.cube_state[2,:,0] = np.flip(temp)
-                self.cube_state[3] = np.rot90(self.cube_state[3],k=3)
-
-            else:
-                temp = self.cube_state[0,:,2].copy()
-                self.cube_state[0,:,2] = np.flip(self.cube_state[2,:,0])
-                self.cube_state[2,:,0] = self.cube_state[5,:,0]
-                self.cube_state[5,:,0] = np.flip(self.cube_state[4,:,2])
-                self.cube_state[4,:,2] = temp
-                self.cube_state[3] = np.rot90(self.cube_state[3],k=1)
-
-        if face == "D":
-            if dir == 1:
-                temp = self.cube_state[0,2,:].copy()
-                self.cube_state[0,2,:] = np.flip(self.cube_state[1,:,2])
-                self.cube_state[1,:,2] = np.flip(self.cube_state[5,2,:])
-                self.cube_state[5,2,:] = self.cube_state[3,:,0]
-                self.cube_state[3,:,0] = temp
-                self.cube_state[4] = np.rot90(self.cube_state[4],k=3)
-
-            else:
-                temp = self.cube_state[0,2,:].copy()
-                self.cube_state[0,2,:] = self.cube_state[3,:,0]
-                self.cube_state[3,:,0] = self.cube_state[5,2,:]
-                self.cube_state[5,2,:] = np.flip(self.cube_state[1,:,2])
-                self.cube_state[1,:,2] = np.flip(temp)
-                self.cube_state[4] = np.rot90(self.cube_state[4],k=1)
-
-        if face == "B":
-            if dir == 1:
-                temp = self.cube_state[2,2,:].copy()
-                self.cube_state[2,2,:] = self.cube_state[3,2,:]
-                self.cube_state[3,2,:] = self.cube_state[4,2,:]
-                self.cube_state[4,2,:] = self.cube_state[1,2,:]
-                self.cube_state[1,2,:] = temp
-                self.cube_state[5] = np.rot90(self.cube_state[5],k=3)
-            else:
-                temp = self.cube_state[2,2,:].copy()
-                self.cube_state[2,2,:] = self.cube_state[1,2,:]
-                self.cube_state[1,2,:] = self.cube_state[4,2,:]
-                self.cube_state[4,2,:] = self.cube_state[3,2,:]
-                self.cube_state[3,2,:] = temp
-                self.cube_state[5] = np.rot90(self.cube_state[5],k=1)
-
-    def _is_solved(self):
-        """
-        Returns boolean if cube is solved or not.
-
-        """
-        solved = True
-        for i in range(6):
-            solved = solved and np.all(self.cube_state[i,:,:] == self.cube_state[i,0,0])
-        return solved
-
-    def _solve_cube(self,solver_num):
-        """
-        Run chosen solver until cube is solved or solver terminates.
-
-        """
-        # Setup second plotting window for tree if visualizing
-        if self.visualize_tree:
-            self.tree_fig = plt.figure(2)
-            self.tree_ax = self.tree_fig.add_subplot(111)
-
-        # Select solver
-        solver = self.solvers[solver_num]
-
-        # Tell solver starting a fresh solve
-        solver.clear()
-
-        # Iterate until solved or solver terminates
-        solver_finished = False
-        while not self._is_solved() and not solver_finished:
-            # Get from solver, and if terminal state
-            action, solver_finished = solver.get_action(self.cube_state)
-            # If solver is out of moves continue and break loop
-            if action is None:
-                continue
-            # Take action on cube
-            self.rotate_face(action)
-            # Update move list, and states
-            self._update_moves(action)
-            # Update tree
-            self._update_tree()
-
-        # If solved update shuffled
-        if self._is_solved():
-            self.shuffled = False
-            print("Solved")
-
-
-    def _make_tree(self,state_tree,node_val,depth):
-        if depth == 0:
-            return
-        # Starting node is special case
-        if node_val == '':
-            if self.color_tree_dict["current"] == node_val:
-                state_tree.node(node_val, "Start",color="yellow",style='filled')
-            else:
-                state_tree.node(node_val,"Start",color="grey",style='filled')
-        for move in self.possible_moves:
-            new_node = node_val+move
-            # If is current node the color yellow
-            if self.color_tree_dict["current"] == new_node:
-                state_tree.node(new_node, new_node,color="yellow",style='filled')
-            elif new_node in self.color_tree_dict:
-                state_tree.node(new_node, new_node,color=self.color_tree_dict[new_node],style='filled')
-            else:
-                state_tree.node(new_node, new_node)
-            state_tree.edge(node_val, new_node)
-            self._make_tree(state_tree,new_node,depth-1)
-        return
-
-
-    def _update_tree(self):
-        """
-        If specified, visualize state tree, with colors indicating the following:
-        Grey -> visited
-        Yellow -> Current state
-        Green -> Solved State
-        """
-        if not self.visualize_tree:
-            return
-        # Set current state to indicate which should be yellow, and set to be grey after
-        self.color_tree_dict["current"] = ''.join(self.solver_moves)
-        self.color_tree_dict[''.join(self.solver_moves)] = "grey"
-        # If solved set to green and make current None so plots as green
-        if self._is_solved():
-            self.color_tree_dict[''.join(self.solver_moves)] = "green"
-            self.color_tree_dict["current"] = None
-        # Now make tree
-        state_tree = Digraph()
-        self._make_tree(state_tree,"",self.depth)
-        # Now plot tree
-        state_tree.render(filename="temp",cleanup=True,format='png')
-        self.tree_ax.clear()
-        im = plt.imread("temp.png")
-        img = self.tree_ax.imshow(im)
-        self.tree_ax.axis('off')
-        plt.draw()
-
-
-    def _update_moves(self,action):
-        """
-        Adds move to list tracking moves made by solver.
-
-        If action and last move are same character, and opposite case then just
-        pop, because they cancel.
-
-        """
-        if len(self.solver_moves)>0 and (action.upper() == self.solver_moves[-1].upper() and not action == self.solver_moves[-1]):
-            self.solver_moves.pop()
-        else:
-            self.solver_moves.append(action)
-
-
-
-
-if __name__ == '__main__':
-    parser = argparse.ArgumentParser(description='Process parameters for Rubiks Cube')
-    parser.add_argument('--depth', '-d', type=int, default=2, help='depth for shuffling and solvers')
-    parser.add_argument('--tree_visuals_off', '-tv', action='store_false')
-    parser.add_argument('--cube_visuals_off', '-cv', action='store_false')
-    args = parser.parse_args()
+    import inspect
+    import solvers
+    import state_engine
+    solver_class = solvers.SOLVERS[name]
+    options = {}
+    if args.visited_filter is not None and 'visited_filter' in inspect.signature(solver_class).parameters:
+        import visited_filter
+        # Sized for every node of the tree
+        capacity = sum(len(state_engine.POSSIBLE_MOVES)**i for i in range(depth + 1))
+        options['visited_filter'] = visited_filter.BloomFilter(capacity, args.visited_filter, args.filter_mb << 20)
+    if args.value_network is not None and 'value_network' in inspect.signature(solver_class).parameters:
+        import value_network
+        options['value_network'] = value_network.ValueNetwork.load(args.value_network)
+    return solver_class(depth, state_engine.POSSIBLE_MOVES.copy(), **options)
+
+
+def format_stats(stats):
+    return ', '.join('%s %.4g' % (name, value) for name, value in stats.items())
+
+
+def run_solve(solver, cube_state, budget=None):
+    """
+    Runs solver headless on cube_state, for at most budget seconds if given,
+    returns all actions taken and if the cube ended up solved.
+    """
+    import state_engine
+    import solve_worker
+    if budget is not None and hasattr(solver, 'time_budget'):
+        # Solvers that search up front stop themselves
+        solver.time_budget = budget
+    actions = []
+    start = time.perf_counter()
+    for action in solve_worker.run_solver(solver, cube_state):
+        actions.append(action)
+        if budget is not None and time.perf_counter() - start > budget:
+            break
+    cube_state = cube_state.copy()
+    for action in actions:
+        state_engine.apply_move(cube_state, action)
+    return actions, state_engine.is_solved(cube_state)
+
+
+def gui(args):
+    import matplotlib.pyplot as plt
+    import solvers
+    from gui import ModifiedCube
 
     # Generate cube object and iteraction
-    rubiks_cube = ModifiedCube(3)
+    rubiks_cube = ModifiedCube(args.size, visualize_cube=args.cube_visuals_off,
+                               visualize_tree=args.tree_visuals_off, depth=args.depth,
+                               fast_render=args.fast_render_off, record_dir=args.record_dir,
+                               seed=args.seed)
     rubiks_cube.draw_interactive()
 
-    # Add solvers, can add custom solvers, see solvers.py
-    rubiks_cube.ModifiedInteractiveCube.add_solver(solvers.DepthFirstSearch)
-    rubiks_cube.ModifiedInteractiveCube.add_solver(solvers.BreadthFirstSearch)
-    rubiks_cube.ModifiedInteractiveCube.add_solver(solvers.BestFirstSearch)
+    # Add solvers, can add custom solvers, see solvers.SOLVERS
+    if unknown_solvers(args.solvers):
+        return 2
+    for name in args.solvers:
+        rubiks_cube.ModifiedInteractiveCube.add_solver(solvers.SOLVERS[name])
 
     # Render everything
     plt.show()
 
 
+def solve(args):
+    """
+    Prints the net moves (actions with backtracking cancelled) that solve each
+    scramble, or an empty line if the solver gave up. Scrambles are taken from
+    the command line, or from stdin if none are given.
+    """
+    import state_engine
+    import solvers
+    import plan_cache
+
+    if unknown_solvers([args.solver]) or bad_value_network(args):
+        return 2
+    if args.checkpoint is not None:
+        import checkpoint
+        if not checkpoint.supported(solvers.SOLVERS[args.solver]):
+            print("%s does not support checkpoints, choose from %s" % (args.solver, ', '.join(
+                  name for name, solver in solvers.SOLVERS.items() if checkpoint.supported(solver))), file=sys.stderr)
+            return 2
+    if args.plan_dir is not None:
+        plan_cache.set_plan_dir(args.plan_dir)
+    scrambles = args.scrambles or (line.strip() for line in sys.stdin)
+    # Solvers only depend on depth, so one per depth
+    solver_for_depth = {}
+    failed = 0
+    for scramble in scrambles:
+        if any(move not in state_engine.MOVE_CODES for move in scramble):
+            print("Invalid scramble %r, moves must be in %s" % (scramble, ''.join(state_engine.MOVES)), file=sys.stderr)
+            return 2
+        depth = args.depth if args.depth is not None else max(len(scramble), 1)
+        if depth not in solver_for_depth:
+            solver_for_depth[depth] = make_solver(args.solver, depth, args)
+
+        start = time.perf_counter()
+        if args.checkpoint is not None:
+            actions, solved, resumed = checkpoint.solve(solver_for_depth[depth], state_engine.scrambled_state(scramble, args.size),
+                                                        args.checkpoint, args.checkpoint_interval)
+            if resumed and args.verbose:
+                print("resumed from %s" % args.checkpoint, file=sys.stderr)
+        else:
+            actions, solved = run_solve(solver_for_depth[depth], state_engine.scrambled_state(scramble, args.size))
+        elapsed = time.perf_counter() - start
+
+        solution = ''.join(state_engine.net_moves(actions)) if solved else ''
+        print(solution, flush=args.verbose)
+        if not solved:
+            failed += 1
+        if args.verbose:
+            print("%s %r: %s, %d actions, %d moves, %.1f ms" % (args.solver, scramble,
+                  'solved' if solved else 'not solved', len(actions), len(solution), elapsed*1000), file=sys.stderr)
+            stats = solver_for_depth[depth].get_stats()
+            if len(stats) > 0:
+                print("    " + format_stats(stats), file=sys.stderr)
+    return 1 if failed > 0 else 0
+
+
+def scramble(args):
+    """
+    Prints scrambles, or with --out writes them to a binary corpus, see
+    scrambles.py. Corpus walks never undo the previous move, --uniform
+    writes uniformly random 3x3 states instead.
+    """
+    if args.out is not None:
+        import scrambles
+        seed = args.seed if args.seed is not None else random.SystemRandom().getrandbits(63)
+        start = time.perf_counter()
+        count = scrambles.write_corpus(args.out, seed, args.count, args.depth, args.size,
+                                       args.moves, args.uniform)
+        print("%d scrambles written to %s (seed %d) in %.1f s" % (count, args.out, seed,
+              time.perf_counter() - start), file=sys.stderr)
+        return 0
+    if args.uniform:
+        print("--uniform needs --out", file=sys.stderr)
+        return 2
+    import state_engine
+    rng = random.Random(args.seed)
+    for _ in range(args.count):
+        print(state_engine.random_scramble(rng, args.depth))
+    return 0
+
+
+def bench(args):
+    """
+    Runs every solver (or the chosen ones) on the same seeded scrambles and
+    prints solve rate, time and actions per solve.
+    """
+    import solvers
+    import plan_cache
+    import state_engine
+
+    rng = random.Random(args.seed)
+    scrambles = [state_engine.random_scramble(rng, args.depth) for _ in range(args.count)]
+    names = args.solver or list(solvers.SOLVERS)
+    if unknown_solvers(names) or bad_value_network(args):
+        return 2
+    if args.plan_dir is not None:
+        plan_cache.set_plan_dir(args.plan_dir)
+
+    print("%-12s %8s %10s %10s %10s" % ('solver', 'solved', 'mean ms', 'max ms', 'actions'))
+    for name in names:
+        solver = make_solver(name, args.depth, args)
+        times, actions, solved = [], 0, 0
+        stats = {}
+        for scramble in scrambles:
+            cube_state = state_engine.scrambled_state(scramble, args.size)
+            start = time.perf_counter()
+            solve_actions, is_solved = run_solve(solver, cube_state, args.budget)
+            times.append(time.perf_counter() - start)
+            actions += len(solve_actions)
+            solved += is_solved
+            for stat, value in solver.get_stats().items():
+                stats[stat] = stats.get(stat, 0) + value/len(scrambles)
+        print("%-12s %4d/%-3d %10.2f %10.2f %10.1f" % (name, solved, len(scrambles),
+              1000*sum(times)/len(times), 1000*max(times), actions/len(scrambles)))
+        if len(stats) > 0:
+            print("    mean " + format_stats(stats))
+    return 0
+
+
+def race(args):
+    """
+    Runs solvers in parallel processes on one scramble, prints each solver's
+    result side by side and the winning solution on the last line.
+    """
+    import solvers
+    import race
+    import state_engine
+
+    names = args.solver or list(solvers.SOLVERS)
+    if unknown_solvers(names):
+        return 2
+    depth = args.depth if args.depth is not None else max(len(args.scramble), 1)
+    start = time.perf_counter()
+    winner, results = race.race(state_engine.scrambled_state(args.scramble, args.size), names, depth,
+                                state_engine.POSSIBLE_MOVES, args.deadline, args.shortest)
+    elapsed = time.perf_counter() - start
+
+    print("%-12s %-10s %10s %10s %10s %-14s %8s" % ('solver', 'status', 'ms', 'actions', 'nodes', 'counted', 'moves'))
+    for result in results:
+        print("%-12s %-10s %10.1f %10s %10d %-14s %8s" % (result['solver'], result['status'], 1000*result['seconds'],
+              '-' if result['actions'] is None else result['actions'], result['nodes'], result['counted'],
+              '-' if result['solution'] is None else len(result['solution'])))
+        if len(result['stats']) > 0:
+            print("    " + format_stats(result['stats']))
+    print("race took %.1f ms" % (1000*elapsed))
+    if winner is None:
+        print()
+        return 1
+    print(winner['solution'])
+    return 0
+
+
+def serve(args):
+    import os
+    import asyncio
+    import solve_service
+
+    service = solve_service.SolveService(workers=args.workers, batch_window=args.batch_window/1000.,
+                                         default_budget=args.budget, max_depth=args.max_depth,
+                                         max_size=args.max_size)
+    try:
+        asyncio.run(solve_service.serve(service, args.host, args.port, args.unix))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        service.close()
+        if args.unix is not None and os.path.exists(args.unix):
+            os.remove(args.unix)
+    return 0
 
 
+def make_parser():
+    parser = argparse.ArgumentParser(description='Process parameters for Rubiks Cube')
+    commands = parser.add_subparsers(dest='command', metavar='{%s}' % ','.join(COMMANDS))
+
+    p = commands.add_parser('gui', help='interactive cube and solvers (default)')
+    p.add_argument('--depth', '-d', type=int, default=2, help='depth for shuffling and solvers')
+    p.add_argument('--size', '-n', type=int, default=3, help='size N of the NxNxN cube')
+    p.add_argument('--tree_visuals_off', '-tv', action='store_false')
+    p.add_argument('--cube_visuals_off', '-cv', action='store_false')
+    p.add_argument('--fast_render_off', '-fr', action='store_false', help='draw cube with one patch per sticker, without blitting')
+    p.add_argument('--record_dir', '-r', default=None, help='save a trace of every solve in this directory, see render_trace.py')
+    p.add_argument('--solvers', '-s', nargs='+', default=['DFS', 'BFS', 'BestFS'], help='names of up to 3 solvers to show buttons for')
+    p.add_argument('--seed', type=int, default=None, help='seed of the shuffles, for repeatable runs')
+    p.set_defaults(run=gui)
+
+    p = commands.add_parser('solve', help='solve scrambles headless and print solutions')
+    p.add_argument('scrambles', nargs='*', help='scrambles as move strings, e.g. rdU, read from stdin if none given')
+    p.add_argument('--solver', '-s', default='BFS', help='solver name, see solvers.SOLVERS')
+    p.add_argument('--depth', '-d', type=int, default=None, help='solver depth, default is the scramble length')
+    p.add_argument('--size', '-n', type=int, default=3, help='size N of the NxNxN cube')
+    p.add_argument('--verbose', '-v', action='store_true', help='print actions, moves and time of each solve to stderr')
+    p.add_argument('--visited_filter', '-f', type=float, default=None, metavar='FP_RATE',
+                   help='prune nodes already visited with a Bloom filter of this false positive rate, for DFS and BestFS')
+    p.add_argument('--filter_mb', type=int, default=64, help='memory cap of the visited filter in MB')
+    p.add_argument('--value_network', default=None, metavar='NPZ',
+                   help='score states with this network from value_network.py, for BestFS')
+    p.add_argument('--plan_dir', default=None, help='save DFS and BFS plans here and reuse them in later runs')
+    p.add_argument('--checkpoint', default=None, metavar='PATH',
+                   help='save the search state here while solving, and resume from it if it is of the same solve')
+    p.add_argument('--checkpoint_interval', type=float, default=10., help='seconds between checkpoints')
+    p.set_defaults(run=solve)
+
+    p = commands.add_parser('scramble', help='print random scrambles')
+    p.add_argument('--depth', '-d', type=int, default=2, help='number of random turns')
+    p.add_argument('--count', '-c', type=int, default=1)
+    p.add_argument('--seed', type=int, default=None)
+    p.add_argument('--out', '-o', default=None, help='write a binary scramble corpus to this file instead')
+    p.add_argument('--size', '-n', type=int, default=3, help='size N of the NxNxN cube, for --out')
+    p.add_argument('--moves', default='FLURDBflurdb', help='moves of the corpus walks, for --out')
+    p.add_argument('--uniform', action='store_true', help='uniformly random 3x3 states instead of walks, for --out')
+    p.set_defaults(run=scramble)
+
+    p = commands.add_parser('bench', help='time solvers on the same random scrambles')
+    p.add_argument('--solver', '-s', action='append', help='solver name to run, can be repeated, default all')
+    p.add_argument('--depth', '-d', type=int, default=2, help='scramble and solver depth')
+    p.add_argument('--size', '-n', type=int, default=3, help='size N of the NxNxN cube')
+    p.add_argument('--count', '-c', type=int, default=20)
+    p.add_argument('--seed', type=int, default=0)
+    p.add_argument('--budget', '-b', type=float, default=None, help='seconds a solver may take per scramble')
+    p.add_argument('--visited_filter', '-f', type=float, default=None, metavar='FP_RATE',
+                   help='prune nodes already visited with a Bloom filter of this false positive rate, for DFS and BestFS')
+    p.add_argument('--filter_mb', type=int, default=64, help='memory cap of the visited filter in MB')
+    p.add_argument('--value_network', default=None, metavar='NPZ',
+                   help='score states with this network from value_network.py, for BestFS')
+    p.add_argument('--plan_dir', default=None, help='save DFS and BFS plans here and reuse them in later runs')
+    p.set_defaults(run=bench)
+
+    p = commands.add_parser('race', help='run solvers in parallel on one scramble, first solution wins')
+    p.add_argument('scramble', help='scramble as a move string, e.g. rdU')
+    p.add_argument('--solver', '-s', action='append', help='solver name to race, can be repeated, default all')
+    p.add_argument('--depth', '-d', type=int, default=None, help='solver depth, default is the scramble length')
+    p.add_argument('--size', '-n', type=int, default=3, help='size N of the NxNxN cube')
+    p.add_argument('--deadline', '-t', type=float, default=10., help='seconds before all solvers are stopped')
+    p.add_argument('--shortest', action='store_true', help='wait for all solvers until the deadline and take the shortest solution')
+    p.set_defaults(run=race)
+
+    p = commands.add_parser('serve', help='local JSON solve service over HTTP')
+    p.add_argument('--host', default='127.0.0.1')
+    p.add_argument('--port', '-p', type=int, default=8765)
+    p.add_argument('--unix', '-u', default=None, help='serve on this Unix socket path instead of TCP')
+    p.add_argument('--workers', '-w', type=int, default=None, help='search processes, default one per CPU')
+    p.add_argument('--budget', '-b', type=float, default=10., help='default time budget of a request in seconds')
+    p.add_argument('--max_depth', type=int, default=7, help='deepest search a request may ask for')
+    p.add_argument('--max_size', type=int, default=10, help='largest cube size N a request may ask for')
+    p.add_argument('--batch_window', type=float, default=2., help='milliseconds to collect a batch of requests')
+    p.set_defaults(run=serve)
+    return parser
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else list(argv)
+    # No command runs the GUI, so old style python main.py -d 3 still works
+    if len(argv) == 0 or (argv[0] not in COMMANDS and argv[0] not in ('-h', '--help')):
+        argv = ['gui'] + argv
+    args = make_parser().parse_args(argv)
+    return args.run(args)
 
 
- #
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,75 @@
+
+"""
+Cache of the precomputed move plans of DepthFirstSearch and
+BreadthFirstSearch, which only depend on the solver, depth and moves.
+
+A plan is built once per process and kept as a read only uint8 array of
+state_engine move codes, in the order the moves are made. With a plan
+directory (set_plan_dir, or the CUBE_PLAN_DIR environment variable) plans
+are also saved there as .npy files, and later runs memory map them instead
+of building them again.
+"""
+import os
+import threading
+import numpy as np
+
+import state_engine
+
+
+# Part of plan file names, change when the plans a solver builds change
+PLAN_VERSION = 1
+
+_plans = {}
+_lock = threading.Lock()
+_plan_dir = os.environ.get('CUBE_PLAN_DIR')
+
+
+
+def set_plan_dir(path):
+    """Directory plans are saved to and loaded from, None to keep them in memory only."""
+    global _plan_dir
+    if path is not None:
+        os.makedirs(path, exist_ok=True)
+    _plan_dir = path
+
+
+def plan_path(solver, depth, possible_moves):
+    # One hex digit per move code, move letters differ only in case
+    codes = ''.join('%x' % c for c in state_engine.encode_moves(possible_moves))
+    return os.path.join(_plan_dir, 'plan_v%d_%s_d%d_%s.npy' % (PLAN_VERSION, solver, depth, codes))
+
+
+def get_plan(solver, depth, possible_moves, build):
+    """
+    Plan of solver (a name) for depth and possible_moves, build() returns
+    the plan as a list of moves if it is not cached yet.
+    """
+    key = (solver, depth, tuple(possible_moves))
+    with _lock:
+        if key in _plans:
+            return _plans[key]
+        path = plan_path(solver, depth, possible_moves) if _plan_dir is not None else None
+        if path is not None and os.path.exists(path):
+            plan = np.load(path, mmap_mode='r')
+        else:
+            plan = state_engine.encode_moves(build())
+            plan.setflags(write=False)
+            if path is not None:
+                # Written under another name first, so readers never see half a plan
+                partial = '%s.%d.tmp' % (path, os.getpid())
+                with open(partial, 'wb') as f:
+                    np.save(f, plan)
+                os.replace(partial, path)
+        _plans[key] = plan
+        return plan
+
+
+def clear():
+    """Drops all plans kept in memory, saved plans stay."""
+    with _lock:
+        _plans.clear()
+
+
+def nbytes():
+    """Memory of the plans built or loaded by this process."""
+    return sum(plan.nbytes for plan in _plans.values())
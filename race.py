@@ -0,0 +1,171 @@
+
+"""
+Race mode, runs several solvers on the same cube state at once, each in its
+own process with its own copy of the state.
+
+The race ends at the first valid solution, or with shortest=True when every
+solver is done or the deadline passes, taking the shortest solution found.
+Solvers still running then are terminated. Every solver reports its time,
+actions and nodes, so strategies can be compared side by side on one
+scramble. Nodes are the solver's own count of nodes searched where it has
+one (see NODE_STATS), get_action calls otherwise.
+"""
+import time
+import queue
+import multiprocessing
+
+import numpy as np
+
+import solvers
+import state_engine
+import solve_worker
+
+
+# Seconds a race may take if no deadline is given
+DEADLINE = 10.
+# Node counters in shared memory are updated every NODE_REPORT get_action
+# calls, so terminated solvers still report roughly how far they got
+NODE_REPORT = 256
+# Extra seconds to wait for results past the deadline, solvers stop
+# themselves at the deadline unless they are still building their plan,
+# those searching inside one get_action call through their time_budget
+GRACE = 1.
+# get_stats keys of node counts, first one a solver has is reported. Solvers
+# like IDA* search inside one get_action call, so calls compare nothing
+NODE_STATS = ('nodes', 'expanded', 'nodes_expanded')
+
+
+def node_count(stats, calls):
+    """Nodes a solver searched and what they count, a NODE_STATS key or 'calls'."""
+    for key in NODE_STATS:
+        if key in stats:
+            return stats[key], key
+    return calls, 'calls'
+
+
+def run_racer(index, name, depth, possible_moves, state_bytes, N, deadline, results, nodes):
+    """
+    Runs in a race process. Solves the cube state with solver name until it
+    is solved, the solver terminates or time.monotonic() passes deadline, and
+    puts a result dict into the results queue.
+    """
+    start = time.perf_counter()
+    solver = solvers.SOLVERS[name](depth, list(possible_moves))
+    cube_state = np.frombuffer(state_bytes, dtype=np.uint8).reshape(6, N, N).copy()
+    actions = []
+    n_nodes = 0
+    solver.clear()
+    solve_worker.limit_to_deadline(solver, getattr(solver, 'time_budget', None), deadline)
+    solver_finished = False
+    timed_out = False
+    while not state_engine.is_solved(cube_state) and not solver_finished:
+        if time.monotonic() > deadline:
+            timed_out = True
+            break
+        action, solver_finished = solver.get_action(cube_state)
+        n_nodes += 1
+        if n_nodes % NODE_REPORT == 0:
+            nodes[index] = n_nodes
+        if action is None:
+            continue
+        state_engine.apply_move(cube_state, action)
+        actions.append(action)
+    nodes[index] = n_nodes
+    solved = state_engine.is_solved(cube_state)
+    # Solvers stopped by their time_budget finish without a solution
+    timed_out = timed_out or time.monotonic() > deadline
+    stats = solver.get_stats()
+    n_nodes, counted = node_count(stats, n_nodes)
+    results.put(dict(index=index, solver=name, solution=''.join(state_engine.net_moves(actions)) if solved else None,
+                     status='solved' if solved else 'timed out' if timed_out else 'not solved',
+                     seconds=time.perf_counter() - start, actions=len(actions), nodes=n_nodes,
+                     counted=counted, stats=stats))
+
+
+def is_valid(cube_state, solution):
+    """If the moves of solution solve cube_state."""
+    cube_state = cube_state.copy()
+    for move in solution:
+        state_engine.apply_move(cube_state, move)
+    return state_engine.is_solved(cube_state)
+
+
+def race(cube_state, names, depth, possible_moves, deadline=DEADLINE, shortest=False):
+    """
+    Races the solvers names on cube_state for at most deadline seconds.
+
+    Returns the winning result (None if no solver found a valid solution)
+    and the results of all solvers in names order, names can repeat. A
+    result is a dict of solver, solution (net moves, None if not solved),
+    status, seconds, actions, nodes, counted (what nodes counts, see
+    node_count) and stats. Solvers that did not report count get_action
+    calls. Status is 'won', 'solved', 'not solved',
+    'timed out', 'cancelled' (terminated after the race was decided),
+    'invalid' (solution that does not solve the cube) or 'crashed'.
+    """
+    start = time.perf_counter()
+    end = time.monotonic() + deadline
+    N = cube_state.shape[1]
+    results = multiprocessing.Queue()
+    nodes = multiprocessing.Array('q', len(names), lock=False)
+    racers = [multiprocessing.Process(target=run_racer, daemon=True,
+                                      args=(i, name, depth, possible_moves, cube_state.tobytes(),
+                                            N, end, results, nodes))
+              for i, name in enumerate(names)]
+    for racer in racers:
+        racer.start()
+
+    # 1. Collect results until one is valid (or all are in for shortest),
+    # keyed by racer index
+    reported = {}
+    # Valid results in the order they came in
+    valid = []
+
+    def report(result):
+        if result['solution'] is not None and not is_valid(cube_state, result['solution']):
+            result['status'] = 'invalid'
+            result['solution'] = None
+        reported[result['index']] = result
+        if result['solution'] is not None:
+            valid.append(result)
+
+    while len(reported) < len(names):
+        try:
+            result = results.get(timeout=0.05)
+        except queue.Empty:
+            crashed = [i for i, racer in enumerate(racers)
+                       if i not in reported and racer.exitcode not in (None, 0)]
+            for i in crashed:
+                reported[i] = dict(index=i, solver=names[i], solution=None, status='crashed',
+                                   seconds=time.perf_counter() - start, actions=0,
+                                   nodes=nodes[i], counted='calls', stats={})
+            if time.monotonic() > end + GRACE:
+                break
+            continue
+        report(result)
+        if valid and not shortest:
+            break
+
+    # 2. Results already queued by racers that finished as the race was
+    # decided, then cancel the rest
+    while len(reported) < len(names):
+        try:
+            result = results.get(timeout=0.01)
+        except queue.Empty:
+            break
+        report(result)
+    status = 'timed out' if time.monotonic() > end else 'cancelled'
+    for i, racer in enumerate(racers):
+        if i not in reported and racer.is_alive():
+            racer.terminate()
+    for i, racer in enumerate(racers):
+        racer.join()
+        if i not in reported:
+            reported[i] = dict(index=i, solver=names[i], solution=None, status=status,
+                               seconds=time.perf_counter() - start, actions=None,
+                               nodes=nodes[i], counted='calls', stats={})
+    winner = None
+    if valid:
+        winner = min(valid, key=lambda result: len(result['solution'])) if shortest else valid[0]
+        winner['status'] = 'won'
+    return winner, [reported[i] for i in range(len(names))]
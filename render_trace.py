@@ -0,0 +1,193 @@
+
+import os
+import glob
+import shutil
+import argparse
+import tempfile
+import subprocess
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+
+# Offline rendering never needs a window
+import matplotlib
+matplotlib.use('Agg')
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from PIL import Image
+
+import state_engine
+import tree_view
+import cube_render
+from solve_trace import Trace
+from cube_geometry import LayeredCube
+from MagicCube.projection import Quaternion
+
+
+
+# Same view of the cube as the GUI
+CUBE_VIEW = (0, 0, 10)
+CUBE_ROTATION = Quaternion.from_v_theta((1, -1, 0), -np.pi / 6)
+
+
+class TraceRenderer():
+
+    """
+    Renders frames of a trace with Agg, without any GUI.
+
+    Frame 0 is the start of the solve, then every move takes frames_per_turn
+    frames, then the last frame is held for hold_frames frames. Frames must be
+    rendered in increasing order, moves before the first frame are applied
+    without drawing, so any range of frames can be rendered on its own.
+
+    """
+
+    def __init__(self, trace, view='both', frames_per_turn=5, hold_frames=10, dpi=100):
+        self.trace = trace
+        self.frames_per_turn = frames_per_turn
+        self.n_frames = 1 + len(trace.moves)*frames_per_turn + hold_frames
+
+        # Figure with cube and/or tree
+        width = 10 if view == 'both' else 5
+        self.fig = Figure(figsize=(width, 5), dpi=dpi)
+        FigureCanvasAgg(self.fig)
+        self.renderer = None
+        self.tree_view = None
+        if view in ('cube', 'both'):
+            rect = [0, 0, 0.5, 1] if view == 'both' else [0, 0, 1, 1]
+            cube_ax = self.fig.add_axes(rect, aspect='equal', xlim=(-2.0, 2.0),
+                                        ylim=(-2.0, 2.0), frameon=False)
+            cube_ax.axis('off')
+            self.cube = LayeredCube(trace.size)
+            for move in trace.scramble:
+                self.cube.rotate_face(move.upper(), 1 if move.isupper() else -1)
+            self.renderer = cube_render.CubeRenderer(cube_ax, self.cube, blit=False)
+        if view in ('tree', 'both'):
+            rect = [0.5, 0, 0.5, 1] if view == 'both' else [0, 0, 1, 1]
+            tree_ax = self.fig.add_axes(rect)
+            self.tree_view = tree_view.make_tree_view(tree_ax, trace.depth, trace.possible_moves)
+
+        # Solve progress, moves_applied moves fully turned, turn_steps steps
+        # of next move turned
+        self.cube_state = trace.initial_state()
+        self.solver_moves = []
+        self.moves_applied = 0
+        self.turn_steps = 0
+        self._update_tree()
+
+    def _update_tree(self):
+        if self.tree_view is not None:
+            solved = state_engine.is_solved(self.cube_state)
+            self.tree_view.update(''.join(self.solver_moves), solved=solved, redraw=False)
+
+    def _start_move(self, action):
+        """Numeric state and tree are updated when a turn starts, as in GUI."""
+        state_engine.apply_move(self.cube_state, action)
+        if len(self.solver_moves) > 0 and action.swapcase() == self.solver_moves[-1]:
+            self.solver_moves.pop()
+        else:
+            self.solver_moves.append(action)
+        self._update_tree()
+
+    def _turn(self, steps):
+        action = self.trace.moves[self.moves_applied]
+        if self.turn_steps == 0:
+            self._start_move(action)
+        if self.renderer is not None:
+            turns = 1 if action.isupper() else -1
+            self.cube.rotate_face(action.upper(), turns * steps / self.frames_per_turn)
+        self.turn_steps += steps
+        if self.turn_steps == self.frames_per_turn:
+            self.moves_applied += 1
+            self.turn_steps = 0
+
+    def seek(self, frame):
+        """
+        Advance to frame without drawing. Frame k > 0 is k turn steps into
+        the solve, so only need to turn until that many steps are done.
+        """
+        target = min(frame, len(self.trace.moves)*self.frames_per_turn)
+        done = self.moves_applied*self.frames_per_turn + self.turn_steps
+        while done < target:
+            steps = min(self.frames_per_turn - self.turn_steps, target - done)
+            self._turn(steps)
+            done += steps
+
+    def render(self, frame):
+        """Returns frame as RGB uint8 array."""
+        self.seek(frame)
+        if self.tree_view is not None:
+            # Syncs node colors for the full draw below
+            self.tree_view.redraw()
+        if self.renderer is not None:
+            self.renderer.draw(CUBE_ROTATION, CUBE_VIEW)
+        else:
+            self.fig.canvas.draw()
+        return np.asarray(self.fig.canvas.buffer_rgba())[:, :, :3].copy()
+
+
+def _render_range(trace_path, start, end, frame_dir, options):
+    """Process pool task, renders frames [start, end) to PNG files."""
+    renderer = TraceRenderer(Trace.load(trace_path), **options)
+    for frame in range(start, end):
+        image = Image.fromarray(renderer.render(frame))
+        # Frames are temporary, favour speed over size
+        image.save(os.path.join(frame_dir, "frame_%07d.png" % frame), compress_level=1)
+    return end - start
+
+
+def encode_gif(frame_paths, out_path, fps):
+    """GIF with Pillow, keeps all frames in memory, so prefer MP4 for long traces."""
+    frames = [Image.open(p) for p in frame_paths]
+    frames[0].save(out_path, save_all=True, append_images=frames[1:],
+                   duration=int(1000/fps), loop=0)
+
+
+def encode_mp4(frame_dir, out_path, fps):
+    """MP4 with ffmpeg, which streams frames from disk."""
+    ffmpeg = shutil.which('ffmpeg')
+    if ffmpeg is None:
+        raise RuntimeError("ffmpeg not found, install it or render to .gif")
+    subprocess.run([ffmpeg, '-y', '-loglevel', 'error', '-framerate', str(fps),
+                    '-i', os.path.join(frame_dir, 'frame_%07d.png'),
+                    '-pix_fmt', 'yuv420p', '-vf', 'pad=ceil(iw/2)*2:ceil(ih/2)*2',
+                    out_path], check=True)
+
+
+def render_trace(trace_path, out_path, workers=None, chunk_size=200, fps=30, **options):
+    """
+    Renders trace to a GIF or MP4 (chosen by out_path extension). Frame
+    ranges of chunk_size frames are rendered in parallel by a process pool
+    of given number of workers (default one per CPU).
+    """
+    trace = Trace.load(trace_path)
+    n_frames = TraceRenderer(trace, **options).n_frames
+    with tempfile.TemporaryDirectory() as frame_dir:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            tasks = [pool.submit(_render_range, trace_path, start,
+                                 min(start + chunk_size, n_frames), frame_dir, options)
+                     for start in range(0, n_frames, chunk_size)]
+            for task in tasks:
+                task.result()
+        if out_path.endswith('.gif'):
+            encode_gif(sorted(glob.glob(os.path.join(frame_dir, 'frame_*.png'))), out_path, fps)
+        else:
+            encode_mp4(frame_dir, out_path, fps)
+    return n_frames
+
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Render a solve trace to GIF or MP4')
+    parser.add_argument('trace', help='trace file recorded with --record_dir')
+    parser.add_argument('out', help='output .gif or .mp4')
+    parser.add_argument('--view', choices=['cube', 'tree', 'both'], default='both')
+    parser.add_argument('--frames_per_turn', type=int, default=5)
+    parser.add_argument('--fps', type=int, default=30)
+    parser.add_argument('--workers', type=int, default=None, help='render processes, default one per CPU')
+    parser.add_argument('--chunk_size', type=int, default=200, help='frames per process pool task')
+    args = parser.parse_args()
+
+    n_frames = render_trace(args.trace, args.out, workers=args.workers,
+                            chunk_size=args.chunk_size, fps=args.fps,
+                            view=args.view, frames_per_turn=args.frames_per_turn)
+    print("Rendered %d frames to %s" % (n_frames, args.out))
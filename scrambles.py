@@ -0,0 +1,235 @@
+
+"""
+Reproducible scrambles and a binary scramble corpus.
+
+Scrambles come from a seeded numpy Generator, either random walks of moves
+that never undo the previous move, or for 3x3 cubes uniformly random
+states of the whole cube group, built from a random permutation and
+orientation of the corner and edge cubies.
+
+A corpus file is a HEADER_SIZE byte header (magic, version, cube size,
+count, how it was made) followed by fixed size records of the packed state
+(state_engine.pack_states) and the scramble move codes, padded with
+state_engine.PAD_MOVE. Corpus opens it with np.memmap, so states are read
+straight from the page cache as they are used.
+"""
+import numpy as np
+
+import state_engine
+
+
+MAGIC = b'CUBESCRM'
+VERSION = 1
+HEADER_SIZE = 64
+HEADER_DTYPE = np.dtype([('magic', 'S8'), ('version', '<u4'), ('N', '<u4'), ('words', '<u4'),
+                         ('max_moves', '<u4'), ('count', '<u8'), ('seed', '<i8'), ('kind', '<u4')])
+# Kinds of scrambles in a corpus
+RANDOM_WALK = 0
+UNIFORM = 1
+# Scrambles made per batch engine call, each chunk has its own random
+# stream from the seed, so the first scrambles of a seed do not depend on
+# how many are made
+CHUNK_SIZE = 4096
+
+
+
+def record_dtype(N, max_moves):
+    """Packed state and moves of one scramble, moves padded to 8 bytes."""
+    return np.dtype([('state', '<u8', (state_engine.packed_words(N),)),
+                     ('moves', 'u1', (-(-max_moves // 8) * 8,))])
+
+
+def random_walks(rng, count, length, moves=state_engine.MOVES):
+    """
+    (count, length) move codes of random walks over moves (move letters),
+    never taking the inverse of the previous move.
+    """
+    codes = state_engine.encode_moves(moves)
+    inverse = state_engine.encode_moves([m.swapcase() for m in moves])
+    # Index in moves of the inverse of every move, -1 if not in moves
+    inverse_index = np.array([list(codes).index(c) if c in codes else -1 for c in inverse])
+    walks = np.empty((count, length), dtype=np.intp)
+    previous = np.full(count, -1)
+    for k in range(length):
+        forbidden = np.where(previous >= 0, inverse_index[np.maximum(previous, 0)], -1)
+        # Draw from the moves left, skipping over the forbidden one
+        n_choices = np.where(forbidden >= 0, len(codes) - 1, len(codes))
+        choice = (rng.random(count) * n_choices).astype(np.intp)
+        choice += (forbidden >= 0) & (choice >= forbidden)
+        walks[:, k] = choice
+        previous = choice
+    return codes[walks]
+
+
+def cubie_slots():
+    """
+    Sticker indices of the 8 corner and 12 edge cubie positions of a 3x3
+    cube, shapes (8, 3) and (12, 2), and of the 6 centers. Each position
+    lists its reference sticker first (the one on U or D, for middle layer
+    edges on F or B), then the others clockwise seen from outside.
+    """
+    centroids = state_engine.sticker_centroids(3)
+    normals = state_engine.FACE_AXES[np.repeat(np.arange(6), 9), 0]
+    cubies = np.clip(np.rint(centroids * 1.5), -1, 1).astype(int)
+    positions = sorted(set(map(tuple, cubies)))
+    corners, edges, centers = [], [], []
+    for position in positions:
+        stickers = [i for i in range(54) if tuple(cubies[i]) == position]
+        # Reference sticker on U/D (y axis), else on F/B (z axis)
+        stickers.sort(key=lambda i: (normals[i, 1] == 0, normals[i, 2] == 0))
+        if len(stickers) == 3:
+            if np.dot(np.cross(normals[stickers[0]], normals[stickers[1]]), position) > 0:
+                stickers[1], stickers[2] = stickers[2], stickers[1]
+            corners.append(stickers)
+        elif len(stickers) == 2:
+            edges.append(stickers)
+        else:
+            centers.append(stickers[0])
+    return np.array(corners), np.array(edges), np.array(centers)
+
+
+def permutation_parity(perms):
+    """Parity (0 even, 1 odd) of every row of a (B, n) array of permutations."""
+    inversions = np.triu(perms[:, :, None] > perms[:, None, :], k=1).sum(axis=(1, 2))
+    return inversions % 2
+
+
+def uniform_states(rng, count):
+    """
+    count uniformly random 3x3 states, shape (count, 6, 3, 3). Corner and
+    edge permutations get equal parity, and twists and flips sum to 0, so
+    every state is reachable by moves.
+    """
+    corners, edges, centers = cubie_slots()
+    corner_perm = np.argsort(rng.random((count, 8)), axis=1)
+    edge_perm = np.argsort(rng.random((count, 12)), axis=1)
+    odd = permutation_parity(corner_perm) != permutation_parity(edge_perm)
+    edge_perm[odd, :2] = edge_perm[odd, 1::-1]
+    twist = rng.integers(3, size=(count, 8))
+    twist[:, -1] = -twist[:, :-1].sum(axis=1) % 3
+    flip = rng.integers(2, size=(count, 12))
+    flip[:, -1] = flip[:, :-1].sum(axis=1) % 2
+
+    solved = state_engine.solved_cube_state(3).reshape(-1)
+    states = np.empty((count, 54), dtype=np.uint8)
+    states[:, centers] = solved[centers]
+    rows = np.arange(count)[:, None]
+    for k in range(3):
+        # Sticker k of the cubie goes to sticker k + twist of the position
+        slots = corners[np.arange(8), (k + twist) % 3]
+        states[rows, slots] = solved[corners[corner_perm, k]]
+    for k in range(2):
+        slots = edges[np.arange(12), (k + flip) % 2]
+        states[rows, slots] = solved[edges[edge_perm, k]]
+    return states.reshape(count, 6, 3, 3)
+
+
+def generate(seed, count, length=20, N=3, moves=state_engine.MOVES, uniform=False):
+    """
+    Generator of (states (B, 6, N, N), move codes (B, length)) chunks of
+    count scrambles. Same seed and arguments give the same scrambles, a
+    larger count only adds scrambles at the end. Uniform states have no
+    moves (length 0).
+    """
+    if uniform and N != 3:
+        raise ValueError('uniform states need the 3x3 cubie model')
+    for chunk, start in enumerate(range(0, count, CHUNK_SIZE)):
+        rng = np.random.default_rng(np.random.SeedSequence(seed, spawn_key=(chunk,)))
+        B = min(CHUNK_SIZE, count - start)
+        if uniform:
+            yield uniform_states(rng, CHUNK_SIZE)[:B], np.empty((B, 0), dtype=np.uint8)
+        else:
+            codes = random_walks(rng, CHUNK_SIZE, length, moves)[:B]
+            solved = np.broadcast_to(state_engine.solved_cube_state(N), (B, 6, N, N))
+            yield state_engine.apply_moves_batch(solved, codes), codes
+
+
+
+class CorpusWriter():
+
+    """
+    Writes scrambles to a corpus file, chunk by chunk. The count in the
+    header is written on close, use as a context manager.
+    """
+
+    def __init__(self, path, N=3, max_moves=20, seed=-1, kind=RANDOM_WALK):
+        self.file = open(path, 'wb')
+        self.header = np.zeros(1, dtype=HEADER_DTYPE)
+        self.header[0] = (MAGIC, VERSION, N, state_engine.packed_words(N), max_moves, 0, seed, kind)
+        self.dtype = record_dtype(N, max_moves)
+        self._write_header()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _write_header(self):
+        self.file.seek(0)
+        self.file.write(self.header.tobytes().ljust(HEADER_SIZE, b'\0'))
+        self.file.seek(0, 2)
+
+    def append(self, cube_states, codes):
+        """Adds a batch of states and their scramble move codes (B, L)."""
+        records = np.zeros(len(cube_states), dtype=self.dtype)
+        records['state'] = state_engine.pack_states(cube_states)
+        records['moves'] = state_engine.PAD_MOVE
+        records['moves'][:, :codes.shape[1]] = codes
+        self.file.write(records.tobytes())
+        self.header['count'] += len(records)
+
+    def close(self):
+        if not self.file.closed:
+            self._write_header()
+            self.file.close()
+
+
+def write_corpus(path, seed, count, length=20, N=3, moves=state_engine.MOVES, uniform=False):
+    """Writes count generated scrambles to path, returns the number written."""
+    with CorpusWriter(path, N, 0 if uniform else length, seed, UNIFORM if uniform else RANDOM_WALK) as writer:
+        for cube_states, codes in generate(seed, count, length, N, moves, uniform):
+            writer.append(cube_states, codes)
+        return int(writer.header['count'][0])
+
+
+
+class Corpus():
+
+    """
+    Read only view of a corpus file through np.memmap. states are the
+    packed states and moves the padded move codes, both (count, ...) views
+    of the file, nothing is read until used.
+    """
+
+    def __init__(self, path):
+        header = np.fromfile(path, dtype=HEADER_DTYPE, count=1)
+        if len(header) == 0 or header['magic'][0] != MAGIC:
+            raise ValueError('%s is not a scramble corpus' % path)
+        if header['version'][0] != VERSION:
+            raise ValueError('%s has corpus version %d, can read %d' % (path, header['version'][0], VERSION))
+        self.header = header[0]
+        self.N = int(self.header['N'])
+        self.seed = int(self.header['seed'])
+        self.kind = int(self.header['kind'])
+        self.max_moves = int(self.header['max_moves'])
+        self.records = np.memmap(path, dtype=record_dtype(self.N, self.max_moves), mode='r',
+                                 offset=HEADER_SIZE, shape=(int(self.header['count']),))
+
+    def __len__(self):
+        return len(self.records)
+
+    @property
+    def states(self):
+        return self.records['state']
+
+    @property
+    def moves(self):
+        return self.records['moves'][:, :self.max_moves]
+
+    def batches(self, batch_size=CHUNK_SIZE):
+        """Generator of (states (B, 6, N, N), move codes (B, max_moves)) batches."""
+        for start in range(0, len(self), batch_size):
+            packed = np.asarray(self.states[start:start+batch_size])
+            cube_states = state_engine.unpack_states(packed, self.N).reshape(-1, 6, self.N, self.N)
+            yield cube_states, self.moves[start:start+batch_size]
@@ -0,0 +1,222 @@
+
+"""
+Lookup tables shared by worker processes through shared memory.
+
+The process that starts a pool puts its tables in a TableRegistry once, and
+passes registry.handles() to the workers, which attach() them as read only
+NumPy views of the same memory. Workers then use the tables without a copy,
+so memory per worker stays the same however large the tables or the pool.
+
+    registry = TableRegistry()
+    share_state_tables(registry, N=3)
+    pool = ProcessPoolExecutor(workers, initializer=attach, initargs=(registry.handles(),))
+    ...
+    pool.shutdown()
+    registry.close()
+
+Shared memory outlives the processes using it until it is unlinked. The
+registry unlinks its blocks on close, at exit, and the multiprocessing
+resource tracker unlinks them if the owner is killed. Blocks are named
+with PREFIX and the owner pid, so blocks left behind by an owner that is
+gone are removed when the next registry is made.
+"""
+import os
+import atexit
+import itertools
+import numpy as np
+from multiprocessing import shared_memory
+
+import state_engine
+
+
+PREFIX = 'cube_tables_'
+# Where Linux lists shared memory blocks
+SHM_DIR = '/dev/shm'
+
+# Shared memory blocks attached by this process, kept open while their
+# views are in use
+_attached = {}
+_block_ids = itertools.count()
+
+
+def _owner_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def remove_stale(prefix=PREFIX):
+    """Unlinks blocks of registries whose process is gone, returns their names."""
+    if not os.path.isdir(SHM_DIR):
+        return []
+    removed = []
+    for name in os.listdir(SHM_DIR):
+        if not name.startswith(prefix):
+            continue
+        try:
+            pid = int(name[len(prefix):].split('_')[0])
+        except ValueError:
+            continue
+        if pid != os.getpid() and not _owner_alive(pid):
+            try:
+                os.unlink(os.path.join(SHM_DIR, name))
+                removed.append(name)
+            except OSError:
+                pass
+    return removed
+
+
+
+class TableRegistry():
+
+    """
+    Named NumPy arrays in shared memory, owned by the process that made
+    the registry. Use as a context manager, or call close, to free them.
+    """
+
+    def __init__(self, prefix=PREFIX):
+        self.prefix = prefix
+        self.blocks = {}
+        self.tables = {}
+        remove_stale(prefix)
+        atexit.register(self.close)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __contains__(self, name):
+        return name in self.tables
+
+    def __getitem__(self, name):
+        return self.tables[name]
+
+    @property
+    def nbytes(self):
+        return sum(table.nbytes for table in self.tables.values())
+
+    def add(self, name, array):
+        """Copies array into shared memory, returns the shared read only view."""
+        if name in self.tables:
+            raise KeyError('table %s already registered' % name)
+        array = np.ascontiguousarray(array)
+        block = shared_memory.SharedMemory(
+            name='%s%d_%d' % (self.prefix, os.getpid(), next(_block_ids)),
+            create=True, size=max(array.nbytes, 1))
+        table = np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)
+        table[...] = array
+        table.setflags(write=False)
+        self.blocks[name] = block
+        self.tables[name] = table
+        return table
+
+    def handles(self):
+        """Picklable description of the tables, for attach in other processes."""
+        return [(name, self.blocks[name].name, table.shape, table.dtype.str)
+                for name, table in self.tables.items()]
+
+    def close(self):
+        """Unlinks all blocks, views of them must not be used after."""
+        self.tables = {}
+        for block in self.blocks.values():
+            try:
+                block.close()
+            except BufferError:
+                # Views still exported, the mapping goes away with them
+                pass
+            try:
+                block.unlink()
+            except FileNotFoundError:
+                pass
+        self.blocks = {}
+
+
+def attach(handles):
+    """
+    Attaches tables of a registry in another process, as read only views.
+    Tables of the state engine are then used instead of building them. Fit
+    as a process pool initializer. Returns dict of name to view.
+    """
+    tables = {}
+    for name, block_name, shape, dtype in handles:
+        if block_name not in _attached:
+            _attached[block_name] = shared_memory.SharedMemory(name=block_name)
+        table = np.ndarray(shape, dtype=np.dtype(dtype), buffer=_attached[block_name].buf)
+        table.setflags(write=False)
+        tables[name] = table
+    state_engine.use_shared_tables(tables)
+    return tables
+
+
+def share_state_tables(registry, N=3):
+    """Adds the move tables of the state engine for NxN cubes to registry."""
+    for build in (state_engine.move_tables, state_engine.move_code_tables):
+        name = state_engine.table_name(build, N)
+        if name not in registry:
+            registry.add(name, build(N))
+    return registry
+
+
+def _touch_tables(handles, copies):
+    """Pool task, reads every table and returns memory of this worker in kB."""
+    tables = attach(handles) if copies is None else copies
+    for table in tables.values():
+        int(table.reshape(-1).view(np.uint8)[::4096].sum())
+    memory = {}
+    with open('/proc/self/status') as f:
+        for line in f:
+            name, _, value = line.partition(':')
+            if name in ('RssAnon', 'RssShmem'):
+                memory[name] = int(value.split()[0])
+    return os.getpid(), memory
+
+
+if __name__ == '__main__':
+    import time
+    import argparse
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor
+
+    import external_bfs
+
+    parser = argparse.ArgumentParser(description='Per worker memory with shared and copied tables')
+    parser.add_argument('--depth', '-d', type=int, default=6, help='depth of the distance table')
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, 8])
+    parser.add_argument('--copy', action='store_true', help='send every worker its own copy instead')
+    args = parser.parse_args()
+
+    # Distance table, sorted hash keys of all states up to depth from
+    # solved and their distance, as an example of a large table
+    keys, distances = [], []
+    with external_bfs.ExternalBFS(list('FLURDBflurdb')) as bfs:
+        for level in bfs.levels(state_engine.solved_cube_state(3), args.depth):
+            for bucket_keys, _, _ in level.buckets:
+                keys.append(np.array(bucket_keys))
+                distances.append(np.full(len(bucket_keys), level.depth, dtype=np.uint8))
+    keys, distances = np.concatenate(keys), np.concatenate(distances)
+    order = np.argsort(keys)
+
+    context = multiprocessing.get_context('spawn')
+    with TableRegistry() as registry:
+        share_state_tables(registry)
+        registry.add('distance_keys', keys[order])
+        registry.add('distances', distances[order])
+        copies = dict(registry.tables) if args.copy else None
+        print("%d tables, %.1f MB, %s" % (len(registry.tables), registry.nbytes / 1e6,
+              'copied to every worker' if args.copy else 'shared'))
+        print("%8s %14s %14s %10s" % ('workers', 'private MB', 'shared MB', 'seconds'))
+        for workers in args.workers:
+            start = time.perf_counter()
+            with ProcessPoolExecutor(workers, mp_context=context) as pool:
+                # One task per worker, each waits for the others to start
+                results = dict(pool.map(_touch_tables, [registry.handles()] * workers * 4,
+                                        [copies] * workers * 4))
+            private = np.mean([memory['RssAnon'] for memory in results.values()]) / 1e3
+            shared = np.mean([memory['RssShmem'] for memory in results.values()]) / 1e3
+            print("%8d %14.1f %14.1f %10.2f" % (workers, private, shared, time.perf_counter() - start))
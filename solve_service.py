@@ -0,0 +1,418 @@
+
+import time
+import json
+import signal
+import asyncio
+import collections
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import numpy as np
+
+import solvers
+import state_engine
+import solve_worker
+import async_solvers
+import shared_tables
+from state_engine import POSSIBLE_MOVES
+
+
+# Requests arriving within BATCH_WINDOW seconds of the first one of a batch
+# are handled together, up to MAX_BATCH requests
+BATCH_WINDOW = 0.002
+MAX_BATCH = 256
+# Seconds a request may take if it does not give its own budget
+DEFAULT_BUDGET = 10.
+# Extra seconds to wait for a pool worker past the budget, it stops itself
+# at the deadline unless it is still building its plan
+BUDGET_GRACE = 0.1
+# Solutions kept, least recently used are dropped first
+CACHE_SIZE = 100000
+# Deepest search a request may ask for. DFS and BFS plans and single call
+# searches grow exponentially with depth and are not stopped at the deadline
+# while building, a BFS plan of depth 7 takes about 15 seconds
+MAX_DEPTH = 7
+# Largest cube size a request may ask for, the move tables of an NxNxN cube
+# take 576*N**3 bytes
+MAX_SIZE = 10
+
+HTTP_STATUS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 500: 'Internal Server Error',
+               504: 'Gateway Timeout'}
+
+
+# Solvers of a pool worker process and their own time budgets, reused
+# between solves
+_worker_solvers = {}
+
+
+def solve_state(solver_name, depth, state_bytes, N, deadline):
+    """
+    Runs in a pool worker. Solves cube state until it is solved, the solver
+    terminates or time.monotonic() passes deadline. Returns the net solution
+    moves (None if not solved), the number of actions and if it ran out of
+    time.
+    """
+    key = (solver_name, depth)
+    if key not in _worker_solvers:
+        solver = solvers.SOLVERS[solver_name](depth, POSSIBLE_MOVES.copy())
+        _worker_solvers[key] = solver, getattr(solver, 'time_budget', None)
+    solver, own_budget = _worker_solvers[key]
+    cube_state = np.frombuffer(state_bytes, dtype=np.uint8).reshape(6, N, N).copy()
+    actions = []
+    # Requests that waited past their deadline in the pool queue are dropped
+    timed_out = time.monotonic() > deadline
+    if not timed_out:
+        solve_worker.limit_to_deadline(solver, own_budget, deadline)
+        for action in solve_worker.run_solver(solver, cube_state):
+            actions.append(action)
+            state_engine.apply_move(cube_state, action)
+            if time.monotonic() > deadline:
+                timed_out = True
+                break
+    solution = None
+    if state_engine.is_solved(cube_state):
+        solution = ''.join(state_engine.net_moves(actions))
+        timed_out = False
+    return dict(solution=solution, actions=len(actions), timed_out=timed_out)
+
+
+class BadRequest(Exception):
+    pass
+
+
+class SolveService():
+
+    """
+    Answers solve requests, given as dicts with either a scramble (move
+    string, e.g. 'rdB') or a state (6*N*N colors 0-5 in cube_state order),
+    and optionally solver (name in solvers.SOLVERS, default 'BFS'), depth
+    (default scramble length, or 4 for states), size N and budget (seconds).
+
+    Requests are collected into micro batches. For each batch:
+
+    1. scrambles are applied to solved cubes all at once with the batch
+       engine, and solved states answered directly,
+    2. states already solved by the same solver and depth are answered from
+       the solution cache, shared by all requests,
+    3. the rest are sent to a process pool, identical states in flight share
+       one search.
+
+    Every request has a deadline, budget seconds after it arrived. Pool
+    workers stop searching at the deadline, and a request is answered as
+    timed out if its result is not back by then, and with status 500 if the
+    search failed. Depths above max_depth and sizes above max_size are bad
+    requests.
+
+    """
+
+    def __init__(self, workers=None, batch_window=BATCH_WINDOW, max_batch=MAX_BATCH,
+                 cache_size=CACHE_SIZE, default_budget=DEFAULT_BUDGET, max_depth=MAX_DEPTH,
+                 max_size=MAX_SIZE):
+        # Workers use the move tables of the service, not their own copies
+        self.tables = shared_tables.share_state_tables(shared_tables.TableRegistry())
+        self.workers = workers
+        self.pool = self._new_pool()
+        self.batch_window = batch_window
+        self.max_batch = max_batch
+        self.cache_size = cache_size
+        self.default_budget = default_budget
+        self.max_depth = max_depth
+        self.max_size = max_size
+
+        # (solver, depth, state bytes) -> result dict of solve_state
+        self.cache = collections.OrderedDict()
+        # (solver, depth, state bytes) -> asyncio future of pool result
+        self.in_flight = {}
+        # (request, deadline, future) waiting for next batch
+        self.pending = []
+        self.flush_handle = None
+        self.stats = collections.Counter()
+
+    async def solve(self, request):
+        """Response dict and HTTP status for one request dict."""
+        loop = asyncio.get_event_loop()
+        future = loop.create_future()
+        try:
+            budget = float(request.get('budget', self.default_budget))
+        except (AttributeError, ValueError, TypeError):
+            # Answered as bad request by _parse
+            budget = 0.
+        self.pending.append((request, time.monotonic() + budget, future))
+        if len(self.pending) >= self.max_batch:
+            self._flush()
+        elif self.flush_handle is None:
+            self.flush_handle = loop.call_later(self.batch_window, self._flush)
+        return await future
+
+    def _new_pool(self):
+        return ProcessPoolExecutor(self.workers, initializer=shared_tables.attach,
+                                   initargs=(self.tables.handles(),))
+
+    def close(self):
+        self.pool.shutdown()
+        self.tables.close()
+
+    def _flush(self):
+        if self.flush_handle is not None:
+            self.flush_handle.cancel()
+            self.flush_handle = None
+        batch, self.pending = self.pending, []
+        if len(batch) > 0:
+            self._process_batch(batch)
+
+    def _parse(self, request):
+        """(solver, depth, N, scramble or None, state or None) of request."""
+        if not isinstance(request, dict):
+            raise BadRequest('request must be a JSON object')
+        solver = request.get('solver', 'BFS')
+        if solver not in solvers.SOLVERS:
+            raise BadRequest('unknown solver %r, choose from %s' % (solver, ', '.join(solvers.SOLVERS)))
+        if float(request.get('budget', 0)) < 0:
+            raise BadRequest('budget must not be negative')
+        N = int(request.get('size', 3))
+        if N < 2 or N > self.max_size:
+            raise BadRequest('size must be from 2 to %d' % self.max_size)
+        scramble, state = request.get('scramble'), request.get('state')
+        if (scramble is None) == (state is None):
+            raise BadRequest('give either scramble or state')
+        if scramble is not None:
+            if not isinstance(scramble, str) or any(m not in state_engine.MOVE_CODES for m in scramble):
+                raise BadRequest('scramble must be a string of moves in %s' % ''.join(state_engine.MOVES))
+            depth = int(request.get('depth', max(len(scramble), 1)))
+        else:
+            state = np.asarray(state)
+            if state.size != 6*N*N or np.any((state < 0) | (state > 5)):
+                raise BadRequest('state must have 6*N*N colors 0-5')
+            state = state.astype(np.uint8).reshape(6, N, N)
+            if np.any(np.bincount(state.ravel(), minlength=6) != N*N):
+                raise BadRequest('state must have N*N stickers of each color')
+            depth = int(request.get('depth', 4))
+        if depth < 1:
+            raise BadRequest('depth must be at least 1')
+        if depth > self.max_depth:
+            raise BadRequest('depth must be at most %d, give a smaller depth for long scrambles' % self.max_depth)
+        return solver, depth, N, scramble, state
+
+    def _process_batch(self, batch):
+        self.stats['batches'] += 1
+        self.stats['requests'] += len(batch)
+        # 1. Parse, answer bad requests
+        parsed = []
+        for request, deadline, future in batch:
+            try:
+                parsed.append((self._parse(request), deadline, future))
+            except (BadRequest, ValueError, TypeError) as e:
+                future.set_result((400, dict(error=str(e))))
+
+        # 2. Scrambled states of each cube size in one batch engine call
+        by_size = collections.defaultdict(list)
+        for i, ((solver, depth, N, scramble, state), deadline, future) in enumerate(parsed):
+            if scramble is not None:
+                by_size[N].append(i)
+        states = [p[0][4] for p in parsed]
+        for N, rows in by_size.items():
+            scrambled = state_engine.apply_moves_batch(
+                np.stack([state_engine.solved_cube_state(N)]*len(rows)),
+                state_engine.pad_moves([parsed[i][0][3] for i in rows]))
+            for i, state in zip(rows, scrambled):
+                states[i] = state
+
+        # 3. Answer solved states and cached states, send the rest to the pool
+        for ((solver, depth, N, scramble, _), deadline, future), state in zip(parsed, states):
+            info = dict(batch=len(batch))
+            if state_engine.is_solved(state):
+                future.set_result((200, dict(solved=True, solution='', actions=0, cached=False, **info)))
+                continue
+            key = (solver, depth, state.tobytes())
+            if key in self.cache:
+                self.cache.move_to_end(key)
+                self.stats['cache_hits'] += 1
+                future.set_result((200, self._response(self.cache[key], cached=True, **info)))
+                continue
+            if key not in self.in_flight:
+                self.in_flight[key] = self._submit(key, N, deadline)
+            else:
+                self.stats['shared_searches'] += 1
+            asyncio.ensure_future(self._answer(self.in_flight[key], deadline, future, info))
+
+    def _submit(self, key, N, deadline):
+        """Pool future of a search, cached when done unless it timed out."""
+        solver, depth, state_bytes = key
+        self.stats['searches'] += 1
+        loop = asyncio.get_event_loop()
+        try:
+            job = loop.run_in_executor(self.pool, solve_state, solver, depth, state_bytes, N, deadline)
+        except BrokenProcessPool:
+            # A pool worker died, the searches it broke are answered with
+            # status 500 and new ones get a new pool
+            self.stats['pool_restarts'] += 1
+            self.pool.shutdown(wait=False)
+            self.pool = self._new_pool()
+            job = loop.run_in_executor(self.pool, solve_state, solver, depth, state_bytes, N, deadline)
+
+        def done(job):
+            del self.in_flight[key]
+            if job.cancelled() or job.exception() is not None:
+                return
+            if not job.result()['timed_out']:
+                self.cache[key] = job.result()
+                if len(self.cache) > self.cache_size:
+                    self.cache.popitem(last=False)
+        job.add_done_callback(done)
+        return job
+
+    async def _answer(self, job, deadline, future, info):
+        try:
+            result = await asyncio.wait_for(asyncio.shield(job), deadline - time.monotonic() + BUDGET_GRACE)
+        except asyncio.TimeoutError:
+            result = dict(solution=None, actions=0, timed_out=True)
+        except Exception as e:
+            # Solver raised, or its pool worker died
+            self.stats['errors'] += 1
+            future.set_result((500, dict(error='search failed: %r' % e, **info)))
+            return
+        if result['timed_out']:
+            self.stats['timeouts'] += 1
+            future.set_result((504, dict(error='time budget exceeded', **info)))
+        else:
+            future.set_result((200, self._response(result, cached=False, **info)))
+
+    def _response(self, result, **info):
+        return dict(solved=result['solution'] is not None, solution=result['solution'],
+                    actions=result['actions'], **info)
+
+    async def handle_request(self, method, path, body):
+        """HTTP status and JSON response of a request to the service."""
+        if method == 'GET' and path == '/stats':
+            stats = dict(self.stats, cache_size=len(self.cache), in_flight=len(self.in_flight))
+            return 200, stats
+        if method != 'POST' or path != '/solve':
+            return 404, dict(error='POST /solve, POST /stream or GET /stats')
+        try:
+            request = json.loads(body)
+        except ValueError:
+            return 400, dict(error='body must be JSON')
+        # A list of requests is answered with a list of responses
+        if isinstance(request, list):
+            results = await asyncio.gather(*[self.solve(r) for r in request])
+            return 200, [dict(status=status, **response) for status, response in results]
+        return await self.solve(request)
+
+    async def stream(self, body, writer, keep_alive):
+        """
+        Answers one request like /solve, but streams every action as soon as
+        the solver finds it, as newline separated JSON, with chunked transfer
+        encoding. Ends with a line with solved, solution and actions.
+
+        The solver runs in a thread of the event loop executor, through
+        async_solvers.ExecutorSolver, not in the process pool, and the answer
+        is not cached.
+        """
+        try:
+            request = json.loads(body)
+            solver, depth, N, scramble, state = self._parse(request)
+            budget = float(request.get('budget', self.default_budget))
+        except (BadRequest, ValueError, TypeError) as e:
+            payload = json.dumps(dict(error=str(e))).encode()
+            writer.write(b'HTTP/1.1 400 Bad Request\r\nContent-Type: application/json\r\n'
+                         b'Content-Length: %d\r\n\r\n' % len(payload) + payload)
+            await writer.drain()
+            return
+        if scramble is not None:
+            state = state_engine.solved_cube_state(N)
+            for move in scramble:
+                state_engine.apply_move(state, move)
+
+        writer.write(b'HTTP/1.1 200 OK\r\nContent-Type: application/x-ndjson\r\n'
+                     b'Transfer-Encoding: chunked\r\nConnection: %s\r\n\r\n'
+                     % (b'keep-alive' if keep_alive else b'close'))
+        def write_line(line):
+            payload = json.dumps(line).encode() + b'\n'
+            writer.write(b'%x\r\n%s\r\n' % (len(payload), payload))
+
+        # 1. Stream actions until solved, solver finished or out of time
+        deadline = time.monotonic() + budget
+        search = solvers.SOLVERS[solver](depth, POSSIBLE_MOVES.copy())
+        solve_worker.limit_to_deadline(search, getattr(search, 'time_budget', None), deadline)
+        async_solver = async_solvers.ExecutorSolver(search)
+        actions = []
+        timed_out = False
+        cube_state = state.copy()
+        stream = async_solver.stream_actions(state)
+        try:
+            async for action in stream:
+                actions.append(action)
+                state_engine.apply_move(cube_state, action)
+                write_line(dict(action=action))
+                await writer.drain()
+                if time.monotonic() > deadline:
+                    timed_out = True
+                    break
+        finally:
+            await stream.aclose()
+
+        # 2. Summary and end of chunked body
+        solved = state_engine.is_solved(cube_state)
+        write_line(dict(solved=solved, solution=''.join(state_engine.net_moves(actions)) if solved else None,
+                        actions=len(actions), timed_out=timed_out and not solved))
+        writer.write(b'0\r\n\r\n')
+        await writer.drain()
+
+    async def handle_connection(self, reader, writer):
+        """Minimal HTTP/1.1 with keep alive, one request at a time."""
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, path, version = request_line.decode('latin-1').split()
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get('content-length', 0)))
+
+                keep_alive = version == 'HTTP/1.1' and headers.get('connection', '').lower() != 'close'
+                if method == 'POST' and path == '/stream':
+                    await self.stream(body, writer, keep_alive)
+                else:
+                    status, response = await self.handle_request(method, path, body)
+                    payload = json.dumps(response).encode()
+                    writer.write(b'HTTP/1.1 %d %s\r\nContent-Type: application/json\r\n'
+                                 b'Content-Length: %d\r\nConnection: %s\r\n\r\n'
+                                 % (status, HTTP_STATUS[status].encode(), len(payload),
+                                    b'keep-alive' if keep_alive else b'close'))
+                    writer.write(payload)
+                    await writer.drain()
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+
+async def serve(service, host='127.0.0.1', port=8765, unix_path=None):
+    """
+    Serves service over TCP on host:port, or on a Unix socket if unix_path
+    given, until SIGINT or SIGTERM.
+    """
+    if unix_path is not None:
+        server = await asyncio.start_unix_server(service.handle_connection, path=unix_path)
+        print("Solve service on", unix_path)
+    else:
+        server = await asyncio.start_server(service.handle_connection, host, port)
+        print("Solve service on http://%s:%d" % (host, port))
+    # Serve until interrupted or terminated, so the caller can clean up
+    stopped = asyncio.get_event_loop().create_future()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            asyncio.get_event_loop().add_signal_handler(sig, lambda: stopped.done() or stopped.set_result(None))
+        except NotImplementedError:
+            # Windows, interrupt raises KeyboardInterrupt instead
+            pass
+    async with server:
+        await stopped
@@ -0,0 +1,91 @@
+
+import numpy as np
+
+import state_engine
+import solve_worker
+
+
+
+# Trace file format version, bump when fields change
+TRACE_VERSION = 1
+
+# Events that can happen during a solve
+EVENTS = ['solved', 'terminated', 'stopped']
+
+
+class Trace():
+
+    """
+    Compact record of one solve, enough to replay it offline.
+
+    Stores the moves that took the cube from solved to the start of the
+    solve (so the cube geometry can be rebuilt, not just the numeric state),
+    the moves played by the solver, and events with the number of solver
+    moves played when they happened. Moves and events are uint8 codes, see
+    state_engine.MOVES and EVENTS.
+
+    """
+
+    def __init__(self, depth, possible_moves, scramble=(), solver_name="", size=3):
+        self.depth = depth
+        self.size = size
+        self.possible_moves = list(possible_moves)
+        self.scramble = list(scramble)
+        self.solver_name = solver_name
+        self.moves = []
+        self.events = []
+
+    def add_move(self, move):
+        self.moves.append(move)
+
+    def add_event(self, event):
+        self.events.append((len(self.moves), event))
+
+    def initial_state(self):
+        """Numeric cube state at the start of the solve."""
+        cube_state = state_engine.solved_cube_state(self.size)
+        for move in self.scramble:
+            state_engine.apply_move(cube_state, move)
+        return cube_state
+
+    def save(self, path):
+        events = np.array([(i, EVENTS.index(e)) for i, e in self.events], dtype=np.int64).reshape(-1, 2)
+        with open(path, 'wb') as f:
+            np.savez_compressed(f, version=np.array(TRACE_VERSION),
+                                depth=np.array(self.depth),
+                                size=np.array(self.size),
+                                possible_moves=np.array(''.join(self.possible_moves)),
+                                solver_name=np.array(self.solver_name),
+                                scramble=state_engine.encode_moves(self.scramble),
+                                moves=state_engine.encode_moves(self.moves),
+                                events=events)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            version = int(data['version'])
+            if version != TRACE_VERSION:
+                raise ValueError("Trace version %d, expected %d" % (version, TRACE_VERSION))
+            trace = cls(int(data['depth']), str(data['possible_moves']),
+                        state_engine.decode_moves(data['scramble']),
+                        str(data['solver_name']), int(data['size']))
+            trace.moves = state_engine.decode_moves(data['moves'])
+            trace.events = [(int(i), EVENTS[e]) for i, e in data['events']]
+        return trace
+
+
+def record_solve(solver, scramble, depth, possible_moves, size=3):
+    """
+    Runs solver headless from the NxNxN cube of given size scrambled with
+    given moves, and returns the trace of the solve.
+    """
+    trace = Trace(depth, possible_moves, scramble, solver.get_name(), size)
+    cube_state = trace.initial_state()
+    for action in solve_worker.run_solver(solver, cube_state):
+        trace.add_move(action)
+        state_engine.apply_move(cube_state, action)
+    if state_engine.is_solved(cube_state):
+        trace.add_event('solved')
+    else:
+        trace.add_event('terminated')
+    return trace
@@ -0,0 +1,87 @@
+
+import time
+import queue
+import threading
+
+import state_engine
+
+
+
+def run_solver(solver, cube_state):
+    """
+    Runs solver on its own copy of cube_state until the copy is solved or the
+    solver terminates, yielding every action taken.
+
+    Same loop as the GUI used to run, but without touching the GUI, so can be
+    used from a background thread or headless.
+    """
+    cube_state = cube_state.copy()
+    solver.clear()
+    solver_finished = False
+    while not state_engine.is_solved(cube_state) and not solver_finished:
+        # Get from solver, and if terminal state
+        action, solver_finished = solver.get_action(cube_state)
+        # If solver is out of moves continue and break loop
+        if action is None:
+            continue
+        state_engine.apply_move(cube_state, action)
+        yield action
+
+
+def limit_to_deadline(solver, own_budget, deadline):
+    """
+    Solvers that search inside one get_action call (those with a
+    time_budget) stop at deadline (time.monotonic()), or after own_budget
+    seconds if sooner.
+    """
+    if not hasattr(solver, 'time_budget'):
+        return
+    remaining = max(deadline - time.monotonic(), 0.)
+    solver.time_budget = remaining if own_budget is None else min(own_budget, remaining)
+
+
+
+class SolverWorker(threading.Thread):
+
+    """
+    Runs a solver in a background thread and pushes its actions into a queue,
+    so the search is not slowed down by drawing. When the solver is done
+    DONE is pushed.
+
+    Can be paused and stopped from the GUI thread.
+
+    """
+
+    DONE = None
+
+    def __init__(self, solver, cube_state):
+        super().__init__(daemon=True)
+        self.solver = solver
+        self.cube_state = cube_state.copy()
+        self.moves = queue.Queue()
+        self._stop_event = threading.Event()
+        self._running = threading.Event()
+        self._running.set()
+
+    def run(self):
+        for action in run_solver(self.solver, self.cube_state):
+            self._running.wait()
+            if self._stop_event.is_set():
+                break
+            self.moves.put(action)
+        self.moves.put(self.DONE)
+
+    def pause(self):
+        self._running.clear()
+
+    def resume(self):
+        self._running.set()
+
+    @property
+    def paused(self):
+        return not self._running.is_set()
+
+    def stop(self):
+        """Stop solver after its current action, does not wait for it."""
+        self._stop_event.set()
+        self._running.set()
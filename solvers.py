@@ -1,7 +1,17 @@
 
+import time
+import heapq
+import functools
+import itertools
 import numpy as np
 from typing import List, Tuple
 
+import kernels
+import plan_cache
+import state_engine
+import external_bfs
+import visited_filter
+
 
 
 class InterfaceSolver():
@@ -40,9 +50,10 @@ class InterfaceSolver():
 
     def get_action(self, cube_state:np.array) -> Tuple[str,bool]:
         """
-        Will be passed cube state as a 6x3x3 np.array, where the first index
+        Will be passed cube state as a 6xNxN np.array, where the first index
         represents the 6 sides of the cube, and the 2nd and 3rd index form a
-        3x3 table representing each of the 9 faces on one side of the cube. Each
+        NxN table representing each of the N*N faces on one side of the cube
+        (3x3 for the standard cube). Each
         entry has an integer value {0,5} representing a color. A solved cube is
         when for each side, each 3x3 matrix only contains one value. Can assume
         cube_state results from taking previous action on previous cube_state.
@@ -58,6 +69,40 @@ class InterfaceSolver():
         """
         pass
 
+    def get_stats(self) -> dict:
+        """
+        Optional, statistics of the last solve to report next to the solve,
+        e.g. nodes pruned. Keys are names, values numbers.
+        """
+        return {}
+
+    def get_checkpoint(self) -> dict:
+        """
+        Optional, search state as a dict of names to NumPy arrays or numbers,
+        so a long search can be saved and resumed, see checkpoint.py. Called
+        between get_action calls, or from within one through checkpoint_hook
+        by solvers that search inside get_action.
+        """
+        raise NotImplementedError('%s does not support checkpoints' % self.get_name())
+
+    def load_checkpoint(self, arrays: dict) -> None:
+        """
+        Optional, continues the search from the arrays of get_checkpoint,
+        called after clear. The next get_action must then return what it
+        would have returned without the interruption.
+        """
+        raise NotImplementedError('%s does not support checkpoints' % self.get_name())
+
+
+def encode_nodes(nodes):
+    """Nodes (move strings) to a (len(nodes), L) move code array, see state_engine.pad_moves."""
+    return state_engine.pad_moves(list(nodes))
+
+
+def decode_nodes(codes):
+    """Inverse of encode_nodes."""
+    return [''.join(state_engine.MOVES[c] for c in row if c != state_engine.PAD_MOVE) for row in codes]
+
 
 def find_shortest_path(node_1,node_2):
     """
@@ -93,11 +138,18 @@ class DepthFirstSearch(InterfaceSolver):
     """
     Implements a depth first search algorithm bounded by depth provided.
 
+    If given a visited_filter.BloomFilter, every node reached is added to it
+    with its depth, and the subtree of a node whose state was already reached
+    at the same or a smaller depth is skipped, as it was searched already.
+    The filter can give false positives, so with a small filter a solution
+    can be missed.
+
     """
 
-    def __init__(self, depth, possible_moves):
+    def __init__(self, depth, possible_moves, visited_filter=None):
         self.depth = depth
         self.possible_moves = possible_moves
+        self.visited_filter = visited_filter
 
     def get_name(self):
         return "DFS"
@@ -117,17 +169,50 @@ class DepthFirstSearch(InterfaceSolver):
             self.moves_to_make.append(current_move.lower())
         return
 
+    def build_plan(self):
+        # Make list of all moves using recursive depth first search
+        self.moves_to_make = []
+        self.depth_first_search("",self.depth)
+        plan, self.moves_to_make = self.moves_to_make, None
+        return plan
+
     def clear(self):
         """
         Because depth bounded and possible moves do not change, can pre-compute
         all actions, and then will terminate via main if solved, or here if out
-        of pre-computed moves.
+        of pre-computed moves. The plan is built once per depth and moves, see
+        plan_cache.
         """
-        # Make list of all moves using recursive depth first search
-        self.moves_to_make = []
-        self.depth_first_search("",self.depth)
-        # Reverse string so that popping is constant time
-        self.moves_to_make.reverse()
+        self.plan = plan_cache.get_plan("DFS", self.depth, self.possible_moves, self.build_plan)
+        self.position = 0
+        # Depth of current node, and if it was just reached by a forward move
+        self.current_depth = 0
+        self.moved_forward = True
+        self.nodes_saved = 0
+        if self.visited_filter is not None:
+            self.visited_filter.clear()
+
+    def subtree_plan_length(self, remaining):
+        """Number of moves in the plan to search a subtree remaining deep."""
+        length = 0
+        for _ in range(remaining):
+            length = len(self.possible_moves) * (2 + length)
+        return length
+
+    def skip_visited(self, cube_state):
+        """
+        If the current node was reached before at the same or smaller depth,
+        drop its subtree from the plan, otherwise add it to the filter.
+        """
+        depths = np.arange(self.current_depth + 1)
+        keys = visited_filter.state_keys(cube_state[None], depths)
+        if np.any(self.visited_filter.contains(keys)):
+            remaining = self.depth - self.current_depth
+            skipped = self.subtree_plan_length(remaining)
+            self.position += skipped
+            self.nodes_saved += skipped // 2
+        else:
+            self.visited_filter.add(keys[-1:])
 
     def get_action(self, cube_state):
         """
@@ -135,10 +220,43 @@ class DepthFirstSearch(InterfaceSolver):
         pop
         Get action based off current index, increment index, and return
         """
+        if self.visited_filter is not None and self.moved_forward:
+            self.skip_visited(cube_state)
         terminating = False
-        if len(self.moves_to_make) == 1:
+        if self.position >= len(self.plan) - 1:
             terminating = True
-        return self.moves_to_make.pop(), terminating
+        action = state_engine.MOVES[self.plan[self.position]]
+        self.position += 1
+        self.moved_forward = action.isupper()
+        self.current_depth += 1 if self.moved_forward else -1
+        return action, terminating
+
+    def get_stats(self):
+        if self.visited_filter is None:
+            return {}
+        return dict(nodes_saved=self.nodes_saved, filter_fp_rate=self.visited_filter.estimated_fp_rate(),
+                    filter_bytes=self.visited_filter.nbytes)
+
+    def get_checkpoint(self):
+        """
+        Position in the plan, which is the DFS stack (the net moves of the
+        plan so far), and the visited filter bits.
+        """
+        arrays = dict(position=self.position, plan_length=len(self.plan), current_depth=self.current_depth,
+                      moved_forward=self.moved_forward, nodes_saved=self.nodes_saved)
+        if self.visited_filter is not None:
+            arrays.update(self.visited_filter.get_checkpoint())
+        return arrays
+
+    def load_checkpoint(self, arrays):
+        if int(arrays['plan_length']) != len(self.plan):
+            raise ValueError('checkpoint is of another plan')
+        self.position = int(arrays['position'])
+        self.current_depth = int(arrays['current_depth'])
+        self.moved_forward = bool(arrays['moved_forward'])
+        self.nodes_saved = int(arrays['nodes_saved'])
+        if 'filter_bits' in arrays:
+            self.visited_filter = visited_filter.BloomFilter.from_checkpoint(arrays)
 
 
 class BreadthFirstSearch(InterfaceSolver):
@@ -155,12 +273,7 @@ class BreadthFirstSearch(InterfaceSolver):
     def get_name(self):
         return "BFS"
 
-    def clear(self):
-        """
-        Because depth bounded and possible moves do not change, can pre-compute
-        all actions, and then will terminate via main if solved, or here if out
-        of pre-computed moves.
-        """
+    def build_plan(self):
         # Simulating going through and popping from list below, but just pop and
         # append to main list which will be used in action.
         save_moves_to_make = []
@@ -179,15 +292,31 @@ class BreadthFirstSearch(InterfaceSolver):
                     track_moves_to_make.append(to_append)
                     save_moves_to_make.append(to_append)
         # Now make completed move list using shortest path between each
-        self.moves_to_make = []
+        moves_to_make = []
         for i in range(len(save_moves_to_make)):
             if i ==0:
-                self.moves_to_make.append(save_moves_to_make[0])
+                moves_to_make.append(save_moves_to_make[0])
             else:
-                self.moves_to_make.extend(find_shortest_path(save_moves_to_make[i-1],save_moves_to_make[i]))
-        # Reverse string so that popping is constant time
-        self.moves_to_make.reverse()
+                moves_to_make.extend(find_shortest_path(save_moves_to_make[i-1],save_moves_to_make[i]))
+        return moves_to_make
 
+    def clear(self):
+        """
+        Because depth bounded and possible moves do not change, can pre-compute
+        all actions, and then will terminate via main if solved, or here if out
+        of pre-computed moves. The plan is built once per depth and moves, see
+        plan_cache.
+        """
+        self.plan = plan_cache.get_plan("BFS", self.depth, self.possible_moves, self.build_plan)
+        self.position = 0
+
+    def get_checkpoint(self):
+        return dict(position=self.position, plan_length=len(self.plan))
+
+    def load_checkpoint(self, arrays):
+        if int(arrays['plan_length']) != len(self.plan):
+            raise ValueError('checkpoint is of another plan')
+        self.position = int(arrays['position'])
 
     def get_action(self, cube_state):
         """
@@ -196,9 +325,10 @@ class BreadthFirstSearch(InterfaceSolver):
         Get action based off current index, increment index, and return
         """
         terminating = False
-        if len(self.moves_to_make) == 1:
+        if self.position >= len(self.plan) - 1:
             terminating = True
-        return self.moves_to_make.pop(), terminating
+        self.position += 1
+        return state_engine.MOVES[self.plan[self.position - 1]], terminating
 
 
 
@@ -213,14 +343,34 @@ class BestFirstSearch(InterfaceSolver):
     computed. This metric is summed for each side anid is divide by the total
     number of cube faces.
 
+    If given a visited_filter.BloomFilter, a node whose state was already
+    reached at the same or a smaller depth is not expanded, see
+    DepthFirstSearch.
+
+    With batch_children, the solver only moves to nodes it expands. All
+    children of a node are made in memory at once, scored with one
+    get_values call and pushed onto a heap of open nodes, and the best open
+    node is moved to next. That takes about branching factor times fewer
+    cube moves and scoring calls.
+
+    If given a value_network.ValueNetwork, states are scored by its
+    estimated moves to solve (fewer is better) instead. It must be trained
+    for the same moves, else ValueError.
+
     """
 
-    def __init__(self, depth, possible_moves):
+    def __init__(self, depth, possible_moves, visited_filter=None, batch_children=False, value_network=None):
         self.depth = depth
         self.possible_moves = possible_moves
+        self.visited_filter = visited_filter
+        self.batch_children = batch_children
+        self.value_network = value_network
+        if value_network is not None:
+            # Cube size is only known from the states, checked by evaluate
+            value_network.check(moves=possible_moves)
 
     def get_name(self):
-        return "BestFS"
+        return "BatchBestFS" if self.batch_children else "BestFS"
 
     def clear(self):
         self.cube_state_move = []
@@ -230,23 +380,137 @@ class BestFirstSearch(InterfaceSolver):
         self.last_action = ""
         self.move_queue = []
         self.previous_node = ""
+        self.nodes_saved = 0
+        # Batch mode, heap of (-value, order, node) and scoring counts
+        self.open_nodes = []
+        self.nodes_pushed = 0
+        self.nodes_expanded = 0
+        self.value_calls = 0
+        if self.visited_filter is not None:
+            self.visited_filter.clear()
+
+    def get_stats(self):
+        stats = {}
+        if self.batch_children:
+            stats.update(nodes_expanded=self.nodes_expanded, nodes_scored=self.nodes_pushed,
+                         value_calls=self.value_calls)
+        if self.visited_filter is not None:
+            stats.update(nodes_saved=self.nodes_saved, filter_fp_rate=self.visited_filter.estimated_fp_rate(),
+                         filter_bytes=self.visited_filter.nbytes)
+        return stats
+
+    def get_checkpoint(self):
+        """
+        Nodes moved to with their values and untried moves, the open list of
+        batch mode as arrays, the queued moves and the visited filter bits.
+        """
+        done = None in self.move_queue
+        arrays = dict(nodes=encode_nodes(self.cube_state_move), values=np.array(self.cube_state_values),
+                      untried=encode_nodes(''.join(moves) for moves in self.possible_moves_for_node),
+                      started=len(self.actions) > 0, last_action=encode_nodes([self.last_action]),
+                      move_queue=encode_nodes([''.join(m for m in self.move_queue if m is not None)]),
+                      done=done, previous_node=encode_nodes([self.previous_node if not done else '']),
+                      open_values=np.array([entry[0] for entry in self.open_nodes]),
+                      open_order=np.array([entry[1] for entry in self.open_nodes], dtype=np.int64),
+                      open_nodes=encode_nodes(entry[2] for entry in self.open_nodes),
+                      nodes_saved=self.nodes_saved, nodes_pushed=self.nodes_pushed,
+                      nodes_expanded=self.nodes_expanded, value_calls=self.value_calls)
+        if self.visited_filter is not None:
+            arrays.update(self.visited_filter.get_checkpoint())
+        return arrays
+
+    def load_checkpoint(self, arrays):
+        self.cube_state_move = decode_nodes(arrays['nodes'])
+        self.cube_state_values = list(arrays['values'])
+        self.possible_moves_for_node = [list(moves) for moves in decode_nodes(arrays['untried'])]
+        self.actions = [""] if bool(arrays['started']) else []
+        self.last_action = decode_nodes(arrays['last_action'])[0]
+        self.move_queue = list(decode_nodes(arrays['move_queue'])[0])
+        self.previous_node = decode_nodes(arrays['previous_node'])[0]
+        if bool(arrays['done']):
+            self.move_queue.append(None)
+            self.previous_node = None
+        self.open_nodes = [(value, int(order), node) for value, order, node in
+                           zip(arrays['open_values'], arrays['open_order'], decode_nodes(arrays['open_nodes']))]
+        self.nodes_saved = int(arrays['nodes_saved'])
+        self.nodes_pushed = int(arrays['nodes_pushed'])
+        self.nodes_expanded = int(arrays['nodes_expanded'])
+        self.value_calls = int(arrays['value_calls'])
+        if 'filter_bits' in arrays:
+            self.visited_filter = visited_filter.BloomFilter.from_checkpoint(arrays)
 
     def get_value(self,cube_state):
-        total_equal = 0
-        total = cube_state.size
-        for i in range(6):
-            center_val = cube_state[i,1,1]
-            total_equal += np.sum(cube_state[i,:,:]==center_val)
-        return float(total_equal)/total
+        if self.value_network is not None:
+            return self.get_values(cube_state.reshape(1, -1))[0]
+        return kernels.percent_solved(cube_state.reshape(-1), cube_state.shape[1])
+
+    def get_values(self, cube_states):
+        """get_value of every state of a (B, 6*N*N) array in one call."""
+        if self.value_network is not None:
+            return -self.value_network.evaluate(cube_states)
+        return kernels.percent_solved_batch(cube_states, int(round(np.sqrt(cube_states.shape[1] // 6))))
+
+    def get_action_batch(self, cube_state):
+        """
+        Batch mode of get_action_nodes, expands the node the solver is at
+        and picks the best open node to move to.
+        """
+        # 1. Make all children of the current node, unless at max depth
+        node = self.last_action
+        if len(node) < self.depth:
+            self.nodes_expanded += 1
+            N = cube_state.shape[1]
+            codes = state_engine.encode_moves(self.possible_moves)
+            children = cube_state.reshape(-1)[state_engine.move_code_tables(N)[codes]]
+            moves = list(self.possible_moves)
+            if self.visited_filter is not None:
+                # Drop children reached before at the same or smaller depth
+                depth = len(node) + 1
+                keys = visited_filter.state_keys(np.repeat(children, depth + 1, axis=0),
+                                                 np.tile(np.arange(depth + 1), len(children)))
+                seen = np.any(self.visited_filter.contains(keys).reshape(len(children), depth + 1), axis=1)
+                self.visited_filter.add(keys.reshape(len(children), depth + 1)[~seen, -1])
+                self.nodes_saved += int(np.count_nonzero(seen))
+                children = children[~seen]
+                moves = [move for move, skip in zip(moves, seen) if not skip]
+            # 2. Go to a solved child, or score them in one call and push
+            # the ones that can be expanded onto the open list
+            solved = state_engine.is_solved_batch(children.reshape(len(children), 6, N, N))
+            if np.any(solved):
+                self.last_action = node + moves[np.argmax(solved)]
+                return self.last_action
+            if len(children) > 0:
+                self.value_calls += 1
+                for move, value in zip(moves, self.get_values(children)):
+                    if len(node) + 1 < self.depth:
+                        heapq.heappush(self.open_nodes, (-value, self.nodes_pushed, node + move))
+                    self.nodes_pushed += 1
+        # 3. Best open node
+        if len(self.open_nodes) == 0:
+            return None
+        self.last_action = heapq.heappop(self.open_nodes)[2]
+        return self.last_action
 
     def get_action_nodes(self, cube_state):
         """
         Method to actually select next nodes given known values.
         """
+        if self.batch_children:
+            return self.get_action_batch(cube_state)
         # 1. Get value of current cube_state, and append state and value, and nodes_moved_to
         self.cube_state_values.append(self.get_value(cube_state))
         self.cube_state_move.append(self.last_action)
         self.possible_moves_for_node.append(self.possible_moves.copy())
+        if self.visited_filter is not None:
+            depth = len(self.last_action)
+            keys = visited_filter.state_keys(cube_state[None], np.arange(depth + 1))
+            if np.any(self.visited_filter.contains(keys)):
+                # Reached before at the same or smaller depth, do not expand again
+                if depth < self.depth:
+                    self.nodes_saved += len(self.possible_moves_for_node[-1])
+                self.possible_moves_for_node[-1] = []
+            else:
+                self.visited_filter.add(keys[-1:])
         if len(self.actions) == 0:
             self.actions.append("")
         # 2. Now find best current state
@@ -289,6 +553,512 @@ class BestFirstSearch(InterfaceSolver):
 
 
 
+class PackedBreadthFirstSearch(InterfaceSolver):
+
+    """
+    Breadth first search over deduplicated packed states, see
+    external_bfs.ExternalBFS. Stores a few bytes per state instead of a
+    string per node, and spills to disk beyond ram_budget bytes, so can
+    search much deeper than BreadthFirstSearch.
+
+    Searches on the first action of a solve, then returns the moves of the
+    shortest solution, so only the solution path is shown on the tree. With
+    a time_budget the search gives up after that many seconds, checked
+    between levels.
+
+    """
+
+    def __init__(self, depth, possible_moves, ram_budget=external_bfs.RAM_BUDGET, time_budget=None):
+        self.depth = depth
+        self.possible_moves = possible_moves
+        self.ram_budget = ram_budget
+        self.time_budget = time_budget
+
+    def get_name(self):
+        return "PackedBFS"
+
+    def clear(self):
+        self.moves_to_make = None
+        self.nodes = 0
+
+    def get_stats(self):
+        return dict(nodes=self.nodes)
+
+    def get_action(self, cube_state):
+        if self.moves_to_make is None:
+            N = cube_state.shape[1]
+            deadline = None if self.time_budget is None else time.perf_counter() + self.time_budget
+            with external_bfs.ExternalBFS(self.possible_moves, N, self.ram_budget) as bfs:
+                solution = bfs.solve(cube_state, self.depth, deadline)
+                self.nodes = bfs.generated
+            if solution is None:
+                return None, True
+            # Reverse so that popping is constant time
+            self.moves_to_make = solution[::-1]
+        return self.moves_to_make.pop(), len(self.moves_to_make) == 0
+
+
+class IterativeDeepeningAStar(InterfaceSolver):
+
+    """
+    IDA* search over flat states with kernels.ida_star, compiled with Numba
+    if it is installed. Finds a shortest solution up to depth.
+
+    Searches on the first action of a solve, then returns the moves of the
+    solution, so only the solution path is shown on the tree. With a
+    time_budget the search gives up after that many seconds, checked
+    between bounds.
+
+    """
+
+    def __init__(self, depth, possible_moves, time_budget=None):
+        self.depth = depth
+        self.possible_moves = possible_moves
+        self.time_budget = time_budget
+
+    def get_name(self):
+        return "IDA*"
+
+    def clear(self):
+        self.moves_to_make = None
+        self.nodes = 0
+
+    def get_stats(self):
+        return dict(nodes=self.nodes)
+
+    def get_action(self, cube_state):
+        if self.moves_to_make is None:
+            N = cube_state.shape[1]
+            tables = state_engine.move_code_tables(N)[state_engine.encode_moves(self.possible_moves)]
+            deadline = None if self.time_budget is None else time.perf_counter() + self.time_budget
+            solution, self.nodes = kernels.ida_star(cube_state, tables, self.depth, deadline=deadline)
+            if solution is None:
+                return None, True
+            # Reverse so that popping is constant time
+            self.moves_to_make = [self.possible_moves[m] for m in solution[::-1]]
+        return self.moves_to_make.pop(), len(self.moves_to_make) == 0
+
+
+class AnytimeRepairingAStar(InterfaceSolver):
+
+    """
+    Anytime weighted A* (ARA*). Searches with f = g + weight*h, which finds
+    a solution quickly for weight > 1, at most weight times longer than the
+    shortest. Then lowers weight by weight_step and improves the solution,
+    reusing the g values and open list of the previous search (states whose
+    g improved after they were expanded are reopened), until weight is 1
+    (a shortest solution up to depth) or time_budget seconds are used, and
+    returns the best solution found.
+
+    h is the percentage solved heuristic of BestFirstSearch turned into
+    moves: stickers not matching their center over the most stickers one
+    move changes, rounded up, which never overestimates. Ties of f go to the
+    state with higher percentage solved. Children of a state are made and
+    scored together with the move tables.
+
+    """
+
+    def __init__(self, depth, possible_moves, weight=5., weight_step=1., time_budget=1.):
+        self.depth = depth
+        self.possible_moves = possible_moves
+        self.weight = weight
+        self.weight_step = weight_step
+        self.time_budget = time_budget
+        # Called every 64 expansions if set, e.g. by checkpoint.run_solver
+        self.checkpoint_hook = None
+
+    def get_name(self):
+        return "ARA*"
+
+    def clear(self):
+        self.moves_to_make = None
+        self.stages = []
+        self.expanded = 0
+        self.open = None
+
+    def get_stats(self):
+        if len(self.stages) == 0:
+            return dict(expanded=self.expanded)
+        weight, length, bound, elapsed = self.stages[-1]
+        return dict(expanded=self.expanded, stages=len(self.stages), weight=weight,
+                    suboptimality=bound, first_length=self.stages[0][1],
+                    first_ms=1000*self.stages[0][3], length=length)
+
+    def get_action(self, cube_state):
+        if self.moves_to_make is None:
+            solution = self.search(cube_state)
+            if solution is None:
+                return None, True
+            # Reverse so that popping is constant time
+            self.moves_to_make = solution[::-1]
+        return self.moves_to_make.pop(), len(self.moves_to_make) == 0
+
+    def heuristic(self, cube_states):
+        """Admissible number of moves to solve each state of a (B, 6*N*N) array."""
+        faces = cube_states.reshape(len(cube_states), 6, -1)
+        center = self.N // 2
+        wrong = np.count_nonzero(faces != faces[:, :, center*self.N + center, None], axis=(1, 2))
+        return -(-wrong // self.per_move)
+
+    def setup(self, N):
+        self.N = N
+        self.tables = state_engine.move_code_tables(self.N)[state_engine.encode_moves(self.possible_moves)]
+        self.per_move = max(1, int(np.max(np.count_nonzero(self.tables != np.arange(self.tables.shape[1]), axis=1))))
+
+    def start_search(self, cube_state):
+        """Every state seen, by packed bytes, with g, h, parent and move."""
+        self.setup(cube_state.shape[1])
+        flat = cube_state.reshape(-1).copy()
+        key = state_engine.pack_states(flat[None]).tobytes()
+        self.states = {key: flat}
+        self.g = {key: 0}
+        self.h = {key: int(self.heuristic(flat[None])[0])}
+        self.parent = {key: (None, None)}
+        self.goal = key if state_engine.is_solved(cube_state) else None
+        self.current_weight = self.weight
+        # Ties of f are broken by higher percentage solved
+        self.tie = {key: -kernels.percent_solved_batch(flat[None], self.N)[0]}
+        self.open = [(self.current_weight*self.h[key], self.tie[key], 0, key)]
+        self.n_pushed = 1
+        self.closed = set()
+        self.incons = {}
+        self.elapsed = 0.
+
+    def search(self, cube_state):
+        """
+        Runs the ARA* stages, recording (weight, length, suboptimality bound,
+        seconds) of each in self.stages. Returns the best solution moves.
+        Continues a search loaded from a checkpoint.
+        """
+        if self.open is None:
+            self.start_search(cube_state)
+        start = self.search_start = time.perf_counter() - self.elapsed
+
+        # Improve with lower weights while there is time
+        deadline = None if self.time_budget is None else start + self.time_budget
+        while True:
+            weight = self.current_weight
+            finished = self.improve_path(weight, deadline)
+            if self.goal is not None:
+                # Bound of weight only holds if the stage finished
+                bound = self.suboptimality(weight if finished else np.inf)
+                self.stages.append((weight, self.g[self.goal], bound, time.perf_counter() - start))
+            if not finished or weight <= 1:
+                break
+            self.current_weight = weight = max(1., weight - self.weight_step)
+            # Reopen states improved after expansion, and re-sort the open list,
+            # in the order they were seen so ties are broken the same every run
+            open_keys = dict.fromkeys(itertools.chain((entry[-1] for entry in self.open), self.incons))
+            self.open = [(self.g[key] + weight*self.h[key], self.tie[key], i, key) for i, key in enumerate(open_keys)]
+            heapq.heapify(self.open)
+            self.n_pushed = len(self.open)
+            self.incons = {}
+            self.closed = set()
+
+        if self.goal is None:
+            return None
+        path = []
+        key = self.goal
+        while self.parent[key][0] is not None:
+            key, move = self.parent[key]
+            path.append(move)
+        return path[::-1]
+
+    def get_checkpoint(self):
+        """
+        Open list, g, h, parents and closed flags of every state seen, as
+        arrays indexed by state, the current weight (bound) and the stages.
+        Once searched, only the solution moves left.
+        """
+        arrays = dict(expanded=self.expanded, stages=np.array(self.stages, dtype=float).reshape(-1, 4))
+        if self.moves_to_make is not None:
+            arrays.update(solution=state_engine.encode_moves(self.moves_to_make))
+            return arrays
+        if self.open is None:
+            return arrays
+        # g, h, tie and parent always get a state at the same time, so their
+        # values are in the same order as keys
+        keys = list(self.g)
+        count = len(keys)
+        index = dict(zip(keys, range(count)))
+        parents = list(self.parent.values())
+        # Indices fit 32 bits and g and h 8 bits, so checkpoints stay small
+        arrays.update(
+            keys=np.frombuffer(b''.join(keys), dtype=np.uint64).reshape(count, -1),
+            g=np.fromiter(self.g.values(), dtype=np.uint8, count=count),
+            h=np.fromiter(self.h.values(), dtype=np.uint8, count=count),
+            tie=np.fromiter(self.tie.values(), dtype=float, count=count),
+            parent=np.fromiter((-1 if parent is None else index[parent] for parent, _ in parents),
+                               dtype=np.int32, count=count),
+            parent_move=state_engine.encode_moves([m if m is not None else self.possible_moves[0] for _, m in parents]),
+            closed=np.fromiter(map(self.closed.__contains__, keys), dtype=bool, count=count),
+            incons=np.fromiter(map(index.__getitem__, self.incons), dtype=np.uint32, count=len(self.incons)),
+            open_f=np.array([entry[0] for entry in self.open], dtype=float),
+            open_tie=np.array([entry[1] for entry in self.open], dtype=float),
+            open_order=np.array([entry[2] for entry in self.open], dtype=np.uint32),
+            open_key=np.array([index[entry[3]] for entry in self.open], dtype=np.uint32),
+            goal=-1 if self.goal is None else index[self.goal], weight=self.current_weight, N=self.N,
+            n_pushed=self.n_pushed, elapsed=time.perf_counter() - self.search_start)
+        return arrays
+
+    def load_checkpoint(self, arrays):
+        self.expanded = int(arrays['expanded'])
+        self.stages = [tuple(stage) for stage in arrays['stages']]
+        if 'solution' in arrays:
+            self.moves_to_make = state_engine.decode_moves(arrays['solution'])
+            return
+        if 'keys' not in arrays:
+            return
+        packed = np.ascontiguousarray(arrays['keys'], dtype=np.uint64)
+        keys = [row.tobytes() for row in packed]
+        self.setup(int(arrays['N']))
+        states = state_engine.unpack_states(packed, self.N)
+        moves = state_engine.decode_moves(arrays['parent_move'])
+        self.states = dict(zip(keys, states))
+        self.g = dict(zip(keys, (int(g) for g in arrays['g'])))
+        self.h = dict(zip(keys, (int(h) for h in arrays['h'])))
+        self.tie = dict(zip(keys, arrays['tie']))
+        self.parent = {key: (None, None) if parent < 0 else (keys[parent], move)
+                       for key, parent, move in zip(keys, arrays['parent'], moves)}
+        self.closed = set(key for key, closed in zip(keys, arrays['closed']) if closed)
+        self.incons = dict.fromkeys(keys[i] for i in arrays['incons'])
+        self.open = [(f, tie, int(order), keys[i]) for f, tie, order, i in
+                     zip(arrays['open_f'], arrays['open_tie'], arrays['open_order'], arrays['open_key'])]
+        self.goal = None if int(arrays['goal']) < 0 else keys[int(arrays['goal'])]
+        self.current_weight = float(arrays['weight'])
+        self.n_pushed = int(arrays['n_pushed'])
+        self.elapsed = float(arrays['elapsed'])
+
+    def improve_path(self, weight, deadline):
+        """
+        Expands states by f = g + weight*h until the best solution is no
+        worse than the best f left. Returns False if deadline passed first.
+        """
+        while len(self.open) > 0:
+            f, _, _, key = self.open[0]
+            if self.goal is not None and self.g[self.goal] <= f:
+                return True
+            if self.expanded % 64 == 0:
+                if self.checkpoint_hook is not None:
+                    self.checkpoint_hook()
+                # Checked before popping, so every state stays in OPEN,
+                # CLOSED or INCONS for suboptimality
+                if deadline is not None and time.perf_counter() > deadline:
+                    return False
+            heapq.heappop(self.open)
+            # Stale entry, state reached with a lower g since it was pushed
+            if key in self.closed or f != self.g[key] + weight*self.h[key]:
+                continue
+            self.closed.add(key)
+            self.expanded += 1
+            g = self.g[key] + 1
+            if g > self.depth:
+                continue
+            children = self.states[key][self.tables]
+            child_keys = state_engine.pack_states(children)
+            h = self.heuristic(children)
+            tie = -kernels.percent_solved_batch(children, self.N)
+            for i, move in enumerate(self.possible_moves):
+                child = child_keys[i].tobytes()
+                if child in self.g and self.g[child] <= g:
+                    continue
+                self.states[child] = children[i]
+                self.g[child] = g
+                self.h[child] = int(h[i])
+                self.tie[child] = tie[i]
+                self.parent[child] = (key, move)
+                if h[i] == 0 and state_engine.is_solved(children[i].reshape(6, self.N, self.N)):
+                    if self.goal is None or g < self.g[self.goal]:
+                        self.goal = child
+                if child in self.closed:
+                    self.incons[child] = True
+                else:
+                    heapq.heappush(self.open, (g + weight*self.h[child], self.tie[child], self.n_pushed, child))
+                    self.n_pushed += 1
+        return True
+
+    def suboptimality(self, weight):
+        """Bound on solution length over shortest, from the open states."""
+        lower = [self.g[key] + self.h[key] for key in itertools.chain((entry[-1] for entry in self.open), self.incons)]
+        if len(lower) == 0:
+            return 1.
+        return min(weight, self.g[self.goal] / max(min(lower), 1))
+
+
+class MonteCarloTreeSearch(InterfaceSolver):
+
+    """
+    Monte Carlo tree search, with the tree in flat NumPy arrays indexed by
+    node (state, parent, move, depth, children, visits and value sum).
+
+    Each iteration walks down the tree by UCT to a leaf, makes all its
+    children at once, and evaluates every child with rollouts_per_child
+    random walks of up to rollout_depth moves. All rollouts of an iteration
+    (hundreds of states) step together through the move tables. A rollout
+    is worth the highest percentage solved it reaches, and a child the mean
+    of its rollouts, which is added up the path to the root.
+
+    Searches on the first action of a solve, until a child or a rollout
+    reaches the solved state, or iterations or time_budget seconds are
+    used, then returns the moves to it.
+
+    """
+
+    def __init__(self, depth, possible_moves, iterations=20000, rollouts_per_child=32,
+                 rollout_depth=None, exploration=0.5, time_budget=1., seed=None):
+        self.depth = depth
+        self.possible_moves = possible_moves
+        self.iterations = iterations
+        self.rollouts_per_child = rollouts_per_child
+        self.rollout_depth = rollout_depth
+        self.exploration = exploration
+        self.time_budget = time_budget
+        self.rng = np.random.default_rng(seed)
+
+    def get_name(self):
+        return "MCTS"
+
+    def clear(self):
+        self.moves_to_make = None
+        self.n_iterations = 0
+        self.n_nodes = 0
+        self.n_rollouts = 0
+
+    def get_stats(self):
+        return dict(iterations=self.n_iterations, nodes=self.n_nodes, rollouts=self.n_rollouts)
+
+    def get_action(self, cube_state):
+        if self.moves_to_make is None:
+            solution = self.search(cube_state)
+            if solution is None:
+                return None, True
+            # Reverse so that popping is constant time
+            self.moves_to_make = solution[::-1]
+        return self.moves_to_make.pop(), len(self.moves_to_make) == 0
+
+    def search(self, cube_state):
+        """Moves of a solution found within the budgets, or None."""
+        start = time.perf_counter()
+        N = cube_state.shape[1]
+        M = len(self.possible_moves)
+        self.tables = state_engine.move_code_tables(N)[state_engine.encode_moves(self.possible_moves)]
+        # 1. Flat tree arrays, root is node 0
+        max_nodes = 1 + self.iterations*M
+        self.states = np.empty((max_nodes, 6*N*N), dtype=np.uint8)
+        self.parent = np.full(max_nodes, -1, dtype=np.int32)
+        self.move = np.full(max_nodes, -1, dtype=np.int8)
+        self.node_depth = np.zeros(max_nodes, dtype=np.int32)
+        self.children = np.full((max_nodes, M), -1, dtype=np.int32)
+        self.visits = np.zeros(max_nodes)
+        self.value_sum = np.zeros(max_nodes)
+        self.states[0] = cube_state.reshape(-1)
+        self.n_nodes = 1
+        if state_engine.is_solved(cube_state):
+            return []
+
+        # 2. Select, expand and evaluate a leaf per iteration
+        while self.n_iterations < self.iterations:
+            if self.time_budget is not None and time.perf_counter() - start > self.time_budget:
+                break
+            self.n_iterations += 1
+            leaf = self.select()
+            if self.node_depth[leaf] >= self.depth:
+                # Can not be expanded, count its value again
+                self.backpropagate(leaf, 1, self.value_sum[leaf] / max(self.visits[leaf], 1))
+                continue
+            solution = self.expand(leaf)
+            if solution is not None:
+                return solution
+        return None
+
+    def select(self):
+        """Leaf reached from the root by the child with highest UCT score."""
+        node = 0
+        while self.children[node, 0] >= 0:
+            kids = self.children[node]
+            visits = self.visits[kids]
+            with np.errstate(divide='ignore', invalid='ignore'):
+                score = self.value_sum[kids] / visits + self.exploration * np.sqrt(np.log(self.visits[node]) / visits)
+            score[visits == 0] = np.inf
+            node = kids[np.argmax(score)]
+        return node
+
+    def expand(self, leaf):
+        """
+        Adds all children of leaf and evaluates them with rollouts. Returns
+        the moves to the solved state if a child or a rollout reaches it.
+        """
+        M = len(self.possible_moves)
+        kids = np.arange(self.n_nodes, self.n_nodes + M)
+        self.n_nodes += M
+        kid_states = self.states[leaf][self.tables]
+        self.states[kids] = kid_states
+        self.parent[kids] = leaf
+        self.move[kids] = np.arange(M)
+        self.node_depth[kids] = self.node_depth[leaf] + 1
+        self.children[leaf] = kids
+        N = int(round(np.sqrt(kid_states.shape[1] // 6)))
+        solved = state_engine.is_solved_batch(kid_states.reshape(M, 6, N, N))
+        if np.any(solved):
+            return self.path(kids[np.argmax(solved)])
+
+        # Rollouts of every child step together, each tracks its best value
+        R = self.rollouts_per_child
+        length = self.depth - self.node_depth[leaf] - 1
+        if self.rollout_depth is not None:
+            length = min(length, self.rollout_depth)
+        states = np.repeat(kid_states, R, axis=0)
+        best = kernels.percent_solved_batch(states, N)
+        moves = self.rng.integers(M, size=(len(states), length))
+        rows = np.arange(len(states))[:, None]
+        for k in range(length):
+            states = states[rows, self.tables[moves[:, k]]]
+            values = kernels.percent_solved_batch(states, N)
+            solved = state_engine.is_solved_batch(states.reshape(len(states), 6, N, N))
+            if np.any(solved):
+                row = np.argmax(solved)
+                rollout = [self.possible_moves[m] for m in moves[row, :k+1]]
+                return self.path(kids[row // R]) + rollout
+            best = np.maximum(best, values)
+        self.n_rollouts += len(states)
+
+        kid_values = best.reshape(M, R).mean(axis=1)
+        self.visits[kids] = 1
+        self.value_sum[kids] = kid_values
+        self.backpropagate(leaf, M, kid_values.sum())
+        return None
+
+    def backpropagate(self, node, visits, value):
+        while node >= 0:
+            self.visits[node] += visits
+            self.value_sum[node] += value
+            node = self.parent[node]
+
+    def path(self, node):
+        """Moves from the root to node."""
+        moves = []
+        while node > 0:
+            moves.append(self.possible_moves[self.move[node]])
+            node = self.parent[node]
+        return moves[::-1]
+
+
+# Solvers by the name they show on their button, used by the GUI and command
+# line. Register custom solvers here.
+SOLVERS = {
+    'DFS': DepthFirstSearch,
+    'BFS': BreadthFirstSearch,
+    'BestFS': BestFirstSearch,
+    'BatchBestFS': functools.partial(BestFirstSearch, batch_children=True),
+    'PackedBFS': PackedBreadthFirstSearch,
+    'IDA*': IterativeDeepeningAStar,
+    'ARA*': AnytimeRepairingAStar,
+    'MCTS': MonteCarloTreeSearch,
+}
+
+
+
+
 
 
 
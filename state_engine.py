@@ -0,0 +1,314 @@
+
+import functools
+import itertools
+import numpy as np
+
+
+
+# Face order of cube_state. For each face, the outward normal in the
+# MagicCube geometry, then the directions in which the row and column index
+# of the face grid increase. Chosen so that the 3x3 tables are the same as
+# the original hand written moves.
+FACES = ['F','L','U','R','D','B']
+FACE_AXES = np.array([[[0,0,1], [0,-1,0], [1,0,0]],
+                      [[-1,0,0], [0,0,-1], [0,-1,0]],
+                      [[0,1,0], [0,0,-1], [-1,0,0]],
+                      [[1,0,0], [0,0,-1], [0,1,0]],
+                      [[0,-1,0], [0,0,-1], [1,0,0]],
+                      [[0,0,-1], [0,-1,0], [-1,0,0]]], dtype=float)
+
+
+def solved_cube_state(N=3):
+    """
+    Cube's position internally will be stored as 6 NxN matrices. Where each
+    color is assigned an integer 0-5.
+    """
+    cube_state = np.empty((6,N,N), dtype=np.uint8)
+    for i in range(6):
+        cube_state[i,:,:] = i
+    return cube_state
+
+
+def sticker_slots(sticker_centroids, N):
+    """
+    Index into flattened cube_state of the sticker at each centroid of a
+    MagicCube Cube, found from the face the centroid is on and its position
+    on that face.
+    """
+    face = np.argmax(np.dot(sticker_centroids, FACE_AXES[:,0].T), axis=1)
+    cubie_width = 2. / N
+    row = np.floor((np.sum(sticker_centroids*FACE_AXES[face,1], axis=1) + 1) / cubie_width)
+    col = np.floor((np.sum(sticker_centroids*FACE_AXES[face,2], axis=1) + 1) / cubie_width)
+    row = np.clip(row, 0, N-1).astype(np.intp)
+    col = np.clip(col, 0, N-1).astype(np.intp)
+    return (face*N + row)*N + col
+
+
+def state_from_geometry(cube):
+    """
+    cube_state matching the sticker colors of a MagicCube Cube. MagicCube
+    numbers colors by the order of its face rotations, so colors are
+    relabeled such that a solved Cube gives solved_cube_state.
+    """
+    normals = np.array([r.rotate([0, 0, 1]) for r in cube.rots])
+    relabel = np.argmax(np.dot(normals, FACE_AXES[:,0].T), axis=1).astype(np.uint8)
+    cube_state = np.empty(6*cube.N*cube.N, dtype=np.uint8)
+    cube_state[sticker_slots(cube._sticker_centroids, cube.N)] = relabel[cube._colors]
+    return cube_state.reshape(6, cube.N, cube.N)
+
+
+def sticker_centroids(N):
+    """
+    Centroid of every sticker of an NxN cube on the surface of the MagicCube
+    geometry (cube from -1 to 1), in flattened cube_state order.
+    """
+    cubie_width = 2. / N
+    face, row, col = np.meshgrid(np.arange(6), np.arange(N), np.arange(N), indexing='ij')
+    face, row, col = face.ravel(), row.ravel(), col.ravel()
+    row_offset = (-1 + (row + 0.5)*cubie_width)[:,None]
+    col_offset = (-1 + (col + 0.5)*cubie_width)[:,None]
+    return FACE_AXES[face,0] + FACE_AXES[face,1]*row_offset + FACE_AXES[face,2]*col_offset
+
+
+# Tables attached from shared memory by worker processes (see
+# shared_tables.py), by table_name, used instead of building them
+_shared_tables = {}
+
+
+def table_name(build, N):
+    """Name of the table build(N) returns, e.g. move_tables_3."""
+    return '%s_%d' % (build.__name__, N)
+
+
+def use_shared_tables(tables):
+    """Uses the arrays of dict table name -> array instead of building them."""
+    _shared_tables.update(tables)
+    for build in (move_tables, move_code_tables):
+        build.cache_clear()
+
+
+@functools.lru_cache(maxsize=None)
+def move_tables(N):
+    """
+    Sticker permutations of every face and layer move of an NxN cube, as an
+    array of shape (6, N, 2, 6*N*N) indexed by face (in FACES order), layer
+    (0 is the outer layer), and direction (0 clockwise, 1 counter
+    clockwise). A move is then a single gather,
+    new_state.flat = cube_state.flat[tables[face, layer, dir]].
+
+    Built once per N by turning every sticker centroid the way the MagicCube
+    geometric model does, a clockwise quarter turn about the face normal v
+    takes x to v(v.x) + x cross v, and seeing which slot it ends up in. Only
+    needs numpy, so solvers can run without importing matplotlib.
+    """
+    if table_name(move_tables, N) in _shared_tables:
+        return _shared_tables[table_name(move_tables, N)]
+    centroids = sticker_centroids(N)
+    start = np.arange(6*N*N)
+    cubie_width = 2. / N
+    tables = np.empty((6, N, 2, 6*N*N), dtype=np.intp)
+    for f in range(len(FACES)):
+        normal = FACE_AXES[f,0]
+        proj = np.dot(centroids, normal)
+        # Layer counted from face f, stickers on the opposite face in last layer
+        layers = np.clip(np.floor((1 - proj)/cubie_width + 1e-6), 0, N-1)
+        for layer in range(N):
+            turned = centroids.copy()
+            rows = layers == layer
+            turned[rows] = np.outer(proj[rows], normal) + np.cross(centroids[rows], normal)
+            end = sticker_slots(turned, N)
+            # Sticker that was at start[i] is now at end[i]
+            tables[f, layer, 0, end] = start
+            tables[f, layer, 1] = np.argsort(tables[f, layer, 0])
+    tables.setflags(write=False)
+    return tables
+
+
+@functools.lru_cache(maxsize=None)
+def rotation_tables(N):
+    """
+    The 24 rotations of the whole cube, as (slots, faces): slots[g] is the
+    sticker permutation, sticker in slot i moves to slot slots[g, i], and
+    faces[g, f] the face that face f moves to.
+
+    Rotating a state and relabeling colors by faces, so the centers keep
+    their colors, gives a state at the same distance from solved, as the
+    move set is mapped onto itself.
+    """
+    rotations = []
+    for axes in itertools.permutations(range(3)):
+        for signs in itertools.product([1, -1], repeat=3):
+            R = np.zeros((3, 3))
+            R[range(3), axes] = signs
+            if np.linalg.det(R) > 0:
+                rotations.append(R)
+    centroids = sticker_centroids(N)
+    normals = FACE_AXES[:,0]
+    slots = np.array([sticker_slots(np.dot(centroids, R.T), N) for R in rotations])
+    faces = np.array([np.argmax(np.dot(np.dot(normals, R.T), normals.T), axis=1) for R in rotations])
+    slots.setflags(write=False)
+    faces.setflags(write=False)
+    return slots, faces.astype(np.uint8)
+
+
+def update_cube_state(cube_state,face,dir,layer=0):
+    """
+    Turns face (or given layer counted from face) of cube_state in place,
+    clockwise if dir is 1, counter clockwise if dir is -1.
+    """
+    N = cube_state.shape[1]
+    perm = move_tables(N)[FACES.index(face), layer, 0 if dir == 1 else 1]
+    flat = cube_state.reshape(-1)
+    flat[:] = flat[perm]
+
+
+def apply_move(cube_state,move):
+    """
+    Applies move in solver notation, upper case is clockwise and lower case is
+    counter clockwise.
+    """
+    update_cube_state(cube_state, move.upper(), 1 if move.isupper() else -1)
+
+
+def is_solved(cube_state):
+    """
+    Returns boolean if cube is solved or not.
+
+    """
+    return bool(np.all(cube_state == cube_state[:,:1,:1]))
+
+
+# Move codes for compact storage of move sequences, outer layer turns in
+# FACES order, clockwise turns first. PAD_MOVE pads move arrays of different
+# length and leaves the state unchanged.
+MOVES = FACES + [f.lower() for f in FACES]
+MOVE_CODES = {m: i for i, m in enumerate(MOVES)}
+PAD_MOVE = len(MOVES)
+# Moves the GUI shuffles with and gives the solvers, scrambles are their
+# inverses
+POSSIBLE_MOVES = ['R','D','U','L','B','F']
+
+
+def random_scramble(rng, depth, possible_moves=POSSIBLE_MOVES):
+    """Random backwards turns from a random.Random, same as the GUI shuffle."""
+    return ''.join(move.lower() for move in rng.choices(possible_moves, k=depth))
+
+
+def scrambled_state(scramble, N=3):
+    """Solved NxNxN cube state with the moves of scramble applied."""
+    cube_state = solved_cube_state(N)
+    for move in scramble:
+        apply_move(cube_state, move)
+    return cube_state
+
+
+def encode_moves(moves):
+    """Move characters to uint8 codes."""
+    return np.array([MOVE_CODES[m] for m in moves], dtype=np.uint8)
+
+
+def decode_moves(codes):
+    """uint8 codes back to list of move characters."""
+    return [MOVES[c] for c in codes]
+
+
+@functools.lru_cache(maxsize=None)
+def move_code_tables(N):
+    """
+    Sticker permutation of every move code, shape (len(MOVES)+1, 6*N*N),
+    the last row (PAD_MOVE) is the identity.
+    """
+    if table_name(move_code_tables, N) in _shared_tables:
+        return _shared_tables[table_name(move_code_tables, N)]
+    tables = move_tables(N)
+    faces = [FACES.index(m.upper()) for m in MOVES]
+    dirs = [0 if m.isupper() else 1 for m in MOVES]
+    code_tables = np.concatenate([tables[faces, 0, dirs], np.arange(6*N*N)[None]])
+    code_tables.setflags(write=False)
+    return code_tables
+
+
+def apply_moves_batch(cube_states, codes):
+    """
+    Applies a different move sequence to each of a batch of cube states at
+    once. cube_states has shape (B, 6, N, N), codes has shape (B, L) of move
+    codes padded with PAD_MOVE. Step k gathers every state through the
+    permutation of its k-th move in one call. Returns new states.
+    """
+    B, N = len(cube_states), cube_states.shape[-1]
+    code_tables = move_code_tables(N)
+    flat = cube_states.reshape(B, -1)
+    rows = np.arange(B)[:,None]
+    for k in range(codes.shape[1]):
+        flat = flat[rows, code_tables[codes[:,k]]]
+    return flat.reshape(cube_states.shape)
+
+
+def is_solved_batch(cube_states):
+    """Boolean array, which of a batch of cube states are solved."""
+    return np.all(cube_states == cube_states[:,:,:1,:1], axis=(1,2,3))
+
+
+def pad_moves(move_sequences):
+    """Move strings or lists to a (B, L) uint8 code array padded with PAD_MOVE."""
+    length = max([len(moves) for moves in move_sequences] + [0])
+    codes = np.full((len(move_sequences), length), PAD_MOVE, dtype=np.uint8)
+    for i, moves in enumerate(move_sequences):
+        codes[i, :len(moves)] = [MOVE_CODES[m] for m in moves]
+    return codes
+
+
+# Packed states store one sticker color per 4 bits, 16 stickers per uint64
+STICKERS_PER_WORD = 16
+
+
+def packed_words(N):
+    """Number of uint64 words of a packed NxN cube state."""
+    return -(-6*N*N // STICKERS_PER_WORD)
+
+
+def pack_states(cube_states):
+    """
+    Packs a batch of cube states, shape (B, 6, N, N) or (B, 6*N*N), into a
+    (B, packed_words(N)) uint64 array, sticker i in bits 4*(i%16) of word
+    i//16.
+    """
+    B = len(cube_states)
+    flat = cube_states.reshape(B, -1)
+    W = -(-flat.shape[1] // STICKERS_PER_WORD)
+    padded = np.zeros((B, W*STICKERS_PER_WORD), dtype=np.uint8)
+    padded[:, :flat.shape[1]] = flat
+    # Two stickers per byte, eight little endian bytes per word
+    nibbles = padded[:, 0::2] | (padded[:, 1::2] << 4)
+    return nibbles.view('<u8').astype(np.uint64)
+
+
+def unpack_states(packed, N):
+    """Inverse of pack_states, (B, 6*N*N) uint8 array."""
+    shifts = np.arange(0, 64, 4, dtype=np.uint64)
+    stickers = (packed[:, :, None] >> shifts) & np.uint64(15)
+    return stickers.reshape(len(packed), packed.shape[1]*STICKERS_PER_WORD)[:, :6*N*N].astype(np.uint8)
+
+
+def hash_packed(packed):
+    """64 bit hash key of every row of a packed state array."""
+    key = np.zeros(len(packed), dtype=np.uint64)
+    for w in range(packed.shape[1]):
+        key = (key ^ packed[:, w]) * np.uint64(0x9E3779B97F4A7C15)
+        key ^= key >> np.uint64(29)
+    return key
+
+
+def net_moves(moves):
+    """
+    Moves left after cancelling every move that is directly followed by its
+    inverse. For the actions of a tree search this is the path from the start
+    to where the search ended.
+    """
+    net = []
+    for move in moves:
+        if len(net) > 0 and move.swapcase() == net[-1]:
+            net.pop()
+        else:
+            net.append(move)
+    return net
@@ -0,0 +1,425 @@
+
+import functools
+import numpy as np
+from matplotlib.collections import LineCollection
+
+
+
+# Node colors, same meaning as the original graphviz tree
+UNVISITED_COLOR = (1.0, 1.0, 1.0, 1.0)
+VISITED_COLOR = (0.5, 0.5, 0.5, 1.0)
+CURRENT_COLOR = (1.0, 1.0, 0.0, 1.0)
+SOLVED_COLOR = (0.0, 0.5, 0.0, 1.0)
+FULLY_VISITED_COLOR = (0.25, 0.25, 0.25, 1.0)
+
+# Above this many nodes labels are unreadable, so only draw markers
+MAX_LABELED_NODES = 50
+
+# Past this depth the full tree is unreadable, so use the level of detail view
+FULL_TREE_MAX_DEPTH = 3
+
+
+def level_offset(level, branching):
+    """
+    Index of the first node of a level when the full tree is numbered in
+    breadth first order, i.e. 1 + b + b^2 + ... + b^(level-1).
+    """
+    if branching == 1:
+        return level
+    return (branching**level - 1) // (branching - 1)
+
+
+@functools.lru_cache(maxsize=None)
+def full_tree_layout(depth, branching):
+    """
+    Returns x, y positions and parent index of every node of the full tree of
+    given depth and branching factor, in breadth first order.
+
+    Leaves are evenly spaced and every parent sits above the middle of its
+    children, so the layout has a closed form and is computed once per depth.
+    """
+    xs, ys, parents = [], [], []
+    for level in range(depth+1):
+        idx = np.arange(branching**level)
+        width = branching**(depth-level)
+        xs.append((idx + 0.5) * width - 0.5)
+        ys.append(np.full(idx.size, -float(level)))
+        if level == 0:
+            parents.append(np.array([-1]))
+        else:
+            parents.append(level_offset(level-1, branching) + idx // branching)
+    x = np.concatenate(xs)
+    y = np.concatenate(ys)
+    parent = np.concatenate(parents)
+    # Arrays are shared between views, so make sure no one edits them
+    for arr in (x, y, parent):
+        arr.setflags(write=False)
+    return x, y, parent
+
+
+
+class TreeView():
+
+    """
+    Draws the full state tree of the solvers once, and then only redraws the
+    nodes that change color on each move.
+
+    Nodes are named as in the original tree, by the string of moves needed to
+    reach them from the start node. The whole tree (edges, labels and a
+    scatter of all nodes) is only drawn on a full figure draw, after that
+    changed nodes are drawn on top of the canvas with a small scatter and
+    blitted.
+
+    """
+
+    def __init__(self, ax, depth, possible_moves):
+        self.ax = ax
+        self.depth = depth
+        self.possible_moves = possible_moves
+        self.move_index = {m: i for i, m in enumerate(possible_moves)}
+        self.branching = len(possible_moves)
+
+        # Layout, cached per depth
+        self.x, self.y, parent = full_tree_layout(self.depth, self.branching)
+        self.n_nodes = self.x.size
+
+        # Node colors, updated in place
+        self.colors = np.tile(UNVISITED_COLOR, (self.n_nodes, 1))
+        self.current = None
+        self.changed = []
+
+        # Draw tree
+        self.ax.clear()
+        self.ax.axis('off')
+        child = np.arange(1, self.n_nodes)
+        segments = np.stack([np.stack([self.x[parent[child]], self.y[parent[child]]], axis=1),
+                             np.stack([self.x[child], self.y[child]], axis=1)], axis=1)
+        self.ax.add_collection(LineCollection(segments, colors='black',
+                                              linewidths=0.5, zorder=1))
+        if self.n_nodes <= MAX_LABELED_NODES:
+            for i, name in enumerate(self._node_names()):
+                # Leaves are packed tightly, so write their labels downwards
+                if -self.y[i] == self.depth and self.depth > 1:
+                    self.ax.annotate(name, (self.x[i], self.y[i]), xytext=(0, -6),
+                                     textcoords='offset points', ha='center',
+                                     va='top', rotation=90, fontsize=7)
+                else:
+                    self.ax.annotate(name, (self.x[i], self.y[i]), xytext=(0, 6),
+                                     textcoords='offset points', ha='center',
+                                     va='bottom', fontsize=7)
+        marker_size = max(2., 200. / np.sqrt(self.n_nodes))
+        scatter_kwargs = dict(s=marker_size, edgecolors='black',
+                              linewidths=0.3, zorder=2)
+        self.scatter = self.ax.scatter(self.x, self.y, c=self.colors, **scatter_kwargs)
+        # Only used for drawing changed nodes over the last full draw
+        self.changed_scatter = self.ax.scatter([], [], animated=True, **scatter_kwargs)
+        self.ax.set_xlim(self.x.min() - 1, self.x.max() + 1)
+        self.ax.set_ylim(-self.depth - 0.5, 0.5)
+        self.needs_full_draw = True
+
+        # A full draw already contains every change
+        canvas = self.ax.figure.canvas
+        self._draw_cid = canvas.mpl_connect('draw_event', self._on_draw)
+
+    def _node_names(self):
+        """Names of all nodes in breadth first order, first is Start."""
+        names = ["Start"]
+        level = [""]
+        for _ in range(self.depth):
+            level = [n + m for n in level for m in self.possible_moves]
+            names.extend(level)
+        return names
+
+    def node_index(self, node):
+        """
+        Returns index of node in layout, or None if the node is not in the
+        tree (too deep or uses moves that are not in possible_moves).
+        """
+        if node is None or len(node) > self.depth:
+            return None
+        j = 0
+        for move in node:
+            if move not in self.move_index:
+                return None
+            j = j*self.branching + self.move_index[move]
+        return level_offset(len(node), self.branching) + j
+
+    def _set_color(self, idx, color):
+        self.colors[idx] = color
+        self.changed.append(idx)
+
+    def update(self, node, solved=False, redraw=True):
+        """
+        Marks node as the current node (or solved node), and the previous
+        current node as visited, then redraws the changed nodes only. Pass
+        redraw as False to batch several updates into one redraw.
+        """
+        idx = self.node_index(node)
+        if self.current is not None:
+            self._set_color(self.current, VISITED_COLOR)
+        self.current = idx
+        if idx is not None:
+            self._set_color(idx, SOLVED_COLOR if solved else CURRENT_COLOR)
+        if redraw:
+            self.redraw()
+
+    def redraw(self):
+        canvas = self.ax.figure.canvas
+        if self.needs_full_draw:
+            self.scatter.set_facecolors(self.colors)
+            canvas.draw()
+        elif len(self.changed) > 0:
+            changed = np.array(self.changed)
+            self.changed_scatter.set_offsets(np.stack([self.x[changed], self.y[changed]], axis=1))
+            self.changed_scatter.set_facecolors(self.colors[changed])
+            self.ax.draw_artist(self.changed_scatter)
+            canvas.blit(self.ax.bbox)
+            # Keep full scatter in sync for the next full draw
+            self.scatter.set_facecolors(self.colors)
+        self.changed = []
+        canvas.flush_events()
+
+    def close(self):
+        self.ax.figure.canvas.mpl_disconnect(self._draw_cid)
+
+    def _on_draw(self, event):
+        self.needs_full_draw = False
+
+
+
+class LevelOfDetailTreeView():
+
+    """
+    State tree for deep searches, where the full tree has too many nodes to
+    draw.
+
+    Only visited nodes are stored, so memory grows with the explored nodes.
+    The start node, the nodes on the current path, and nodes clicked by the
+    user are open and show their visited children. Every other visited node is
+    collapsed and labeled with the number of visited nodes in its subtree, and
+    all unexplored children of an open node are collapsed into a single
+    aggregate node labeled with the number of nodes below them. Clicking a
+    collapsed node (or aggregate) expands it, clicking it again collapses it.
+
+    Colors are as in TreeView, with fully visited collapsed subtrees darker.
+
+    """
+
+    def __init__(self, ax, depth, possible_moves):
+        self.ax = ax
+        self.depth = depth
+        self.possible_moves = possible_moves
+        self.move_index = {m: i for i, m in enumerate(possible_moves)}
+        self.branching = len(possible_moves)
+
+        # Explored part of tree only
+        self.visited_count = {}
+        self.children = {}
+        self.current = None
+        self.solved = None
+
+        # Nodes opened by clicking
+        self.expanded = set()
+        self.expanded_unexplored = set()
+
+        # Currently drawn nodes
+        self.keys = []
+        self.labels = []
+        self.colors = np.zeros((0, 4))
+        self.x = np.zeros(0)
+        self.y = np.zeros(0)
+        self.needs_full_draw = True
+
+        canvas = self.ax.figure.canvas
+        self._cids = [canvas.mpl_connect('draw_event', self._on_draw),
+                      canvas.mpl_connect('pick_event', self._on_pick)]
+
+    def subtree_size(self, level):
+        """Number of nodes in a full subtree rooted at given level."""
+        return level_offset(self.depth - level + 1, self.branching)
+
+    def _in_tree(self, node):
+        return len(node) <= self.depth and all(m in self.move_index for m in node)
+
+    def _visit(self, node):
+        """Add node, and any missing parents, to the explored tree."""
+        for k in range(len(node)+1):
+            prefix = node[:k]
+            if prefix in self.visited_count:
+                continue
+            self.visited_count[prefix] = 0
+            if k > 0:
+                self.children.setdefault(prefix[:-1], []).append(prefix)
+            for j in range(k+1):
+                self.visited_count[prefix[:j]] += 1
+
+    def _is_open(self, node):
+        if len(node) >= self.depth:
+            return False
+        if node in self.expanded:
+            return True
+        for path in (self.current, self.solved):
+            if path is not None and path.startswith(node):
+                return True
+        return False
+
+    def _node_color(self, node, is_open):
+        if node == self.solved:
+            return SOLVED_COLOR
+        if node == self.current:
+            return CURRENT_COLOR
+        if node not in self.visited_count:
+            return UNVISITED_COLOR
+        if not is_open and self.visited_count[node] == self.subtree_size(len(node)):
+            return FULLY_VISITED_COLOR
+        return VISITED_COLOR
+
+    def _build_visible(self):
+        """
+        Returns keys, labels, colors, levels and parent index of the nodes to
+        draw, in depth first order. Key is node name, or (node, '+') for the
+        aggregate of unexplored children of node.
+        """
+        keys, labels, colors, levels, parents = [], [], [], [], []
+
+        def add(key, label, color, level, parent):
+            keys.append(key)
+            labels.append(label)
+            colors.append(color)
+            levels.append(level)
+            parents.append(parent)
+            return len(keys) - 1
+
+        def add_node(node, parent):
+            is_open = self._is_open(node)
+            if node == "":
+                label = "Start"
+            else:
+                label = node[-1]
+            count = self.visited_count.get(node, 0)
+            if not is_open and count > 1:
+                label += "\n(%d)" % count
+            idx = add(node, label, self._node_color(node, is_open), len(node), parent)
+            if not is_open:
+                return
+            visited = sorted(self.children.get(node, []), key=lambda c: self.move_index[c[-1]])
+            for child in visited:
+                add_node(child, idx)
+            unexplored = [node+m for m in self.possible_moves if node+m not in self.visited_count]
+            if len(unexplored) == 0:
+                return
+            if node in self.expanded_unexplored:
+                for child in unexplored:
+                    add(child, child[-1], UNVISITED_COLOR, len(child), idx)
+            else:
+                total = len(unexplored) * self.subtree_size(len(node)+1)
+                add((node, '+'), "+%d" % total, UNVISITED_COLOR, len(node)+1, idx)
+
+        add_node("", -1)
+        return keys, labels, np.array(colors), np.array(levels), np.array(parents)
+
+    def _layout(self, parents):
+        """Leaves spaced evenly in depth first order, parents centred above."""
+        n = parents.size
+        children = [[] for _ in range(n)]
+        for i in range(1, n):
+            children[parents[i]].append(i)
+        x = np.zeros(n)
+        next_leaf = 0
+        for i in range(n):
+            if len(children[i]) == 0:
+                x[i] = next_leaf
+                next_leaf += 1
+        # Nodes are in depth first order, so children always come after parent
+        for i in range(n-1, -1, -1):
+            if len(children[i]) > 0:
+                x[i] = 0.5 * (x[children[i][0]] + x[children[i][-1]])
+        return x
+
+    def update(self, node, solved=False, redraw=True):
+        """
+        Marks node as the current node (or solved node), then redraws. Only
+        changed nodes are redrawn if the visible tree keeps its shape. Pass
+        redraw as False to batch several updates into one redraw.
+        """
+        if node is not None and self._in_tree(node):
+            self._visit(node)
+            if solved:
+                self.solved = node
+                self.current = None
+            else:
+                self.current = node
+        else:
+            self.current = None
+        if redraw:
+            self.redraw()
+
+    def redraw(self):
+        keys, labels, colors, levels, parents = self._build_visible()
+        canvas = self.ax.figure.canvas
+        if self.needs_full_draw or keys != self.keys or labels != self.labels:
+            self.keys, self.labels, self.colors = keys, labels, colors
+            self.x = self._layout(parents)
+            self.y = -levels.astype(float)
+            self._draw_tree(parents)
+            canvas.draw()
+        else:
+            changed = np.nonzero(np.any(colors != self.colors, axis=1))[0]
+            self.colors = colors
+            if changed.size > 0:
+                self.changed_scatter.set_offsets(np.stack([self.x[changed], self.y[changed]], axis=1))
+                self.changed_scatter.set_facecolors(colors[changed])
+                self.ax.draw_artist(self.changed_scatter)
+                canvas.blit(self.ax.bbox)
+                self.scatter.set_facecolors(colors)
+        canvas.flush_events()
+
+    def _draw_tree(self, parents):
+        self.ax.clear()
+        self.ax.axis('off')
+        child = np.arange(1, parents.size)
+        segments = np.stack([np.stack([self.x[parents[child]], self.y[parents[child]]], axis=1),
+                             np.stack([self.x[child], self.y[child]], axis=1)], axis=1)
+        self.ax.add_collection(LineCollection(segments, colors='black',
+                                              linewidths=0.5, zorder=1))
+        for i, label in enumerate(self.labels):
+            self.ax.annotate(label, (self.x[i], self.y[i]), xytext=(0, 6),
+                             textcoords='offset points', ha='center',
+                             va='bottom', fontsize=7)
+        scatter_kwargs = dict(s=40, edgecolors='black', linewidths=0.3, zorder=2)
+        self.scatter = self.ax.scatter(self.x, self.y, c=self.colors, picker=True,
+                                       **scatter_kwargs)
+        self.changed_scatter = self.ax.scatter([], [], animated=True, **scatter_kwargs)
+        self.ax.set_xlim(self.x.min() - 1, self.x.max() + 1)
+        self.ax.set_ylim(self.y.min() - 0.5, 0.5)
+
+    def close(self):
+        canvas = self.ax.figure.canvas
+        for cid in self._cids:
+            canvas.mpl_disconnect(cid)
+
+    def _on_draw(self, event):
+        self.needs_full_draw = False
+
+    def _on_pick(self, event):
+        """Toggle expansion of clicked node."""
+        if event.artist is not self.scatter or len(event.ind) == 0:
+            return
+        key = self.keys[event.ind[0]]
+        if isinstance(key, tuple):
+            self.expanded_unexplored.symmetric_difference_update([key[0]])
+        elif key in self.expanded:
+            self.expanded.remove(key)
+        elif key in self.children:
+            self.expanded.add(key)
+        self.redraw()
+
+
+
+def make_tree_view(ax, depth, possible_moves):
+    """
+    Full tree while it is still readable, level of detail tree past that.
+    """
+    if depth <= FULL_TREE_MAX_DEPTH:
+        return TreeView(ax, depth, possible_moves)
+    return LevelOfDetailTreeView(ax, depth, possible_moves)
@@ -0,0 +1,237 @@
+
+"""
+Learned heuristic, a small multilayer perceptron in NumPy that estimates
+the number of moves to solve a cube state.
+
+Trained by approximate value iteration, as in DeepCubeA: states are made
+by scrambling the solved cube with random moves in the batch engine, and
+the target of a state is one more than the smallest estimate of its
+children (0 for the solved state), from a copy of the network updated
+every few steps. Solvers use it through evaluate(states), one call for a
+whole batch, e.g. BestFirstSearch(..., value_network=network).
+
+    python value_network.py --out value_network.npz
+
+trains a network, saves it and prints training and inference throughput
+and the nodes BatchBestFS expands with it and with its hand written
+heuristic. --load uses a saved network instead of training.
+"""
+import time
+import numpy as np
+
+import state_engine
+
+
+HIDDEN = (256, 256)
+# Longest scramble of the training states
+MAX_SCRAMBLE = 10
+# Rows evaluated at once, bounds the memory of the one hot inputs
+EVAL_CHUNK = 8192
+
+
+
+def one_hot(cube_states):
+    """(B, 6*N*N) colors to (B, 6*N*N*6) float32 inputs."""
+    return np.eye(6, dtype=np.float32)[cube_states].reshape(len(cube_states), -1)
+
+
+class ValueNetwork():
+
+    """
+    MLP with ReLU hidden layers and one linear output, the estimated moves
+    to solve each state for the given moves (state_engine.MOVES letters).
+    """
+
+    def __init__(self, N=3, moves='RDULBF', hidden=HIDDEN, seed=0):
+        self.N = N
+        self.moves = ''.join(moves)
+        sizes = [6*N*N*6] + list(hidden) + [1]
+        rng = np.random.default_rng(seed)
+        self.weights = [(rng.standard_normal((n_in, n_out)) * np.sqrt(2. / n_in)).astype(np.float32)
+                        for n_in, n_out in zip(sizes[:-1], sizes[1:])]
+        self.biases = [np.zeros(n_out, dtype=np.float32) for n_out in sizes[1:]]
+
+    @property
+    def parameters(self):
+        return self.weights + self.biases
+
+    def forward(self, inputs):
+        """Output and the activations of every layer, for backward."""
+        activations = [inputs]
+        x = inputs
+        for i, (W, b) in enumerate(zip(self.weights, self.biases)):
+            x = x @ W + b
+            if i < len(self.weights) - 1:
+                x = np.maximum(x, 0)
+            activations.append(x)
+        return x[:, 0], activations
+
+    def backward(self, activations, grad_output):
+        """Gradients of all parameters, in parameters order."""
+        grad = grad_output[:, None].astype(np.float32)
+        grad_weights, grad_biases = [], []
+        for i in reversed(range(len(self.weights))):
+            grad_weights.append(activations[i].T @ grad)
+            grad_biases.append(grad.sum(axis=0))
+            if i > 0:
+                grad = (grad @ self.weights[i].T) * (activations[i] > 0)
+        return grad_weights[::-1] + grad_biases[::-1]
+
+    def check(self, N=None, moves=None):
+        """
+        Raises ValueError if the network was trained for another cube size
+        or other moves than these (either None to not check it).
+        """
+        if N is not None and N != self.N:
+            raise ValueError('value network is for %dx%dx%d cubes, not %dx%dx%d' % (self.N, self.N, self.N, N, N, N))
+        if moves is not None and sorted(''.join(moves)) != sorted(self.moves):
+            raise ValueError('value network is for moves %s, not %s' % (self.moves, ''.join(moves)))
+
+    def evaluate(self, cube_states):
+        """
+        Estimated moves to solve every state of a (B, 6*N*N) or (B, 6, N, N)
+        array, 0 for solved states.
+        """
+        flat = cube_states.reshape(len(cube_states), -1)
+        if flat.shape[1] != 6*self.N*self.N:
+            self.check(N=int(round(np.sqrt(flat.shape[1] // 6))))
+        values = np.empty(len(flat), dtype=np.float32)
+        for i in range(0, len(flat), EVAL_CHUNK):
+            values[i:i+EVAL_CHUNK] = self.forward(one_hot(flat[i:i+EVAL_CHUNK]))[0]
+        values = np.maximum(values, 0)
+        solved = state_engine.is_solved_batch(flat.reshape(len(flat), 6, self.N, self.N))
+        values[solved] = 0
+        return values
+
+    def copy(self):
+        network = ValueNetwork.__new__(ValueNetwork)
+        network.N, network.moves = self.N, self.moves
+        network.weights = [W.copy() for W in self.weights]
+        network.biases = [b.copy() for b in self.biases]
+        return network
+
+    def save(self, path):
+        arrays = {'W%d' % i: W for i, W in enumerate(self.weights)}
+        arrays.update({'b%d' % i: b for i, b in enumerate(self.biases)})
+        np.savez_compressed(path, N=self.N, moves=self.moves, **arrays)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            network = cls.__new__(cls)
+            network.N, network.moves = int(data['N']), str(data['moves'])
+            n_layers = len([name for name in data.files if name.startswith('W')])
+            network.weights = [data['W%d' % i] for i in range(n_layers)]
+            network.biases = [data['b%d' % i] for i in range(n_layers)]
+        return network
+
+
+
+def scrambled_states(rng, batch_size, N, moves, max_scramble=MAX_SCRAMBLE):
+    """
+    batch_size states scrambled with 0 to max_scramble random inverses of
+    moves, so moves can solve them, applied in one batch engine call.
+    """
+    inverse = state_engine.encode_moves(moves.swapcase())
+    lengths = rng.integers(0, max_scramble + 1, size=batch_size)
+    codes = inverse[rng.integers(len(inverse), size=(batch_size, max_scramble))]
+    codes[np.arange(max_scramble)[None, :] >= lengths[:, None]] = state_engine.PAD_MOVE
+    solved = np.broadcast_to(state_engine.solved_cube_state(N), (batch_size, 6, N, N))
+    return state_engine.apply_moves_batch(solved, codes).reshape(batch_size, -1)
+
+
+def train(network, iterations=1000, batch_size=1000, learning_rate=1e-3, target_update=50,
+          max_scramble=MAX_SCRAMBLE, seed=0, log_every=100):
+    """
+    Approximate value iteration with Adam. Yields (iteration, loss, states
+    per second) every log_every iterations.
+    """
+    rng = np.random.default_rng(seed)
+    tables = state_engine.move_code_tables(network.N)[state_engine.encode_moves(network.moves)]
+    target = network.copy()
+    moments = [np.zeros_like(p) for p in network.parameters]
+    squares = [np.zeros_like(p) for p in network.parameters]
+    beta1, beta2, eps = 0.9, 0.999, 1e-8
+    start, losses = time.perf_counter(), []
+    for it in range(1, iterations + 1):
+        # 1. Targets from the children of every state, by the target network
+        states = scrambled_states(rng, batch_size, network.N, network.moves, max_scramble)
+        children = states[:, tables].reshape(-1, states.shape[1])
+        targets = 1 + target.evaluate(children).reshape(batch_size, len(tables)).min(axis=1)
+        targets[state_engine.is_solved_batch(states.reshape(batch_size, 6, network.N, network.N))] = 0
+
+        # 2. One Adam step on the mean squared error
+        output, activations = network.forward(one_hot(states))
+        error = output - targets
+        losses.append(float(np.mean(error**2)))
+        grads = network.backward(activations, 2 * error / batch_size)
+        for p, g, m, v in zip(network.parameters, grads, moments, squares):
+            m *= beta1
+            m += (1 - beta1) * g
+            v *= beta2
+            v += (1 - beta2) * g * g
+            p -= learning_rate * (m / (1 - beta1**it)) / (np.sqrt(v / (1 - beta2**it)) + eps)
+
+        if it % target_update == 0:
+            target = network.copy()
+        if it % log_every == 0:
+            yield it, np.mean(losses), it * batch_size / (time.perf_counter() - start)
+            losses = []
+
+
+if __name__ == '__main__':
+    import random
+    import argparse
+
+    import solvers
+    from main import run_solve
+    from state_engine import POSSIBLE_MOVES, random_scramble, scrambled_state
+
+    parser = argparse.ArgumentParser(description='Train and benchmark the value network')
+    parser.add_argument('--out', '-o', default='value_network.npz', help='where to save the trained network')
+    parser.add_argument('--load', '-l', default=None, help='benchmark this saved network instead of training')
+    parser.add_argument('--iterations', '-i', type=int, default=1000)
+    parser.add_argument('--batch_size', type=int, default=1000)
+    parser.add_argument('--max_scramble', type=int, default=MAX_SCRAMBLE)
+    parser.add_argument('--depth', '-d', type=int, nargs='+', default=[5, 6, 7], help='scramble depths to compare guidance on')
+    parser.add_argument('--count', '-c', type=int, default=20)
+    parser.add_argument('--budget', '-b', type=float, default=5., help='seconds per solve')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    if args.load is not None:
+        network = ValueNetwork.load(args.load)
+    else:
+        network = ValueNetwork(moves=''.join(POSSIBLE_MOVES), seed=args.seed)
+        for it, loss, rate in train(network, args.iterations, args.batch_size,
+                                    max_scramble=args.max_scramble, seed=args.seed):
+            print("iteration %6d  loss %8.4f  %8.0f training states/s" % (it, loss, rate), flush=True)
+        network.save(args.out)
+        print("saved %s" % args.out)
+
+    rng = np.random.default_rng(args.seed)
+    for batch_size in (1, 64, 4096):
+        states = scrambled_states(rng, batch_size, network.N, network.moves)
+        network.evaluate(states)
+        repeat = max(1, 20000 // batch_size)
+        start = time.perf_counter()
+        for _ in range(repeat):
+            network.evaluate(states)
+        print("inference batch %5d  %10.0f states/s" % (batch_size, repeat*batch_size / (time.perf_counter() - start)))
+
+    print("%6s %-14s %8s %10s %10s" % ('depth', 'heuristic', 'solved', 'expanded', 'mean ms'))
+    for depth in args.depth:
+        scramble_rng = random.Random(args.seed)
+        scrambles = [random_scramble(scramble_rng, depth) for _ in range(args.count)]
+        for name, value_network in (('percentage', None), ('network', network)):
+            solver = solvers.BestFirstSearch(depth, POSSIBLE_MOVES.copy(), batch_children=True,
+                                             value_network=value_network)
+            solved, expanded, elapsed = 0, 0, 0.
+            for scramble in scrambles:
+                start = time.perf_counter()
+                _, is_solved = run_solve(solver, scrambled_state(scramble, network.N), args.budget)
+                elapsed += time.perf_counter() - start
+                solved += is_solved
+                expanded += solver.get_stats()['nodes_expanded']
+            print("%6d %-14s %4d/%-3d %10.1f %10.1f" % (depth, name, solved, len(scrambles),
+                  expanded / len(scrambles), 1000*elapsed / len(scrambles)))
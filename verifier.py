@@ -0,0 +1,117 @@
+
+"""
+Bulk solution verifier, checks many (state, solution) pairs at once.
+
+Solutions are (B, L) arrays of move codes padded with state_engine.PAD_MOVE,
+e.g. from state_engine.pad_moves or a scrambles.Corpus. Every row is applied
+to its state with kernels.apply_moves_rows, compiled with Numba if
+installed, otherwise with NumPy, several moves per gather. Rows are done in
+chunks of CHUNK_SIZE so memory stays bounded for millions of pairs.
+
+    python verifier.py --count 1000000
+
+verifies the inverse of a million random scrambles, with some solutions
+broken on purpose, and prints the moves verified per second.
+"""
+import numpy as np
+
+import kernels
+import state_engine
+
+
+# Rows applied per kernel call
+CHUNK_SIZE = 1 << 16
+
+
+
+def mismatches(cube_states):
+    """
+    Stickers to recolor so every face of each of a batch of states has one
+    color (its most common one), 0 for solved states.
+    """
+    B = len(cube_states)
+    if B == 0:
+        return np.zeros(0, dtype=np.intp)
+    faces = cube_states.reshape(B, 6, -1)
+    counts = np.stack([np.count_nonzero(faces == color, axis=2) for color in range(6)], axis=2)
+    return faces.shape[1] * faces.shape[2] - counts.max(axis=2).sum(axis=1)
+
+
+def verify(cube_states, codes, chunk_size=CHUNK_SIZE):
+    """
+    Checks that the move codes of every row of codes (B, L) solve the same
+    row of cube_states (B, 6, N, N) or (B, 6*N*N).
+
+    Returns three arrays of length B: valid (the moves solve the state and
+    are all move codes or padding), length (moves without the padding) and
+    mismatches of the final state (see mismatches, 0 if solved).
+    """
+    B = len(cube_states)
+    flat = cube_states.reshape(B, int(np.prod(cube_states.shape[1:])))
+    N = int(round(np.sqrt(flat.shape[1] // 6)))
+    # Small tables stay in cache, uint8 indices for up to 6x6 cubes
+    tables = state_engine.move_code_tables(N)
+    tables = tables.astype(np.uint8 if tables.shape[1] <= 256 else np.uint16)
+    codes = np.asarray(codes, dtype=np.uint8)
+    valid = np.empty(B, dtype=bool)
+    lengths = np.empty(B, dtype=np.intp)
+    wrong = np.empty(B, dtype=np.intp)
+    final = np.empty((min(B, chunk_size), flat.shape[1]), dtype=np.uint8)
+    for start in range(0, B, chunk_size):
+        rows = slice(start, start + chunk_size)
+        chunk_codes = np.ascontiguousarray(codes[rows])
+        out = final[:len(chunk_codes)]
+        # 1. Final states, codes past PAD_MOVE leave the state unchanged
+        kernels.apply_moves_rows(np.ascontiguousarray(flat[rows]), chunk_codes, tables, out)
+
+        # 2. Solved and well formed, mismatches only counted for unsolved rows
+        solved = state_engine.is_solved_batch(out.reshape(len(out), 6, N, N))
+        chunk_wrong = np.zeros(len(out), dtype=np.intp)
+        chunk_wrong[~solved] = mismatches(out[~solved])
+        wrong[rows] = chunk_wrong
+        lengths[rows] = np.count_nonzero(chunk_codes < state_engine.PAD_MOVE, axis=1)
+        valid[rows] = solved & np.all(chunk_codes <= state_engine.PAD_MOVE, axis=1)
+    return valid, lengths, wrong
+
+
+def verify_moves(cube_states, solutions):
+    """verify for a list of solutions as move strings or lists."""
+    return verify(cube_states, state_engine.pad_moves(solutions))
+
+
+if __name__ == '__main__':
+    import time
+    import argparse
+
+    import scrambles
+
+    parser = argparse.ArgumentParser(description='Time the bulk solution verifier')
+    parser.add_argument('--count', '-c', type=int, default=1000000)
+    parser.add_argument('--depth', '-d', type=int, default=20, help='scramble and solution length')
+    parser.add_argument('--size', '-n', type=int, default=3)
+    parser.add_argument('--broken', type=float, default=0.01, help='fraction of solutions to break')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    # Solutions are the scrambles inverted, some with one move changed
+    inverse = state_engine.encode_moves([move.swapcase() for move in state_engine.MOVES])
+    states, solutions = [], []
+    for cube_states, codes in scrambles.generate(args.seed, args.count, args.depth, args.size):
+        states.append(cube_states.reshape(len(cube_states), -1))
+        solutions.append(inverse[codes[:, ::-1]])
+    states, solutions = np.concatenate(states), np.concatenate(solutions)
+    rng = np.random.default_rng(args.seed)
+    broken = rng.random(args.count) < args.broken
+    solutions[broken, -1] = (solutions[broken, -1] + 1) % state_engine.PAD_MOVE
+
+    print("Moves applied with Numba" if kernels.JIT else
+          "Numba not installed (or CUBE_NO_JIT set), moves applied with NumPy")
+    verify(states[:1000], solutions[:1000])
+    start = time.perf_counter()
+    valid, lengths, wrong = verify(states, solutions)
+    elapsed = time.perf_counter() - start
+    assert np.array_equal(valid, ~broken)
+    print("%d solutions, %d valid, %d moves, mean mismatches of invalid %.1f" % (
+          len(valid), valid.sum(), lengths.sum(), wrong[~valid].mean() if (~valid).any() else 0))
+    print("%.2f s, %.1fM moves/s, %.2fM solutions/s" % (elapsed, lengths.sum() / elapsed / 1e6,
+          len(valid) / elapsed / 1e6))
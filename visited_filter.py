@@ -0,0 +1,111 @@
+
+import numpy as np
+
+import state_engine
+
+
+# Default false positive rate and memory cap of a filter
+FP_RATE = 0.01
+MAX_BYTES = 64 << 20
+
+_MIX = np.uint64(0xBF58476D1CE4E5B9)
+
+
+def mix(keys):
+    """Scrambles bits of uint64 keys, so nearby keys give unrelated hashes."""
+    keys = keys ^ (keys >> np.uint64(31))
+    keys = keys * _MIX
+    return keys ^ (keys >> np.uint64(29))
+
+
+def state_keys(cube_states, depths):
+    """
+    uint64 key of every (cube state, depth) pair, cube_states has shape
+    (B, 6, N, N), depths shape (B,), or broadcast against it, e.g. keys of
+    one state at several depths.
+    """
+    keys = state_engine.hash_packed(state_engine.pack_states(cube_states))
+    return mix(keys + np.asarray(depths, dtype=np.uint64) * np.uint64(0x9E3779B97F4A7C15))
+
+
+
+class BloomFilter():
+
+    """
+    Approximate set of uint64 keys in a NumPy bit array.
+
+    Sized for capacity keys at fp_rate false positives, but never more than
+    max_bytes, the rate is then higher. Every key sets n_hashes bits, found
+    by double hashing. contains never misses a key that was added, but may
+    say a key was added when it was not, with about estimated_fp_rate()
+    probability.
+
+    add and contains take arrays of keys, so batches are one vectorized call.
+
+    """
+
+    def __init__(self, capacity, fp_rate=FP_RATE, max_bytes=MAX_BYTES):
+        capacity = max(int(capacity), 1)
+        # Optimal number of bits and hashes for capacity and fp_rate, bits
+        # rounded up to a power of two (at least one word) so indices are masks
+        n_bits = -capacity * np.log(fp_rate) / np.log(2)**2
+        n_bits = max(64, 1 << int(np.ceil(np.log2(n_bits))))
+        while n_bits // 8 > max_bytes and n_bits > 64:
+            n_bits //= 2
+        self.n_bits = n_bits
+        self.n_hashes = max(1, int(round(n_bits / capacity * np.log(2))))
+        self.bits = np.zeros(n_bits // 64, dtype=np.uint64)
+        self.n_added = 0
+
+    @property
+    def nbytes(self):
+        return self.bits.nbytes
+
+    def clear(self):
+        self.bits[:] = 0
+        self.n_added = 0
+
+    def get_checkpoint(self):
+        """Arrays of the filter, for solver checkpoints."""
+        return dict(filter_bits=self.bits, filter_hashes=self.n_hashes, filter_added=self.n_added)
+
+    @classmethod
+    def from_checkpoint(cls, arrays):
+        """Filter with the contents of get_checkpoint arrays."""
+        bloom = cls.__new__(cls)
+        bloom.bits = np.array(arrays['filter_bits'], dtype=np.uint64)
+        bloom.n_bits = len(bloom.bits) * 64
+        bloom.n_hashes = int(arrays['filter_hashes'])
+        bloom.n_added = int(arrays['filter_added'])
+        return bloom
+
+    def _indices(self, keys):
+        """Bit index of every hash of every key, shape (len(keys), n_hashes)."""
+        keys = np.asarray(keys, dtype=np.uint64).reshape(-1)
+        h1 = mix(keys)
+        h2 = mix(h1) | np.uint64(1)
+        i = np.arange(self.n_hashes, dtype=np.uint64)
+        return (h1[:, None] + i * h2[:, None]) & np.uint64(self.n_bits - 1)
+
+    def add(self, keys):
+        indices = self._indices(keys).reshape(-1)
+        np.bitwise_or.at(self.bits, indices >> np.uint64(6), np.uint64(1) << (indices & np.uint64(63)))
+        self.n_added += len(indices) // self.n_hashes
+
+    def contains(self, keys):
+        """Boolean array, which keys were (probably) added."""
+        indices = self._indices(keys)
+        bits = (self.bits[indices >> np.uint64(6)] >> (indices & np.uint64(63))) & np.uint64(1)
+        return np.all(bits == 1, axis=1)
+
+    def estimated_fp_rate(self):
+        """
+        Probability that a key not added is reported as added, from the
+        fraction of bits set, counted in place with NumPy 2. Older NumPy
+        estimates the fraction from the keys added instead.
+        """
+        if hasattr(np, 'bitwise_count'):
+            fill = int(np.bitwise_count(self.bits).sum(dtype=np.int64)) / self.n_bits
+        else:
+            fill = -np.expm1(-self.n_hashes * self.n_added / self.n_bits)
+        return float(fill ** self.n_hashes)